@@ -0,0 +1,14 @@
+# ==========================================
+# ★ ベンチマーク・負荷試験 ★
+# ==========================================
+# リポジトリ直下から python -m bench.<名前> で実行する。
+#
+#   python -m bench.synth --seasons 8            # 合成データのDB (bench/_data/m_league.db) を作る
+#   python -m bench.fixtures                     # そのDBから公式サイト風のHTML (bench/_data/site) を作る
+#   python -m bench.micro                        # 各モード・解析関数のマイクロベンチマーク
+#   python -m bench.fake_openai --latency 0.5    # OpenAI 互換の偽サーバー (LLMの待ち時間を再現)
+#   python -m bench.load --url http://127.0.0.1:8000 --concurrency 16
+#
+# 負荷試験のサーバーは、偽サーバーと合成DBを向けて起動する:
+#   OPENAI_API_KEY=dummy OPENAI_BASE_URL=http://127.0.0.1:18080/v1 \
+#   MLEAGUE_DB=bench/_data/m_league.db uvicorn main:app
@@ -0,0 +1,23 @@
+import math
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_data")
+DEFAULT_DB = os.path.join(DATA_DIR, "m_league.db")
+DEFAULT_SITE = os.path.join(DATA_DIR, "site")
+
+# 最近傍順位法のパーセンタイル (samples は秒)
+def percentile(samples, p):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+def summary_line(name, samples):
+    if not samples:
+        return f"{name:<28} (計測なし)"
+    mean = sum(samples) / len(samples)
+    return (
+        f"{name:<28} n={len(samples):<5} mean {mean * 1000:8.2f}ms"
+        f"  p50 {percentile(samples, 50) * 1000:8.2f}ms  p99 {percentile(samples, 99) * 1000:8.2f}ms"
+    )
@@ -0,0 +1,108 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# ★ OpenAI 互換の偽サーバー ★
+# ==========================================
+# /v1/chat/completions だけを実装し、プロンプトの内容に応じて決まったSQL・選手名・解説文を返す。
+# --latency で応答までの待ち時間、--token-delay でストリーミング時のトークン間隔を再現する。
+
+GRAPH_SQL = "SELECT date, point, player FROM games WHERE player LIKE '%多井%' ORDER BY date;"
+STATS_SQL = "SELECT player, team, points, avg_rank FROM stats ORDER BY points DESC LIMIT 5"
+NAMES = "多井隆晴, 鈴木優"
+COMMENTARY = "🀄 データを見ると、ここ最近の勢いが数字にはっきり表れていますね！グラフをご覧ください。" * 3
+
+def canned_reply(prompt):
+    if "SQLのみ" in prompt and "ポイント推移" in prompt:
+        return GRAPH_SQL
+    if "SQLのみ" in prompt:
+        return STATS_SQL
+    if "カンマ区切り" in prompt:
+        return NAMES
+    return COMMENTARY
+
+def _usage(prompt, reply):
+    # 日本語はおおよそ1文字1トークンとして概算する
+    return {"prompt_tokens": len(prompt), "completion_tokens": len(reply), "total_tokens": len(prompt) + len(reply)}
+
+def make_handler(latency, token_delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        calls = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+            reply = canned_reply(prompt)
+            Handler.calls += 1
+            time.sleep(latency)
+            if body.get("stream"):
+                self._stream(reply, _usage(prompt, reply))
+            else:
+                self._send_json({
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": _usage(prompt, reply),
+                })
+
+        def _send_json(self, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, reply, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def chunk(delta, finish=None, usage=None):
+                payload = {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": "fake",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+                }
+                if usage is not None:
+                    payload["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            for i in range(0, len(reply), 4):
+                chunk({"content": reply[i:i + 4]})
+                if token_delay:
+                    time.sleep(token_delay)
+            chunk({}, finish="stop")
+            chunk(None, usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+def make_server(port=0, latency=0.0, token_delay=0.0, host="127.0.0.1"):
+    return ThreadingHTTPServer((host, port), make_handler(latency, token_delay))
+
+# ベンチマークのプロセス内で起動する (返り値の base_url を OPENAI_BASE_URL に使う)
+def start_in_thread(latency=0.0, token_delay=0.0):
+    server = make_server(0, latency, token_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI 互換の偽サーバー")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.5, help="応答までの待ち時間 (秒)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="ストリーミングのチャンク間隔 (秒)")
+    args = parser.parse_args()
+    server = make_server(args.port, args.latency, args.token_delay)
+    print(f"🤖 偽OpenAIサーバー: http://127.0.0.1:{args.port}/v1 (latency {args.latency}s)")
+    server.serve_forever()
@@ -0,0 +1,171 @@
+import argparse
+import html
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.common import DEFAULT_DB, DEFAULT_SITE
+
+# ==========================================
+# ★ 公式サイト風のHTML (解析・取得のベンチマーク用) ★
+# ==========================================
+# DBの内容から update_db.py が読む構造 (points / games / stats) のページを書き出す。
+# --serve を付けると、そのままローカルのHTTPサーバーで配信する (MLEAGUE_BASE_URL に指定する)。
+
+STAT_ROWS = {
+    '試合数': 'matches', '総局数': 'total_hands', 'ポイント': 'points', '平着': 'avg_rank',
+    '1位': 'rank_1_count', '2位': 'rank_2_count', '3位': 'rank_3_count', '4位': 'rank_4_count',
+    'トップ率': 'top_rate', '連対率': 'rentai_rate', 'ラス回避率': 'last_avoid_rate', 'ベストスコア': 'best_score',
+    '平均打点': 'avg_score', '副露率': 'furo_rate', 'リーチ率': 'riichi_rate', 'アガリ率': 'agari_rate',
+    '放銃率': 'hoju_rate', '放銃平均打点': 'hoju_avg_score',
+}
+WEEKDAYS = "月火水木金土日"
+
+# ---------------------------------------------------------
+# ページの組み立て (tests/test_update_db.py も同じものを使う)
+# ---------------------------------------------------------
+def _point(value):
+    return f"{'▲' if value < 0 else ''}{abs(value):.1f}pt"
+
+def page(body):
+    return f'<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"></head><body>{body}</body></html>'
+
+# ranking: [(順位, チーム, ポイント), ...]
+def points_html(ranking):
+    rows = "".join(
+        f'<tr><td class="c-ranking-no"><span class="rank-number">{rank}</span></td>'
+        f'<td class="team-name">{html.escape(team)}</td><td class="point">{_point(point)}</td></tr>'
+        for rank, team, point in ranking
+    )
+    return f"<table>{rows}</table>"
+
+# トップページのチームランキング (points から取れないときの予備)
+def top_html(ranking):
+    return "".join(
+        f'<div class="p-ranking__team-item"><span class="p-ranking__rank-number">{rank}</span>'
+        f'<span class="p-ranking__team-name">{html.escape(team)}</span><span class="p-ranking__current-point">{_point(point)}</span></div>'
+        for rank, team, point in ranking
+    )
+
+# days: [(date, [(回戦, [(着順, 選手, ポイント), ...]), ...]), ...]
+def games_html(days):
+    modals = []
+    for d, tables in days:
+        columns = "".join(
+            f'<div class="p-gamesResult__column"><div class="p-gamesResult__number">{game_count}</div>'
+            + "".join(
+                f'<div class="p-gamesResult__rank-item"><div class="p-gamesResult__rank-badge">{rank}</div>'
+                f'<div class="p-gamesResult__name">{html.escape(player)}</div>'
+                f'<div class="p-gamesResult__point">{_point(point)}</div></div>'
+                for rank, player, point in seats
+            )
+            + "</div>"
+            for game_count, seats in tables
+        )
+        label = f"{d.month}/{d.day}({WEEKDAYS[d.weekday()]})"
+        modals.append(f'<div class="c-modal2"><div class="p-gamesResult__date">{label}</div>{columns}</div>')
+    return "".join(modals)
+
+# teams: [(チーム, [選手, ...], [(行の見出し, [選手ごとの値, ...]), ...]), ...]
+def stats_html(teams):
+    sections = []
+    for team, players, rows in teams:
+        head = "<tr><th></th>" + "".join(f"<th>{html.escape(p)}</th>" for p in players) + "</tr>"
+        body = "".join(
+            f"<tr><th>{label}</th>" + "".join(f"<td>{'' if v is None else v}</td>" for v in values) + "</tr>"
+            for label, values in rows
+        )
+        sections.append(
+            f'<section class="p-stats__team"><h2 class="p-stats__teamName">{html.escape(team)}</h2>'
+            f'<table class="p-stats__table">{head}{body}</table></section>'
+        )
+    return "".join(sections)
+
+# ---------------------------------------------------------
+# DBの内容から書き出す
+# ---------------------------------------------------------
+def _write(out, path, body):
+    os.makedirs(os.path.join(out, path), exist_ok=True)
+    with open(os.path.join(out, path, "index.html"), "w", encoding="utf-8") as f:
+        f.write(page(body))
+
+def render_points(conn):
+    return points_html(conn.execute("SELECT rank, team, point FROM team_ranking ORDER BY rank").fetchall())
+
+# games (今シーズン分) を出す。since: この日付以降だけを出す
+def render_games(conn, since=None):
+    days = []
+    dates = [d for (d,) in conn.execute("SELECT DISTINCT date FROM games ORDER BY date") if not since or d >= since]
+    for date_str in dates:
+        tables = conn.execute(
+            "SELECT match_id, game_count FROM games WHERE date = ? GROUP BY match_id ORDER BY game_count, MIN(rowid)",
+            (date_str,),
+        ).fetchall()
+        days.append((date.fromisoformat(date_str), [
+            (game_count, conn.execute("SELECT rank, player, point FROM games WHERE match_id = ? ORDER BY rank", (match_id,)).fetchall())
+            for match_id, game_count in tables
+        ]))
+    return games_html(days)
+
+def render_stats(conn):
+    conn.row_factory = sqlite3.Row
+    teams = []
+    for (team,) in conn.execute("SELECT DISTINCT team FROM stats").fetchall():
+        players = conn.execute("SELECT * FROM stats WHERE team = ?", (team,)).fetchall()
+        teams.append((team, [p["player"] for p in players], [(label, [p[col] for p in players]) for label, col in STAT_ROWS.items()]))
+    conn.row_factory = None
+    return stats_html(teams)
+
+def build(db_name, out, since=None):
+    conn = sqlite3.connect(db_name)
+    _write(out, "", "top")
+    _write(out, "points", render_points(conn))
+    _write(out, "games", render_games(conn, since))
+    _write(out, "stats", render_stats(conn))
+    conn.close()
+    print(f"✅ HTMLフィクスチャ: {out}")
+
+def load(out):
+    pages = {}
+    for name, path in (("points", "points"), ("top", ""), ("games", "games"), ("stats", "stats")):
+        with open(os.path.join(out, path, "index.html"), encoding="utf-8") as f:
+            pages[name] = f.read()
+    return pages
+
+# 受けたリクエストのパスを server.paths に残す
+class QuietHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+# フィクスチャを配信するHTTPサーバーを別スレッドで起動し、(server, base_url) を返す
+def serve_in_thread(out, port=0):
+    handler = partial(QuietHandler, directory=out)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.paths = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DBから公式サイト風のHTMLを作る")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--out", default=DEFAULT_SITE)
+    parser.add_argument("--since", help="試合結果ページに含める最初の日付 (YYYY-MM-DD)")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="作成後にこのポートで配信する")
+    args = parser.parse_args()
+    build(args.db, args.out, args.since)
+    if args.serve:
+        server, base_url = serve_in_thread(args.out, args.serve)
+        print(f"🌐 配信中: {base_url} (Ctrl+C で終了)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
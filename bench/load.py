@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.common import percentile, summary_line
+from bench.micro import BRANCH_QUERIES
+
+# ==========================================
+# ★ 負荷試験 ★
+# ==========================================
+# 起動済みのサーバーへ、各モードの質問を順番に混ぜて同時に投げ続け、
+# スループットとレイテンシ (p50 / p99) を質問の種類ごとに集計する。
+# --stream では /chat/stream を使い、最初のトークンまでの時間も測る。
+
+async def one_request(client, url, query, stream):
+    started = time.perf_counter()
+    first = None
+    if stream:
+        async with client.stream("POST", f"{url}/chat/stream", json={"message": query}) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if first is None and line.startswith("event: token"):
+                    first = time.perf_counter() - started
+                if line.startswith("event: error"):
+                    raise RuntimeError("error event")
+    else:
+        res = await client.post(f"{url}/chat", json={"message": query})
+        res.raise_for_status()
+        if res.json().get("reply", "").startswith(("エラー", "【エラー】")):
+            raise RuntimeError(res.json()["reply"])
+    return time.perf_counter() - started, first
+
+async def run(url, concurrency, total, stream, timeout):
+    queries = itertools.cycle(BRANCH_QUERIES.items())
+    latencies = {}
+    first_tokens = []
+    errors = []
+    remaining = iter(range(total))
+
+    async def worker(client):
+        for _ in remaining:
+            name, query = next(queries)
+            try:
+                elapsed, first = await one_request(client, url, query, stream)
+                latencies.setdefault(name, []).append(elapsed)
+                if first is not None:
+                    first_tokens.append(first)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    everything = [s for samples in latencies.values() for s in samples]
+    print(f"--- 負荷試験 ({url}{'/chat/stream' if stream else '/chat'}, 同時 {concurrency}, {total} リクエスト) ---")
+    print(f"スループット: {len(everything) / wall:.1f} req/s (所要 {wall:.2f}s, エラー {len(errors)} 件)")
+    print(f"レイテンシ: p50 {percentile(everything, 50) * 1000:.1f}ms / p99 {percentile(everything, 99) * 1000:.1f}ms")
+    if first_tokens:
+        print(summary_line("最初のトークンまで", first_tokens))
+    for name, samples in latencies.items():
+        print(summary_line(name, samples))
+    for message in errors[:5]:
+        print(f"⚠️ {message}")
+    return latencies, errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/chat の負荷試験")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="/chat/stream を使う")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url.rstrip("/"), args.concurrency, args.requests, args.stream, args.timeout))
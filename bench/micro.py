@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import fake_openai, fixtures
+from bench.common import DEFAULT_DB, DEFAULT_SITE, summary_line
+
+# ==========================================
+# ★ マイクロベンチマーク ★
+# ==========================================
+# 1. 取得・解析: フィクスチャのHTMLに対する update_db.py の各関数と派生データの集計
+# 2. /chat の各モード: 偽OpenAIサーバー (待ち時間0) を相手に answer_chat を繰り返す (最後に全モードを answer_batch でまとめて)
+#    既定では応答・SQLキャッシュを毎回空にして、キャッシュに頼らない処理時間を測る (--warm で無効化)
+
+# 各モードの代表的な質問
+BRANCH_QUERIES = {
+    "graph (事前集計)": "多井隆晴のポイント推移",
+    "graph (LLM SQL)": "ポイント推移を見せて",
+    "matchup": "多井隆晴と鈴木優の対戦成績",
+    "analyst": "多井と鈴木優どっちが勝つ？予想して",
+    "results": "最新の試合結果",
+    "results (個人)": "個人ランキング",
+    "stat_ranking": "放銃率が低い選手は？",
+    "stat_lookup": "多井の放銃率は？",
+    "sql": "Mリーグのルールは？",
+}
+
+def timeit(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_update(site, repeat):
+    import precompute
+    import update_db
+
+    pages = fixtures.load(site)
+    server, base_url = fixtures.serve_in_thread(site)
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["fetch (4ページ)"] = timeit(
+            lambda: [update_db.fetch(base_url + path, use_cache=False) for path in update_db.PAGES.values()], repeat
+        )
+        results["parse_team_ranking"] = timeit(lambda: update_db.parse_team_ranking(pages["points"], pages["top"]), repeat)
+        results["parse_games"] = timeit(lambda: update_db.parse_games(pages["games"]), repeat)
+        results["parse_stats"] = timeit(lambda: update_db.parse_stats(pages["stats"]), repeat)
+
+        games = update_db.parse_games(pages["games"])
+        rows = [(g["match_id"], g["date"], g["game_count"], g["rank"], g["player"], g["point"]) for g in games]
+        player_team = {s["player"]: s["team"] for s in update_db.parse_stats(pages["stats"])}
+        results["build_head_to_head"] = timeit(lambda: precompute.build_head_to_head(rows), repeat)
+        results["build_point_series"] = timeit(
+            lambda: precompute.build_point_series([(r[1], r[4], r[5]) for r in rows], player_team), repeat
+        )
+    server.shutdown()
+    return results
+
+async def bench_chat(repeat, warm):
+    import intent
+    import main
+
+    results = {}
+    vocab = await main.run_blocking(main.vocab_cache.get)
+    results["intent.classify"] = timeit(
+        lambda: [intent.classify(q, vocab.resolver) for q in BRANCH_QUERIES.values()], repeat
+    )
+    for name, query in BRANCH_QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            if not warm:
+                main.response_cache.clear()
+                main.safe_query.clear()
+                main.sql_cache.clear()
+            started = time.perf_counter()
+            await main.answer_chat(query)
+            samples.append(time.perf_counter() - started)
+        results[f"chat: {name}"] = samples
+    # 全モードの質問を /chat/batch と同じ処理でまとめて答える
+    batch = []
+    for _ in range(repeat):
+        if not warm:
+            main.response_cache.clear()
+            main.safe_query.clear()
+            main.sql_cache.clear()
+        started = time.perf_counter()
+        await main.answer_batch(list(BRANCH_QUERIES.values()))
+        batch.append(time.perf_counter() - started)
+    results[f"chat/batch ({len(BRANCH_QUERIES)}問)"] = batch
+    return results
+
+def run(db_name, site, repeat, warm):
+    server, base_url = fake_openai.start_in_thread(latency=0.0)
+    # main.py は import 時にDBのパスとLLMの接続先を読むので、先に環境変数を設定する
+    os.environ["MLEAGUE_DB"] = os.path.abspath(db_name)
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "bench"
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    results = {}
+    if os.path.exists(os.path.join(site, "games", "index.html")):
+        results.update(bench_update(site, repeat))
+    else:
+        print(f"⚠️ フィクスチャがありません ({site})。python -m bench.fixtures で作成してください")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.update(asyncio.run(bench_chat(repeat, warm)))
+    server.shutdown()
+
+    print(f"--- マイクロベンチマーク (DB: {db_name}, 各 {repeat} 回{', キャッシュあり' if warm else ''}) ---")
+    for name, samples in results.items():
+        print(summary_line(name, samples))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="各モード・解析関数のマイクロベンチマーク")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--site", default=DEFAULT_SITE, help="python -m bench.fixtures で作ったHTML")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warm", action="store_true", help="応答・SQLキャッシュを空にせずに測る")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"DBがありません: {args.db} (python -m bench.synth で作成してください)")
+    run(args.db, args.site, args.repeat, args.warm)
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import precompute
+import update_db
+from bench.common import DEFAULT_DB
+
+# ==========================================
+# ★ 合成データの生成 ★
+# ==========================================
+# 名簿 (チーム・選手) は既存のDBから借り、試合結果を何シーズン分も作って、update_db.py の過去シーズン取り込みと
+# 同じ経路 (最後のシーズンは今シーズン、それより前は *_archive) で書き込む。派生テーブルも同じ関数で作る。
+
+UMA = (50.0, 10.0, -10.0, -30.0)   # 着順ごとのウマ・オカ込みの基準ポイント
+SEASON_START = (10, 1)             # 各シーズンの開幕 (月, 日)
+
+def load_roster(source_db):
+    if source_db and os.path.exists(source_db):
+        rows = sqlite3.connect(source_db).execute("SELECT team, player FROM stats").fetchall()
+        if rows:
+            roster = {}
+            for team, player in rows:
+                roster.setdefault(team, []).append(player)
+            return roster
+    return {f"チーム{t:02d}": [f"選手{t:02d}{p}" for p in "ABCD"] for t in range(1, 11)}
+
+# 返り値: {シーズン: [試合結果の行, ...]}
+def generate_games(roster, seasons, days, rng, first_year):
+    teams = list(roster)
+    by_season = {}
+    for n in range(seasons):
+        day = date(first_year + n, *SEASON_START)
+        games = by_season.setdefault(precompute.season_of(day.isoformat()), [])
+        for _ in range(days):
+            date_str = day.isoformat()
+            for game_num in ("第1回戦", "第2回戦"):
+                players = [rng.choice(roster[t]) for t in rng.sample(teams, 4)]
+                match_id = update_db.make_match_id(date_str, game_num, 0)
+                for rank, player in enumerate(players, 1):
+                    point = round(UMA[rank - 1] + rng.uniform(-15, 15), 1)
+                    games.append({"match_id": match_id, "date": date_str, "game_count": game_num,
+                                  "rank": rank, "player": player, "point": point, "season": precompute.season_of(date_str)})
+            day += timedelta(days=rng.choice((1, 2, 3)))
+    return by_season
+
+def aggregate_stats(roster, games, rng):
+    stats = {}
+    for team, players in roster.items():
+        for player in players:
+            stats[player] = {"team": team, "player": player, "matches": 0, "points": 0.0, "best_score": 0,
+                             "rank_1_count": 0, "rank_2_count": 0, "rank_3_count": 0, "rank_4_count": 0}
+    for g in games:
+        s = stats[g["player"]]
+        s["matches"] += 1
+        s["points"] += g["point"]
+        s[f"rank_{g['rank']}_count"] += 1
+        s["best_score"] = max(s["best_score"], int(30000 + g["point"] * 1000))
+    for s in stats.values():
+        n = s["matches"] or 1
+        s["points"] = round(s["points"], 1)
+        s["avg_rank"] = round(sum(r * s[f"rank_{r}_count"] for r in range(1, 5)) / n, 4)
+        s["top_rate"] = round(s["rank_1_count"] / n, 4)
+        s["rentai_rate"] = round((s["rank_1_count"] + s["rank_2_count"]) / n, 4)
+        s["last_avoid_rate"] = round(1 - s["rank_4_count"] / n, 4)
+        s["total_hands"] = s["matches"] * rng.randint(9, 12)
+        s["avg_score"] = rng.randint(5500, 7500)
+        s["furo_rate"] = round(rng.uniform(0.15, 0.4), 4)
+        s["riichi_rate"] = round(rng.uniform(0.15, 0.3), 4)
+        s["agari_rate"] = round(rng.uniform(0.18, 0.26), 4)
+        s["hoju_rate"] = round(rng.uniform(0.08, 0.14), 4)
+        s["hoju_avg_score"] = rng.randint(4500, 6500)
+    return list(stats.values())
+
+def team_ranking(stats):
+    totals = {}
+    for s in stats:
+        totals[s["team"]] = totals.get(s["team"], 0.0) + s["points"]
+    ordered = sorted(totals.items(), key=lambda kv: -kv[1])
+    return [{"rank": i, "team": team, "point": round(point, 1)} for i, (team, point) in enumerate(ordered, 1)]
+
+def build(out, seasons, days, seed=0, source_db="m_league.db", first_year=2018):
+    rng = random.Random(seed)
+    roster = load_roster(source_db)
+    by_season = generate_games(roster, seasons, days, rng, first_year)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(out + suffix):
+            os.remove(out + suffix)
+    conn = update_db.connect(out)
+    update_db.migrate(conn)
+    with update_db.transaction(conn):
+        # 最後のシーズンを今シーズンにする (それより前は import_season が *_archive へ入れる)
+        update_db.set_meta(conn, "current_season", max(by_season))
+        for season, games in by_season.items():
+            stats = aggregate_stats(roster, games, rng)
+            update_db.import_season(conn, season, games, stats, team_ranking(stats))
+        update_db.rebuild_derived(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    rows = sum(len(games) for games in by_season.values())
+    print(f"✅ 合成データ: {out} (試合 {rows // 4} 卓 / {rows} 行, 選手 {len(stats)} 名, {seasons} シーズン)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成データのDBを作る")
+    parser.add_argument("--out", default=DEFAULT_DB)
+    parser.add_argument("--seasons", type=int, default=8)
+    parser.add_argument("--days", type=int, default=100, help="1シーズンあたりの開催日数 (1日2卓)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--roster", default="m_league.db", help="名簿を借りるDB (無ければ架空の名簿)")
+    args = parser.parse_args()
+    build(args.out, args.seasons, args.days, args.seed, args.roster)
@@ -0,0 +1,213 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from typing import NamedTuple
+
+# ==========================================
+# ★ API側のDBアクセス (読み取り専用) ★
+# ==========================================
+# main.py の読み取りはすべて、ここの長寿命の読み取り専用接続を使い回す。
+# update_db.py はDBを WAL モードにして1トランザクションで書き込むので、
+# 更新中も読み手はブロックされず、コミット前の一貫した内容を読み続けられる。
+# LLMが生成したSQLは SafeQuery で検査・制限してから実行する。
+
+SQL_TIME_BUDGET = float(os.getenv("SQL_TIME_BUDGET", "3"))   # 1クエリあたりの上限秒数
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "5000"))        # 取得する最大行数
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "256"))     # 結果キャッシュの件数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))           # 使い回す読み取り専用接続の数
+STATEMENT_CACHE = 256   # 接続ごとに保持するプリペアドステートメントの数
+
+ALLOWED_TABLES = {
+    "stats", "games", "team_ranking", "point_series", "head_to_head", "player_form", "player_season",
+    # 過去のシーズン (*_archive) と、今シーズンと合わせて読むビュー (*_all)
+    "stats_archive", "games_archive", "team_ranking_archive", "stats_all", "games_all", "team_ranking_all",
+}
+PROGRESS_STEPS = 1000   # progress handler を呼ぶ間隔 (SQLite VM の命令数)
+
+class UnsafeQueryError(Exception):
+    pass
+
+class QueryResult(NamedTuple):
+    columns: tuple
+    rows: tuple
+    truncated: bool   # 行数の上限で打ち切った場合 True
+
+# ---------------------------------------------------------
+# 読み取り専用の接続プール
+# ---------------------------------------------------------
+# mode=ro なので誤って書き込むことがなく、DBファイルが無くても勝手に作らない
+def connect_readonly(db_name):
+    uri = f"file:{os.path.abspath(db_name)}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+
+# 接続を使い回すことで、同じSQLの構文解析・実行計画 (プリペアドステートメント) も再利用される
+# DBファイルが差し替えられた (inode が変わった) 場合は古い接続を捨てて開き直す
+class ReadOnlyPool:
+    def __init__(self, db_name, size=DB_POOL_SIZE):
+        self.db_name = db_name
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self, inode):
+        return connect_readonly(self.db_name), inode
+
+    def acquire(self):
+        inode = os.stat(self.db_name).st_ino
+        while True:
+            try:
+                conn, conn_inode = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open(inode)
+            if conn_inode == inode:
+                return conn, conn_inode
+            conn.close()
+
+    def release(self, item):
+        try:
+            self._idle.put_nowait(item)
+        except queue.Full:
+            item[0].close()
+
+    # 起動時に接続を開いておく (スキーマの読み込みまで済ませ、最初のリクエストで接続を作らない)
+    def warm(self, count=None):
+        count = self._idle.maxsize if count is None else min(count, self._idle.maxsize)
+        items = [self.acquire() for _ in range(count)]
+        for conn, _ in items:
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        for item in items:
+            self.release(item)
+        return len(items)
+
+    # with pool.connection() as conn: の形で借りて返す
+    @contextmanager
+    def connection(self):
+        item = self.acquire()
+        try:
+            yield item[0]
+        finally:
+            self.release(item)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+# ---------------------------------------------------------
+# SQLの検査
+# ---------------------------------------------------------
+# 文字列リテラル / コメント / 空白 のいずれか (リテラルだけは中身を保つ)
+_TOKEN_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|--[^\n]*|/\*.*?\*/|\s+", re.S)
+
+# コメントを除き、空白の連続・末尾のセミコロンを揃える (キャッシュのキー用)
+def normalize_sql(sql):
+    sql = _TOKEN_RE.sub(lambda m: m.group(1) or " ", sql or "")
+    return sql.strip().rstrip(";").strip()
+
+def check_select(sql):
+    if not sql:
+        raise UnsafeQueryError("SQLが空です")
+    if ";" in _TOKEN_RE.sub(lambda m: "''" if m.group(1) else " ", sql):
+        raise UnsafeQueryError("SQLは1文のみ実行できます")
+    head = sql.split(None, 1)[0].upper()
+    if head not in ("SELECT", "WITH"):
+        raise UnsafeQueryError(f"SELECT 以外は実行できません: {head}")
+
+# Python 3.10 以前の sqlite3 には SQLITE_RECURSIVE の定数がない (値は SQLite の sqlite3.h と同じ)
+SQLITE_RECURSIVE = getattr(sqlite3, "SQLITE_RECURSIVE", 33)
+
+# WITH 句で定義した名前 ("WITH RECURSIVE n(x) AS (" / ", t AS (")
+_CTE_RE = re.compile(r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s*(?:\([^()]*\))?\s*AS\s*(?:NOT\s+)?(?:MATERIALIZED\s*)?\(', re.I)
+
+def cte_names(sql):
+    return frozenset(name.lower() for name in _CTE_RE.findall(_TOKEN_RE.sub(lambda m: "''" if m.group(1) else " ", sql)))
+
+# SQLite の authorizer で、既知テーブルの読み取りと関数呼び出し以外を拒否する
+# (書き込み・ATTACH・PRAGMA・sqlite_master などは SQLITE_DENY → UnsafeQueryError)
+# WITH RECURSIVE は意図して許可する (連番・日付の生成に使う。止まらない再帰は時間と行数の上限で打ち切る)
+# ctes: そのSQLの WITH 句の名前。COUNT(*) などで CTE を読むと、列名が空の読み取りとして CTE の名前が渡ってくる
+def _authorizer(action, arg1, arg2, db_name, trigger, ctes=frozenset()):
+    if action == sqlite3.SQLITE_READ:
+        allowed = arg1 in ALLOWED_TABLES or (arg2 == "" and (arg1 or "").lower() in ctes)
+        return sqlite3.SQLITE_OK if allowed else sqlite3.SQLITE_DENY
+    if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, SQLITE_RECURSIVE):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+# ---------------------------------------------------------
+# 実行とキャッシュ
+# ---------------------------------------------------------
+# observe: 実行にかかった秒数を受け取る関数 (キャッシュから返した場合は呼ばない)
+class SafeQuery:
+    def __init__(self, pool, version_func, cache_size=SQL_CACHE_SIZE, observe=None):
+        self.pool = pool
+        self._version = version_func
+        self._observe = observe
+        self._cache = OrderedDict()   # (正規化SQL, DBバージョン) -> QueryResult
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # 同期関数 (スレッドプールから呼ぶ)。不正なSQLは UnsafeQueryError、
+    # 時間切れ・構文エラーは sqlite3.Error を送出する
+    def run(self, sql, time_budget=SQL_TIME_BUDGET, max_rows=SQL_MAX_ROWS):
+        sql = normalize_sql(sql)
+        check_select(sql)
+        key = (sql, self._version())
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        started = time.perf_counter()
+        try:
+            result = self._execute(sql, time_budget, max_rows)
+        finally:
+            if self._observe:
+                self._observe(time.perf_counter() - started)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _execute(self, sql, time_budget, max_rows):
+        item = self.pool.acquire()
+        conn = item[0]
+        deadline = time.monotonic() + time_budget
+        conn.set_authorizer(partial(_authorizer, ctes=cte_names(sql)))
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+        try:
+            try:
+                cur = conn.execute(sql)
+            except sqlite3.DatabaseError as e:
+                if "not authorized" in str(e) or "prohibited" in str(e):
+                    raise UnsafeQueryError(f"許可されていない操作です: {e}") from e
+                raise
+            rows = cur.fetchmany(max_rows + 1)
+            columns = tuple(d[0] for d in cur.description or ())
+            cur.close()
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                raise sqlite3.OperationalError(f"SQLの実行が {time_budget} 秒を超えたため中断しました") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            conn.set_authorizer(None)
+            self.pool.release(item)
+        truncated = len(rows) > max_rows
+        return QueryResult(columns, tuple(rows[:max_rows]), truncated)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
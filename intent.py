@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+
+from name_resolver import is_confident
+
+# ==========================================
+# ★ 質問の意図判定 (ローカル) ★
+# ==========================================
+# キーワードの重み付きルールで各モードに点数を付け、最も高いものを選ぶ。
+# 同時に、選手・チーム・日付・指標 (stats の列) をスロットとして取り出す。
+# よくある「指標のランキング」「選手の指標」は、SQLを生成させずに定型クエリで答えられる。
+
+class Intent(NamedTuple):
+    name: str             # graph / matchup / analyst / results / stat_ranking / stat_lookup / sql
+    score: float
+    players: tuple = ()   # 名簿上の選手名 (確信を持てる一致のみ)
+    teams: tuple = ()     # 正式なチーム名
+    date: Optional[tuple] = None     # (月, 日)
+    metric: Optional[str] = None     # stats の列名
+    ascending: bool = False          # 並び順 (stat_ranking 用)
+    limit: int = 5
+
+# 指標の言い回し → stats の列 (長い表記から順に照合する)
+METRICS = {
+    "ラス回避率": "last_avoid_rate", "放銃平均打点": "hoju_avg_score", "平均着順": "avg_rank", "平着": "avg_rank",
+    "トップ率": "top_rate", "1位率": "top_rate", "連対率": "rentai_rate", "和了率": "agari_rate", "アガリ率": "agari_rate",
+    "放銃率": "hoju_rate", "リーチ率": "riichi_rate", "立直率": "riichi_rate", "副露率": "furo_rate", "鳴き": "furo_rate",
+    "平均打点": "avg_score", "打点": "avg_score", "ベストスコア": "best_score", "最高スコア": "best_score",
+    "トップ回数": "rank_1_count", "1位回数": "rank_1_count", "試合数": "matches", "局数": "total_hands",
+    "ポイント": "points", "強い": "points",
+}
+LOWER_IS_BETTER = {"avg_rank", "hoju_rate", "hoju_avg_score"}
+
+RANKING_WORDS = r"一番|いちばん|最も|もっとも|トップ\d|上位|下位|誰|だれ|ランキング|順位|ベスト|ワースト|高い|低い|多い|少ない"
+
+# (モード, 正規表現, 重み)。同じルールは何回出てきても1回分だけ数える
+RULES = [
+    ("graph", r"推移|グラフ|チャート|折れ線", 3.0),
+    ("matchup", r"対戦成績|直接対決|同卓|対局成績", 3.0),
+    ("matchup", r"対戦|対決|(?i:vs|ｖｓ)|相性", 1.0),
+    ("analyst", r"予想|勝つ|勝敗|展望|分析", 2.0),
+    ("analyst", r"成績|調子|勢い|好調|不調", 1.0),
+    ("results", r"試合結果|結果|速報", 2.0),
+    ("results", r"最新|昨日|今日", 1.0),   # 「今日の多井の成績」は analyst (同点なら上の行が優先)
+    ("results", r"順位|ランキング", 1.5),
+    ("stat_ranking", RANKING_WORDS, 1.0),
+    ("stat_lookup", r"スタッツ|データ|数字|数値|は[?？]?$", 1.0),
+]
+MIN_SCORE = 1.0   # これ未満ならどのモードにも当てはまらない (通常の SQL 生成へ)
+
+def _prepare(text):
+    return unicodedata.normalize("NFKC", text or "").lower().strip()
+
+def find_metric(text):
+    for word in sorted(METRICS, key=len, reverse=True):
+        if word.lower() in text:
+            return METRICS[word]
+    return None
+
+def find_date(text):
+    m = re.search(r"(\d{1,2})月(\d{1,2})日", text)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    m = re.search(r"\b(\d{1,2})/(\d{1,2})\b", text)
+    if m and 1 <= int(m.group(1)) <= 12:
+        return int(m.group(1)), int(m.group(2))
+    return None
+
+# 選手・チームのスロット。あいまい一致はスロットに入れない (各モードで改めて解決・LLM抽出する)
+def find_names(text, resolver):
+    players, teams = [], []
+    for m in resolver.find(text):
+        if not is_confident(m):
+            continue
+        if m.kind == "team":
+            if m.source not in teams:
+                teams.append(m.source)
+        elif m.name not in players:
+            players.append(m.name)
+    return tuple(players), tuple(teams)
+
+# True なら昇順。「低い/高い」は値そのもの、「良い/悪い」は指標の向き (平均着順・放銃率は小さい方が良い) で決める
+def _ranking_order(text, metric):
+    if re.search(r"低い|少ない", text):
+        return True
+    if re.search(r"高い|多い", text):
+        return False
+    best_ascending = metric in LOWER_IS_BETTER
+    if re.search(r"ワースト|悪い|下位", text):
+        return not best_ascending
+    return best_ascending
+
+def classify(text, resolver):
+    q = _prepare(text)
+    players, teams = find_names(text, resolver)
+    metric = find_metric(q)
+    date = find_date(q)
+
+    scores = {}
+    for name, pattern, weight in RULES:
+        if re.search(pattern, q):
+            scores[name] = scores.get(name, 0.0) + weight
+
+    # スロットによる補正
+    if "matchup" in scores and len(players) >= 2:
+        scores["matchup"] += 1.0
+    if "results" in scores and date:
+        scores["results"] += 1.0
+    ranking_asked = bool(re.search(RANKING_WORDS, q))
+    # 指標のランキング: 指標があり、特定の選手を聞いていない (「個人ランキング」は results 側で扱う)
+    if metric and ranking_asked and not players and not (metric == "points" and "個人" in q):
+        scores["stat_ranking"] = scores.get("stat_ranking", 0.0) + 2.0
+    else:
+        scores.pop("stat_ranking", None)
+    # 選手・チームの指標: 名前と、指標またはスタッツ一覧を聞いている
+    if (players or teams) and (metric or re.search(r"スタッツ", q)) and not (ranking_asked and not players):
+        scores["stat_lookup"] = scores.get("stat_lookup", 0.0) + 2.0
+    else:
+        scores.pop("stat_lookup", None)
+
+    # 同点の場合は RULES の並び順 (従来の判定順) を優先
+    order = [r[0] for r in RULES]
+    best = max(scores.items(), key=lambda kv: (kv[1], -order.index(kv[0])), default=("sql", 0.0))
+    name, score = best if best[1] >= MIN_SCORE else ("sql", best[1])
+
+    limit_match = re.search(r"(?:トップ|上位|ベスト|ワースト|下位)(\d{1,2})", q)
+    return Intent(
+        name=name, score=score, players=players, teams=teams, date=date, metric=metric,
+        ascending=_ranking_order(q, metric) if metric else False,
+        limit=int(limit_match.group(1)) if limit_match else 5,
+    )
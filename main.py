@@ -1,458 +1,1383 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
-import pandas as pd
-import openai
-import re
-import os
-
-# ==========================================
-# ★ APIキー設定 (本番用安全仕様) ★
-# ==========================================
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
-)
-
-DB_NAME = 'm_league.db'
-
-# DB接続ヘルパー
-def get_connection():
-    return sqlite3.connect(DB_NAME)
-
-# 毎回DBから最新のリストを取得する関数
-def get_vocab():
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT team FROM stats")
-        teams = [r[0] for r in cur.fetchall() if r[0]]
-        cur.execute("SELECT DISTINCT player FROM stats")
-        players = [r[0] for r in cur.fetchall() if r[0]]
-        conn.close()
-        return ", ".join(teams), ", ".join(players)
-    except:
-        return "", ""
-
-# サーバー診断ページ (/debug)
-@app.get("/debug")
-def debug_endpoint():
-    try:
-        if not os.path.exists(DB_NAME):
-            return {"status": "ERROR", "message": "DBファイルがありません"}
-        conn = get_connection()
-        df_stats = pd.read_sql_query("SELECT * FROM stats", conn)
-        df_games = pd.read_sql_query("SELECT * FROM games", conn)
-        conn.close()
-        return {
-            "status": "OK",
-            "stats_count": len(df_stats),
-            "games_count": len(df_games),
-            "latest_date": df_games['date'].max() if not df_games.empty else "なし"
-        }
-    except Exception as e:
-        return {"status": "ERROR", "detail": str(e)}
-
-class ChatRequest(BaseModel):
-    message: str
-
-@app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
-    try:
-        if not openai.api_key:
-            return {"reply": "【エラー】APIキーが設定されていません。", "graph": None}
-
-        user_query = req.message
-        graph_data = None
-        
-        # 毎回最新の辞書を取得
-        team_vocab, player_vocab = get_vocab()
-
-        # ---------------------------------------------------------
-        # 1. グラフ生成モード
-        # ---------------------------------------------------------
-        if "推移" in user_query or "グラフ" in user_query:
-            id_prompt = f"""
-            ユーザーは「ポイント推移」を知りたいです。質問: "{user_query}"
-            【正しい名前】チーム: {team_vocab} 選手: {player_vocab}
-            【指示】質問対象を特定し、LIKE検索のSQLを作成してください。
-            パターンA(チーム): SELECT date, point, player FROM games WHERE player IN (SELECT player FROM stats WHERE team LIKE '%キーワード%') ORDER BY date;
-            パターンB(個人): SELECT date, point, player FROM games WHERE player LIKE '%キーワード%' ORDER BY date;
-            回答はSQLのみ。
-            """
-            res = openai.chat.completions.create(
-                model="gpt-4o", messages=[{"role": "system", "content": id_prompt}], temperature=0
-            )
-            sql = res.choices[0].message.content.strip().replace("```sql", "").replace("```", "")
-            
-            conn = get_connection()
-            try:
-                df = pd.read_sql_query(sql, conn)
-                if not df.empty:
-                    df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.strftime('%Y/%m/%d')
-                    df_grouped = df.groupby('date')['point'].sum().reset_index()
-                    df_grouped['total_point'] = df_grouped['point'].cumsum()
-                    
-                    label_name = "推移"
-                    if "team" in sql.lower():
-                        label_name = "チーム推移"
-                    elif not df.empty:
-                        label_name = f"{df['player'].iloc[0]}の推移"
-
-                    graph_data = {
-                        "labels": df_grouped['date'].tolist(),
-                        "data": df_grouped['total_point'].tolist(),
-                        "label": label_name
-                    }
-                    final_prompt = f"""
-                    Mリーグ実況者として解説してください。
-                    質問: {user_query}
-                    データ: {df_grouped.tail(5).to_string()}
-                    「グラフをご覧ください」と添えてください。
-                    """
-                    res_text = openai.chat.completions.create(
-                        model="gpt-4o", messages=[{"role": "system", "content": final_prompt}], temperature=0.3
-                    )
-                    return {"reply": res_text.choices[0].message.content, "graph": graph_data}
-                else:
-                     return {"reply": f"データが見つかりませんでした。\n試行したSQL: `{sql}`", "graph": None}
-            except Exception as e:
-                print(f"グラフエラー: {e}")
-            finally:
-                conn.close()
-
-        # ---------------------------------------------------------
-        # 2. アナリストモード（勝敗予想・対戦成績）
-        # ---------------------------------------------------------
-        elif "予想" in user_query or "成績" in user_query or "相性" in user_query or "vs" in user_query.lower():
-            extract_prompt = f"""
-            ユーザーの質問から、分析対象となる「選手名」を全て抽出してください。
-            質問: "{user_query}"
-            【選手名簿】{player_vocab}
-            回答は選手名をカンマ区切りで出すだけ。（例: 多井隆晴, 伊達朱里紗）
-            もしチーム名が書かれていたら、そのチームの代表的な選手を1名選んでください。
-            """
-            res_names = openai.chat.completions.create(
-                model="gpt-4o", messages=[{"role": "system", "content": extract_prompt}], temperature=0
-            )
-            target_names = [n.strip() for n in res_names.choices[0].message.content.split(',') if n.strip()]
-            
-            if not target_names:
-                return {"reply": "分析対象の選手名が特定できませんでした。", "graph": None}
-
-            conn = get_connection()
-            try:
-                placeholders = ",".join(["?"] * len(target_names))
-                sql_stats = f"SELECT * FROM stats WHERE player IN ({placeholders})"
-                df_stats = pd.read_sql_query(sql_stats, conn, params=target_names)
-                
-                recent_data_text = ""
-                for p in target_names:
-                    sql_recent = "SELECT date, rank, point FROM games WHERE player = ? ORDER BY date DESC LIMIT 5"
-                    df_recent = pd.read_sql_query(sql_recent, conn, params=[p])
-                    if not df_recent.empty:
-                        recent_data_text += f"\n【{p}の直近5戦】\n{df_recent.to_string(index=False)}\n"
-
-                final_prompt = f"""
-                あなたはMリーグのプロアナリストです。
-                ユーザーの質問: "{user_query}"
-                
-                以下の「客観的なデータ」を元に、論理的な分析・予想を行ってください。
-                
-                【対象選手の今期スタッツ】
-                {df_stats.to_string(index=False)}
-                
-                【対象選手の直近成績（勢い）】
-                {recent_data_text}
-                
-                【指示】
-                - 「勝敗予想」の場合は、スタッツ（平均着順やポイント）と直近の勢いを総合して、最も勝率が高そうな選手を1名挙げ、理由を解説してください。
-                - 「対戦成績・相性」の場合は、それぞれのデータの強み（攻撃型か守備型かなど）を比較してください。
-                - 最後に必ず「※データに基づく予想であり、結果を保証するものではありません」と注釈を入れてください。
-                """
-                res_final = openai.chat.completions.create(
-                    model="gpt-4o", messages=[{"role": "system", "content": final_prompt}], temperature=0.7
-                )
-                return {"reply": res_final.choices[0].message.content, "graph": None}
-            finally:
-                conn.close()
-
-        # ---------------------------------------------------------
-        # 3. 最新結果・順位モード（個人ランキング対応 ＆ 試合結果強制分割）
-        # ---------------------------------------------------------
-        elif "順位" in user_query or "ランキング" in user_query or "最新" in user_query or "試合結果" in user_query:
-            conn = get_connection()
-            try:
-                # =================================================
-                # パターンA: 個人ランキングを聞かれた場合
-                # =================================================
-                if "個人" in user_query and ("順位" in user_query or "ランキング" in user_query):
-                    # statsテーブルからポイント順に全選手を取得
-                    sql_stats = "SELECT player, team, points FROM stats ORDER BY points DESC"
-                    df_stats = pd.read_sql_query(sql_stats, conn)
-                    
-                    if df_stats.empty:
-                        return {"reply": "個人成績データが見つかりませんでした。", "graph": None}
-
-                    # ランキング表を作成（テキスト整形）
-                    ranking_text = "【現在の個人ポイントランキング】\n"
-                    for i, row in df_stats.iterrows():
-                        # 順位に応じたアイコン
-                        rank = i + 1
-                        icon = "👑" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else "💀" if rank == len(df_stats) else f"{rank}位"
-                        
-                        # 30位くらいまで表示すると長いので、上位と下位をピックアップするか、
-                        # シンプルに全件リストとして返す（スクロールで見る前提）
-                        # ここでは見やすさ重視で全件出します
-                        ranking_text += f"{icon} {row['player']} ({row['team']}): {row['points']:+.1f}pt\n"
-
-                    return {"reply": ranking_text, "graph": None}
-
-                # =================================================
-                # パターンB: 試合結果・チーム順位（既存ロジック）
-                # =================================================
-                else:
-                    # 日付指定があるかチェック
-                    date_match = re.search(r'(\d{1,2})月(\d{1,2})日', user_query)
-                    
-                    df_games = pd.DataFrame()
-                    target_display_date = "直近"
-
-                    if date_match:
-                        month = int(date_match.group(1))
-                        day = int(date_match.group(2))
-                        target_date = f"2025/{month:02d}/{day:02d}"
-                        target_display_date = f"{month}月{day}日"
-
-                        # match_id順に取得
-                        sql_games = """
-                        SELECT match_id, date, game_count, rank, player, point 
-                        FROM games 
-                        WHERE date = ? 
-                        ORDER BY game_count ASC, match_id ASC, rank ASC
-                        """
-                        df_games = pd.read_sql_query(sql_games, conn, params=[target_date])
-                    
-                    else:
-                        # 日付指定がない場合
-                        sql_games = "SELECT match_id, date, game_count, rank, player, point FROM games ORDER BY date DESC, game_count DESC, rank ASC LIMIT 8"
-                        df_games = pd.read_sql_query(sql_games, conn)
-
-                    # チーム順位
-                    sql_ranking = "SELECT rank, team, point FROM team_ranking ORDER BY rank"
-                    df_ranking = pd.read_sql_query(sql_ranking, conn)
-
-                    # --- 試合結果の整形処理 ---
-                    if df_games.empty:
-                        game_result_text = f"申し訳ありません。{target_display_date}の試合データが見つかりませんでした。"
-                    else:
-                        formatted_results = []
-                        # 1.「第1回戦」「第2回戦」で分ける
-                        for game_cnt, group_gc in df_games.groupby('game_count'):
-                            # 2.「卓」で分ける
-                            sub_groups = [g for _, g in group_gc.groupby('match_id', sort=False)]
-                            
-                            # 安全装置: 4人区切り
-                            final_groups = []
-                            for sub_g in sub_groups:
-                                if len(sub_g) > 4:
-                                    for i in range(0, len(sub_g), 4):
-                                        final_groups.append(sub_g.iloc[i:i+4])
-                                else:
-                                    final_groups.append(sub_g)
-
-                            # 3. テキスト生成
-                            for idx, table_df in enumerate(final_groups):
-                                table_suffix = chr(65 + idx) # A, B...
-                                # 日付指定がない場合(直近)は日付も入れる
-                                date_str = f" ({table_df.iloc[0]['date'][5:]})" if not date_match else ""
-                                header = f"■ 第{game_cnt}回戦 ({table_suffix}卓){date_str}"
-                                
-                                rows_text = ""
-                                for _, row in table_df.iterrows():
-                                    rank_icon = ["🥇","🥈","🥉","4️⃣"][int(row['rank'])-1] if 1 <= int(row['rank']) <= 4 else ""
-                                    rows_text += f"{rank_icon} {int(row['rank'])}位: {row['player']} ({row['point']:+.1f}pt)\n"
-                                
-                                formatted_results.append(f"{header}\n{rows_text}")
-                        
-                        game_result_text = f"【{target_display_date}の試合結果】\n\n" + "\n".join(formatted_results)
-
-                    combined_data = f"{game_result_text}\n\n----------------\n【現在のチーム順位】\n{df_ranking.to_string(index=False)}"
-                    
-                    final_prompt = f"""
-                    あなたはMリーグの公式リポーターです。
-                    質問「{user_query}」に対し、以下の整形済みデータを**そのまま**表示してください。
-                    
-                    【データ】
-                    {combined_data}
-
-                    【指示】
-                    - データを要約したり、勝手にくっつけたりせず、渡されたテキストの形式を維持して回答してください。
-                    """
-                    
-                    res_final = openai.chat.completions.create(
-                        model="gpt-4o", messages=[{"role": "system", "content": final_prompt}], temperature=0
-                    )
-                    return {"reply": res_final.choices[0].message.content, "graph": None}
-
-            except Exception as e:
-                print(f"Error: {e}")
-                return {"reply": f"データ取得エラー: {e}", "graph": None}
-            finally:
-                conn.close()
-        # ---------------------------------------------------------
-        # 4. ★直接対決・全記録モード（match_id 対応版）
-        # ---------------------------------------------------------
-        elif "対戦" in user_query and ("と" in user_query or "vs" in user_query.lower()):
-            
-            # Step A: 対戦する2名を特定
-            extract_prompt = f"""
-            ユーザーの質問から「対戦成績を比較したい2名の選手名」を抽出してください。
-            
-            質問: "{user_query}"
-            【選手名簿】{player_vocab}
-            
-            回答は選手名をカンマ区切りで出すだけ。（例: 多井隆晴, 鈴木優）
-            """
-            res_names = openai.chat.completions.create(
-                model="gpt-4o", messages=[{"role": "system", "content": extract_prompt}], temperature=0
-            )
-            names = [n.strip() for n in res_names.choices[0].message.content.split(',') if n.strip()]
-            
-            if len(names) < 2:
-                return {"reply": "対戦する2名の選手名が見つかりませんでした。「多井隆晴と鈴木優の対戦成績」のように聞いてみてください。", "graph": None}
-
-            p1_name = names[0]
-            p2_name = names[1]
-
-            conn = get_connection()
-            try:
-                # Step B: 「二人が同卓した試合」を特定する SQL
-                # ★修正ポイント: match_id で結合して、本当に同卓した試合だけを抽出
-                sql_matchup = f"""
-                SELECT 
-                    T1.date as 日付,
-                    T1.game_count as 回戦,
-                    T1.player as 選手A, T1.rank as 着順A, T1.point as PtA,
-                    T2.player as 選手B, T2.rank as 着順B, T2.point as PtB
-                FROM games T1
-                JOIN games T2 ON T1.match_id = T2.match_id  -- ★ここを match_id で結合に変更！
-                WHERE T1.player LIKE '%{p1_name}%' 
-                  AND T2.player LIKE '%{p2_name}%'
-                ORDER BY T1.date DESC
-                """
-                
-                df_match = pd.read_sql_query(sql_matchup, conn)
-                
-                if df_match.empty:
-                     return {"reply": f"データ上、{p1_name}選手と{p2_name}選手の直接対決は見つかりませんでした。", "graph": None}
-
-                # Step C: 結果をAIに解説させる
-                final_prompt = f"""
-                あなたはMリーグのデータアナリストです。
-                ユーザーの質問「{user_query}」に対し、以下の「直接対決の全記録」を元に解説してください。
-                
-                【直接対決データ ({len(df_match)}戦)】
-                {df_match.to_string(index=False)}
-                
-                【出力ルール】
-                1. **「トータルでどちらが勝ち越しているか（先着数など）」** をまず結論として述べてください。
-                2. その後、**対戦履歴のリスト** を見やすく表示してください。
-                   例: 
-                   📅 11/21 第1試合
-                   👊 **多井** (1位 +50.0) vs **鈴木** (3位 -20.0)
-                3. 最後に「どちらが得意としているか」の相性分析を添えてください。
-                """
-                
-                res_final = openai.chat.completions.create(
-                    model="gpt-4o", messages=[{"role": "system", "content": final_prompt}], temperature=0.5
-                )
-                return {"reply": res_final.choices[0].message.content, "graph": None}
-            
-            finally:
-                conn.close()
-        # ---------------------------------------------------------
-        # 5. 通常モード（★ここを最強の有能AIに改造しました！）
-        # ---------------------------------------------------------
-        table_info = """
-        【テーブル定義書】
-        1. stats (個人通算成績)
-           - player: 選手名
-           - team: チーム名
-           - points: 通算ポイント (重要指標)
-           - matches: 試合数
-           - avg_rank: 平均着順 (2.5より小さければ優秀)
-           - rank_1_count: 1位回数
-           - top_rate: トップ率
-           - last_avoid_rate: ラス回避率 (高いほど守備的)
-           - best_score: 最高スコア
-           - avg_score: 平均打点
-           - riichi_rate: リーチ率
-           - agari_rate: 和了率
-           - hoju_rate: 放銃率 (低いほど守備的)
-           - furo_rate: 副露率 (鳴き率)
-        """
-
-        sql_prompt = f"""
-        あなたは世界一のMリーグデータアナリストです。
-        質問「{user_query}」に対し、最も分析に適したデータを抽出するSQLを作成してください。
-        
-        【正しい名前リスト】
-        選手: {player_vocab}
-        チーム: {team_vocab}
-        
-        {table_info}
-        
-        【SQL作成の極意】
-        1. ユーザーの入力をリストの名前に脳内変換し、必ず LIKE 検索を使ってください。
-        2. 「スタッツ」や「成績」と聞かれたら、ケチらずに主要な指標（points, avg_rank, agari_rate, hoju_rate, riichi_rate, furo_rate, avg_score）を全てSELECTしてください。
-        3. 「強いのは誰？」のような抽象的な質問なら、points や avg_rank でソートして上位5名を出してください。
-        
-        回答はSQLのみ。
-        """
-        res_sql = openai.chat.completions.create(
-            model="gpt-4o", messages=[{"role": "system", "content": sql_prompt}], temperature=0
-        )
-        gen_sql = res_sql.choices[0].message.content.strip().replace("```sql", "").replace("```", "")
-        print(f"💬 通常SQL: {gen_sql}")
-        
-        conn = get_connection()
-        try:
-            df_result = pd.read_sql_query(gen_sql, conn)
-        except:
-            df_result = pd.DataFrame()
-        finally:
-            conn.close()
-
-        if df_result.empty:
-             return {"reply": f"該当データが見当たりませんでした。\n(実行SQL: `{gen_sql}`)", "graph": None}
-
-        final_prompt = f"""
-        あなたは熱狂的かつ知的なMリーグ実況解説者です。
-        質問: {user_query}
-        データ: {df_result.to_string()}
-        
-        【解説のルール】
-        1. **数値を読むだけの実況は二流です。** その数値が何を意味するかを熱く語ってください。
-           - 例: 「放銃率0.08」→「放銃率はわずか8%！これは驚異的な守備力、まさに鉄壁ですね！」
-           - 例: 「平均着順2.1」→「2.1という数字は、圧倒的な強さの証明です。」
-        
-        2. **見やすさは命です。**
-           - 重要な数字は **太字** に。
-           - 項目ごとに改行し、箇条書き(・)を使ってください。
-           - 絵文字（🀄, 🔥, 🛡️, 📊, ⚡）を適度に使って雰囲気を盛り上げてください。
-        
-        3. **数値の変換**
-           - 率(rate)のデータは小数(0.25など)なので、必ず **100倍して%表記(25%)** に直してください。
-           - ポイントのマイナスは「▲」を使ってください。
-        """
-        res_final = openai.chat.completions.create(
-            model="gpt-4o", messages=[{"role": "system", "content": final_prompt}], temperature=0.5
-        )
-        return {"reply": res_final.choices[0].message.content, "graph": None}
-
-    except Exception as e:
-        return {"reply": f"エラー: {str(e)}", "graph": None}
\ No newline at end of file
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+from typing import NamedTuple, Optional
+import asyncio
+import datetime
+import importlib
+import json
+import threading
+import time
+import unicodedata
+import sqlite3
+import re
+import os
+from name_resolver import SCORE_EXACT, NameResolver, is_confident
+import precompute
+import db
+import intent
+import prompt_builder
+import semantic_cache
+import shared_cache
+import metrics
+from metrics import log, span
+# pandas・openai は読み込みが重いので、使う関数の中で import する (起動や /healthz・/metrics では読み込まない)
+
+# ==========================================
+# ★ APIキー設定 (本番用安全仕様) ★
+# ==========================================
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+DB_NAME = os.getenv("MLEAGUE_DB", "m_league.db")
+
+# ==========================================
+# ★ 非同期実行の設定 ★
+# ==========================================
+# イベントループを止めないよう、LLMは非同期クライアント、DBは専用スレッドプールで実行する
+LLM_MODEL = "gpt-4o"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))     # LLM 1回あたりの上限秒数
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))       # DB処理 1回あたりの上限秒数
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "120"))  # /chat 1リクエスト全体の上限秒数
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))          # DB用スレッド数 (同時実行数の上限)
+WORK_WORKERS = int(os.getenv("WORK_WORKERS", "4"))      # DB以外の同期処理 (意図判定・名前解決・キャッシュ入出力) 用のスレッド数
+
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+work_executor = ThreadPoolExecutor(max_workers=WORK_WORKERS, thread_name_prefix="work")
+_llm_client = None
+
+# DB接続ヘルパー (読み取り専用の接続をプールから借りる。使い終わったら返す)
+read_pool = db.ReadOnlyPool(DB_NAME, size=DB_WORKERS)
+
+def get_connection():
+    return read_pool.connection()
+
+# LLMクライアント (初回利用時に生成。openai は読み込みが重いので、使うときに import する)
+def get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        import openai
+        _llm_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT, max_retries=1)
+    return _llm_client
+
+# stage: 計測用の呼び出し目的 (graph_sql / extract_names / sql / results / answer)
+async def ask_llm(prompt, temperature=0, stage="answer"):
+    started = time.perf_counter()
+    try:
+        with span(f"llm.{stage}"):
+            res = await asyncio.wait_for(
+                get_llm_client().chat.completions.create(
+                    model=LLM_MODEL, messages=[{"role": "system", "content": prompt}], temperature=temperature
+                ),
+                LLM_TIMEOUT,
+            )
+    except Exception:
+        metrics.observe_llm(stage, time.perf_counter() - started, error=True)
+        raise
+    metrics.observe_llm(stage, time.perf_counter() - started, res.usage)
+    return res.choices[0].message.content
+
+# 生成されたトークンを届いた順に返す (/chat/stream 用)
+# トークン数は最後のチャンクに付く usage から取る
+async def ask_llm_stream(prompt, temperature=0, stage="answer"):
+    started = time.perf_counter()
+    usage = None
+    try:
+        with span(f"llm.{stage}.first_token"):
+            stream = await asyncio.wait_for(
+                get_llm_client().chat.completions.create(
+                    model=LLM_MODEL, messages=[{"role": "system", "content": prompt}], temperature=temperature,
+                    stream=True, stream_options={"include_usage": True},
+                ),
+                LLM_TIMEOUT,
+            )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception:
+        metrics.observe_llm(stage, time.perf_counter() - started, error=True)
+        raise
+    metrics.observe_llm(stage, time.perf_counter() - started, usage)
+
+# DB処理をスレッドプールで実行する (func は conn を第1引数に取る同期関数)
+# タイムアウト・キャンセル時は conn.interrupt() で実行中のSQLを止める
+async def run_db(func, *args):
+    holder = []
+
+    def call():
+        with get_connection() as conn:
+            holder.append(conn)
+            with timed_db(func):
+                return func(conn, *args)
+
+    future = asyncio.get_running_loop().run_in_executor(db_executor, call)
+    try:
+        # shield: 待ち側がキャンセルされても、スレッド側の後始末(接続の返却)が終わるまで future を生かす
+        return await asyncio.wait_for(asyncio.shield(future), DB_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        if holder:
+            holder[0].interrupt()
+        raise
+
+# DBを読むが、接続を自分で扱う同期関数をDB用スレッドプールで実行する
+# (SafeQuery で生成SQLを実行する関数、語彙・事前集計のキャッシュの読み直し)
+async def run_db_blocking(func, *args):
+    return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(db_executor, func, *args), DB_TIMEOUT)
+
+# DBを使わない同期処理 (意図判定・名前解決・キャッシュ入出力など) を別のスレッドプールで実行する
+# DBの同時実行数や DB_TIMEOUT を消費しないよう、DB用とはプールも計測も分ける
+async def run_blocking(func, *args):
+    def call():
+        with timed(metrics.OFFLOAD_SECONDS, func):
+            return func(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(work_executor, call)
+
+# スレッド上での実行時間 (プールの空き待ちを含まない) を関数名ごとに記録する
+@contextmanager
+def timed(histogram, func):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, getattr(func, "__qualname__", str(func)))
+
+def timed_db(func):
+    return timed(metrics.DB_SECONDS, func)
+
+# ==========================================
+# ★ DB更新の検知 ★
+# ==========================================
+# update_db.py が書き込むと PRAGMA data_version が変わる (他の接続からのコミットを検知)
+# DBファイル自体が差し替えられた場合は inode / mtime の変化で検知する
+class DbWatcher:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inode = None
+
+    def version(self):
+        try:
+            st = os.stat(self.db_name)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._conn is None or self._inode != st.st_ino:
+                self._reopen(st.st_ino)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return (st.st_ino, st.st_mtime_ns, data_version)
+
+    # 監視用の長寿命接続でクエリを実行する (語彙の読み込みなど軽い処理専用)
+    def query(self, sql, params=()):
+        with self._lock:
+            if self._conn is None:
+                self._reopen(os.stat(self.db_name).st_ino)
+            return self._conn.execute(sql, params).fetchall()
+
+    def _reopen(self, inode):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = db.connect_readonly(self.db_name)
+        self._inode = inode
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+db_watcher = DbWatcher(DB_NAME)
+
+# LLMが書いたSQLはこちらで実行する (読み取り専用・SELECT 1文のみ・時間と行数に上限・結果をキャッシュ)
+safe_query = db.SafeQuery(
+    read_pool, db_watcher.version, observe=lambda seconds: metrics.DB_SECONDS.observe(seconds, "SafeQuery"),
+)
+
+def run_generated_sql(sql):
+    import pandas as pd
+
+    result = safe_query.run(sql)
+    if result.truncated:
+        log(f"⚠️ SQL結果を {len(result.rows)} 行で打ち切りました")
+    return pd.DataFrame(list(result.rows), columns=list(result.columns))
+
+# ==========================================
+# ★ 語彙キャッシュ (チーム名・選手名) ★
+# ==========================================
+# 名簿は update_db.py 実行時にしか変わらないので、プロセス内で1回だけ読み込み、
+# DBの更新を検知したときだけ読み直す
+class Vocab(NamedTuple):
+    version: tuple
+    teams: tuple
+    players: tuple
+    team_set: frozenset
+    player_set: frozenset
+    player_team: dict     # 選手名 -> チーム名
+    team_leader: dict     # チーム名 -> 代表選手 (今期ポイント最上位)
+    resolver: NameResolver
+    season: str           # games / stats に入っているシーズン ("2025-26")
+    stamp: str            # meta の last_update (update_db.py が書き込むたびに変わる。無いDBでは "")
+
+EMPTY_VOCAB = Vocab(None, (), (), frozenset(), frozenset(), {}, {}, NameResolver(()), "", "")
+
+def load_current_season(watcher):
+    try:
+        rows = watcher.query("SELECT value FROM meta WHERE key = 'current_season'")
+        if rows and rows[0][0]:
+            return rows[0][0]
+    except sqlite3.Error:
+        pass    # スキーマ移行前のDB
+    latest = watcher.query("SELECT MAX(date) FROM games")[0][0]
+    return precompute.season_of(latest or datetime.date.today().isoformat())
+
+def load_stamp(watcher):
+    try:
+        rows = watcher.query("SELECT value FROM meta WHERE key = 'last_update'")
+    except sqlite3.Error:
+        return ""   # スキーマ移行前のDB
+    return rows[0][0] if rows and rows[0][0] else ""
+
+# ワーカー間で共有するキャッシュのキーに使うデータのバージョン
+# PRAGMA data_version・inode はプロセスやマシンごとに違うので、meta の last_update で表す
+# (last_update が無いDBではプロセス内のバージョンを使う = 他のワーカーとは共有しない)
+def shared_version(vocab):
+    return ("stamp", vocab.stamp) if vocab.stamp else vocab.version
+
+def load_vocab(watcher, version):
+    rows = watcher.query("SELECT team, player, points FROM stats")
+    try:
+        # チーム順位表の略称 (「フェニックス」など) も名前解決に使う
+        short_names = [r[0] for r in watcher.query("SELECT team FROM team_ranking") if r[0]]
+    except sqlite3.Error:
+        short_names = []
+    teams = tuple(dict.fromkeys(r[0] for r in rows if r[0]))
+    players = tuple(dict.fromkeys(r[1] for r in rows if r[1]))
+    player_team = {r[1]: r[0] for r in rows if r[0] and r[1]}
+    team_leader = {}
+    for team, player, _ in sorted((r for r in rows if r[0] and r[1]), key=lambda r: -(r[2] or 0)):
+        team_leader.setdefault(team, player)
+    resolver = NameResolver(players, player_team, team_leader, short_names)
+    return Vocab(
+        version, teams, players, frozenset(teams), frozenset(players), player_team, team_leader, resolver,
+        load_current_season(watcher), load_stamp(watcher),
+    )
+
+# DBのバージョンが変わったときだけ loader(watcher, version) で読み直すキャッシュ
+# 読み込みに失敗した場合は空の値を返し、次の呼び出しで再試行する
+class VersionedCache:
+    def __init__(self, name, watcher, loader, empty=None):
+        self.name = name
+        self.watcher = watcher
+        self._loader = loader
+        self._empty = empty
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = empty
+        self.hits = 0
+        self.misses = 0   # 読み込み (DB更新後の読み直し) の回数
+
+    def get(self):
+        version = self.watcher.version()
+        if version is not None and version == self._version:
+            self.hits += 1
+            return self._value
+        with self._lock:
+            if version is None:
+                return self._empty
+            if version != self._version:
+                self.misses += 1
+                try:
+                    self._value = self._loader(self.watcher, version)
+                    self._version = version
+                except sqlite3.Error as e:
+                    log(f"{self.name} 読み込みエラー: {e}")
+                    return self._empty
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._value = self._empty
+
+vocab_cache = VersionedCache("語彙", db_watcher, load_vocab, EMPTY_VOCAB)
+
+# ==========================================
+# ★ 直接対決マトリクス ★
+# ==========================================
+# update_db.py が作る head_to_head テーブルを丸ごとメモリに載せ、(選手, 選手) で引く
+# テーブルがまだ無いDBでは games から同じものを組み立てる
+def load_head_to_head(watcher, version):
+    try:
+        rows = watcher.query(
+            "SELECT player_a, player_b, games, a_ahead, b_ahead, a_points, b_points, point_diff, matches FROM head_to_head"
+        )
+        return precompute.head_to_head_from_rows(rows)
+    except sqlite3.OperationalError:
+        rows = watcher.query("SELECT match_id, date, game_count, rank, player, point FROM games")
+        return precompute.build_head_to_head(rows)
+
+head_to_head_cache = VersionedCache("直接対決", db_watcher, load_head_to_head, {})
+
+# ==========================================
+# ★ 累積ポイント推移 ★
+# ==========================================
+# update_db.py が作る point_series を {("player" | "team", 名前): [(日付, 当日, 累積)]} で保持する
+def load_point_series(watcher, version):
+    try:
+        rows = watcher.query("SELECT entity_type, entity, date, point, total_point FROM point_series")
+        return precompute.point_series_from_rows(rows)
+    except sqlite3.OperationalError:
+        rows = watcher.query("SELECT date, player, point FROM games")
+        player_team = dict(watcher.query("SELECT player, team FROM stats"))
+        return precompute.build_point_series(rows, player_team)
+
+series_cache = VersionedCache("ポイント推移", db_watcher, load_point_series, {})
+
+# ==========================================
+# ★ 応答キャッシュ ★
+# ==========================================
+# キーは (正規化した質問, モード, データのバージョン)。update_db.py が書き込むとバージョンが変わり、
+# 古い応答は自然に使われなくなる (LRU / 期限切れで消える)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))   # プロセス内に置く場合の件数
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))  # 秒
+
+def normalize_query(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"[\s?!。、,.]+", "", text)
+
+# 答えにならなかった応答 (データなし・取得エラー)。クライアントには普通の {"reply", "graph"} として返るが、
+# 応答キャッシュ・事前計算には保存しない (データが揃った後や一時的なエラーの後も同じ応答を返し続けないように)
+class NoAnswer(dict):
+    pass
+
+def no_answer(reply):
+    return NoAnswer(reply=reply, graph=None)
+
+# 保存先は shared_cache (CACHE_URL) で、複数ワーカーで動かすときは全ワーカーが同じ応答を使い回す
+# 同時リクエストをまとめる処理 (_inflight) はプロセスごと
+# offload: 保存先の読み書きを実行するコルーチン関数 (sqlite / redis はスレッドで実行する)
+# 保存先の障害は応答を止めず、キャッシュなしとして扱う
+class ResponseCache:
+    def __init__(self, backend, ttl, offload):
+        self.backend = backend
+        self.ttl = ttl
+        self._offload = offload
+        self._inflight = {}           # key -> 計算中の Task (同じ質問の同時リクエストをまとめる)
+        self.hits = 0
+        self.misses = 0
+
+    async def fetch(self, key):
+        try:
+            return await self._offload(self.backend.get, shared_cache.make_key("response", *key))
+        except Exception as e:
+            log(f"⚠️ 応答キャッシュの読み込みエラー ({self.backend.name}): {e}")
+            return None
+
+    async def store(self, key, value, ttl=None):
+        try:
+            await self._offload(self.backend.set, shared_cache.make_key("response", *key), value, ttl or self.ttl)
+        except Exception as e:
+            log(f"⚠️ 応答キャッシュの書き込みエラー ({self.backend.name}): {e}")
+
+    # キャッシュになければ compute() を1回だけ実行し、同時に来た同じ質問はその結果を待つ
+    # 計算は独立した Task で行うので、最初のリクエストが切断されても他の待ち手には影響しない
+    # (例外になった結果と NoAnswer はキャッシュしない)
+    async def get_or_compute(self, key, compute, ttl=None):
+        task = self._inflight.get(key)
+        if task is None:
+            value = await self.fetch(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            task = self._inflight.get(key)   # 読み込みを待つ間に、同じ質問の計算が始まっていることがある
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute_and_store(key, compute, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key, compute, ttl):
+        value = await compute()
+        if not isinstance(value, NoAnswer):
+            await self.store(key, value, ttl)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+cache_backend = shared_cache.open_backend(maxsize=RESPONSE_CACHE_SIZE)
+
+# 共有キャッシュ (sqlite / redis) の読み書きはディスク・ネットワークを待つので、イベントループを止めないよう
+# スレッドプールで実行する (プロセス内の memory はそのまま呼ぶ)
+async def run_cache_io(func, *args):
+    if not cache_backend.blocking:
+        return func(*args)
+    return await run_blocking(func, *args)
+
+response_cache = ResponseCache(cache_backend, RESPONSE_CACHE_TTL, run_cache_io)
+
+# 言い換えに強いSQLキャッシュ: LLMが書いたSQLを似た質問に使い回す (結果はその都度、今のデータで実行する)
+# 共有キャッシュがあれば、他のワーカーが覚えたSQLも使う
+sql_cache = semantic_cache.SemanticCache(
+    backend=None if cache_backend.name == "memory" else cache_backend, offload=run_cache_io,
+)
+
+# 同じ質問とみなす条件 (選手・チーム・指標・並び順・日付・数字が全て一致するものだけを比べる)
+def query_slots(user_query, vocab, found):
+    names = tuple(sorted({(m.kind, m.source if m.kind == "team" else m.name) for m in vocab.resolver.find(user_query)}))
+    return (names, found.metric, found.ascending if found.metric else None, found.date, semantic_cache.numbers(user_query))
+
+# ==========================================
+# ★ アプリ起動・終了処理 ★
+# ==========================================
+# 複数ワーカーで動かす場合: uvicorn main:app --workers 4 (CACHE_URL で共有キャッシュを指定する)
+# 各ワーカーは起動時に下の準備を済ませてからリクエストを受け付ける (uvicorn は lifespan の完了を待つ)
+# 起動時に語彙・事前集計・読み取り用の接続・LLMクライアントを用意しておく (最初のリクエストを待たせない)
+async def warm_up():
+    started = time.perf_counter()
+    # 名前 -> (関数, DBを読むか)
+    steps = {
+        "語彙": (vocab_cache.get, True), "直接対決": (head_to_head_cache.get, True), "推移": (series_cache.get, True),
+        "接続": (lambda: read_pool.warm(DB_WORKERS), True),
+        "pandas": (lambda: importlib.import_module("pandas"), False),   # 最初のリクエストで読み込みを待たせない
+    }
+    if OPENAI_API_KEY:
+        # chat.completions は初回アクセス時に openai 内部の読み込みが走るので、ここで済ませておく
+        steps["LLMクライアント"] = (lambda: get_llm_client().chat.completions, False)
+    results = await asyncio.gather(
+        *((run_db_blocking if uses_db else run_blocking)(func) for func, uses_db in steps.values()),
+        return_exceptions=True,
+    )
+    done = dict(zip(steps, results))
+    for name, result in done.items():
+        if isinstance(result, Exception):
+            # DBがまだ無いなどの場合も起動は続け、/readyz で準備ができていないことを返す
+            log(f"⚠️ 起動準備 ({name}) に失敗: {result}")
+    vocab = done["語彙"] if isinstance(done["語彙"], Vocab) else EMPTY_VOCAB
+    log(f"📚 語彙読み込み: チーム {len(vocab.teams)} / 選手 {len(vocab.players)}")
+    log(f"🔥 起動準備 ({time.perf_counter() - started:.2f}s, pid {os.getpid()}, キャッシュ {cache_backend.name})")
+
+@asynccontextmanager
+async def lifespan(app):
+    await warm_up()
+    yield
+    read_pool.close()
+    db_watcher.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+)
+
+# ==========================================
+# ★ 計測 (/metrics) ★
+# ==========================================
+# リクエストごとにIDを振り (X-Request-ID があればそれを使う)、ログと応答ヘッダーに付ける
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = metrics.start_trace(request.headers.get("x-request-id"))
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.REQUESTS.inc(request.method, path, str(status))
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - trace.started, request.method, path)
+        # ストリーミングは応答ヘッダーを返した時点なので、全体の内訳は stream_chat の終わりに出す
+        if path == "/chat":
+            log(f"⏱ {request.method} {path} {status} {metrics.summarize(trace)}")
+
+def cache_counts():
+    counts = {}
+    for name, cache in (("response", response_cache), ("sql", safe_query), ("vocab", vocab_cache),
+                        ("head_to_head", head_to_head_cache), ("point_series", series_cache),
+                        ("semantic_sql", sql_cache)):
+        counts[(name, "hit")] = cache.hits
+        counts[(name, "miss")] = cache.misses
+    return counts
+
+metrics.callback("mleague_cache_requests_total", "キャッシュの参照数 (hit / miss)", "counter", ("cache", "result"), cache_counts)
+metrics.callback(
+    "mleague_prompt_tokens_total", "組み立てたプロンプトのトークン数の合計", "counter", ("prompt",),
+    lambda: {(name,): stat["tokens"] for name, stat in prompt_builder.prompt_stats.items()},
+)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def clean_sql(text):
+    return text.strip().replace("```sql", "").replace("```", "")
+
+# サーバー診断ページ (/debug)
+# テーブルを読み込まず、件数・最新日付は集計関数、DBの状態は PRAGMA と meta テーブルから取る
+def load_diagnostics(conn):
+    stats_count = conn.execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+    games_count, latest_date = conn.execute("SELECT COUNT(*), MAX(date) FROM games").fetchone()
+    pragma = {
+        name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in ("page_count", "page_size", "freelist_count", "journal_mode", "user_version", "data_version")
+    }
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('last_update', 'games_high_water', 'current_season')"))
+    except sqlite3.OperationalError:
+        meta = {}   # スキーマ移行前のDB
+    return {
+        "status": "OK",
+        "stats_count": stats_count,
+        "games_count": games_count,
+        "latest_date": latest_date or "なし",
+        "last_update": meta.get("last_update"),
+        "games_high_water": meta.get("games_high_water"),
+        "current_season": meta.get("current_season"),
+        "db": {
+            "size_bytes": pragma["page_count"] * pragma["page_size"],
+            **pragma,
+        },
+    }
+
+@app.get("/debug")
+async def debug_endpoint():
+    try:
+        if not os.path.exists(DB_NAME):
+            return {"status": "ERROR", "message": "DBファイルがありません"}
+        return await run_db(load_diagnostics)
+    except Exception as e:
+        return {"status": "ERROR", "detail": str(e)}
+
+# 死活監視 (/healthz): プロセスが応答できるかだけを見る (DBにも触らない)
+@app.get("/healthz")
+def healthz_endpoint():
+    return {"status": "ok"}
+
+# 準備完了の確認 (/readyz): APIキーと、DBから名簿を読めているか (語彙キャッシュが効くのでほぼ無負荷)、
+# 共有キャッシュに届くか
+@app.get("/readyz")
+async def readyz_endpoint():
+    checks = {"llm_key": bool(OPENAI_API_KEY), "db": False, "cache": False}
+    try:
+        vocab = await run_db_blocking(vocab_cache.get)
+        checks["db"] = bool(vocab.players)
+    except Exception as e:
+        log(f"readyz: DB確認エラー: {e}")
+    try:
+        checks["cache"] = await run_blocking(cache_backend.ping)
+    except Exception as e:
+        log(f"readyz: キャッシュ確認エラー ({cache_backend.name}): {e}")
+    ready = all(checks.values())
+    return JSONResponse({"status": "ready" if ready else "not_ready", "checks": checks}, status_code=200 if ready else 503)
+
+# 各モードの処理結果。DBでの集計までを済ませ、最後のLLM生成 (prompt) だけを残した状態
+# /chat はまとめて生成して返し、/chat/stream は graph・data を先に送ってからトークンを流す
+class ChatPlan(NamedTuple):
+    reply: str = ""                  # LLMを使わずに確定している本文 (生成結果の前に付く)
+    graph: Optional[dict] = None
+    prompt: Optional[str] = None     # 続けてLLMに生成させるプロンプト (None なら生成なし)
+    temperature: float = 0
+    data: Optional[list] = None      # ストリーミング時に先に送る集計表 (行のリスト)
+
+def df_records(df):
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+class ChatRequest(BaseModel):
+    message: str
+    commentary: bool = False  # 試合結果・順位にLLMの解説を付けるか (付けなければLLMを呼ばず即答)
+
+# ---------------------------------------------------------
+# 1. グラフ生成モード
+# ---------------------------------------------------------
+def load_point_history(sql):
+    import pandas as pd
+
+    df = run_generated_sql(sql)
+    if df.empty:
+        return df, df
+    df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.strftime('%Y/%m/%d')
+    df_grouped = df.groupby('date')['point'].sum().reset_index()
+    df_grouped['total_point'] = df_grouped['point'].cumsum()
+    return df, df_grouped
+
+# 質問中の選手・チームを (種別, 名前) のリストにする
+# 事前集計を使うのは選手のフルネームかチーム名・略称で書かれた場合だけ。姓だけ・あいまいな一致が混ざる場合は空 (LLMに任せる)
+def resolve_graph_targets(user_query, vocab):
+    targets = []
+    for m in vocab.resolver.find(user_query):
+        if not is_confident(m) or (m.kind == "player" and m.score < SCORE_EXACT):
+            return []
+        key = ("team", m.source) if m.kind == "team" else ("player", m.name)
+        if key not in targets:
+            targets.append(key)
+    return targets
+
+# 事前集計済みの推移を切り出してグラフにする。複数対象は日付を揃えて datasets に並べる
+# (labels / data / label は1件目の内容で、従来の1系列グラフとしても読める)
+def build_series_graph(series, targets):
+    found = [(name, series[(kind, name)]) for kind, name in targets if series.get((kind, name))]
+    if not found:
+        return None, ""
+    if len(found) == 1:
+        labels = [d for d, _, _ in found[0][1]]
+    else:
+        labels = sorted({d for _, points in found for d, _, _ in points})
+    datasets = []
+    for name, points in found:
+        totals = {d: total for d, _, total in points}
+        data = []
+        last = 0.0
+        for d in labels:
+            last = totals.get(d, last)
+            data.append(last)
+        datasets.append({"label": f"{name}の推移", "data": data})
+    graph_data = {"labels": labels, "data": datasets[0]["data"], "label": datasets[0]["label"], "datasets": datasets}
+    summary = "\n".join(
+        f"{name}: " + ", ".join(f"{d} {point:+.1f}pt (累計 {total:+.1f}pt)" for d, point, total in points[-5:])
+        for name, points in found
+    )
+    return graph_data, summary
+
+async def chat_graph(user_query, vocab, found):
+    # 対象が名簿から特定できれば、事前集計済みの推移を切り出すだけ (SQL生成もpandas集計もしない)
+    targets = await run_blocking(resolve_graph_targets, user_query, vocab)
+    if targets:
+        series = await run_db_blocking(series_cache.get)
+        graph_data, summary = build_series_graph(series, targets)
+        if graph_data:
+            log(f"📈 推移 (事前集計): {[name for _, name in targets]}")
+            final_prompt = prompt_builder.build("graph", f"""
+            Mリーグ実況者として解説してください。
+            質問: {user_query}
+            データ (直近5日): {summary}
+            「グラフをご覧ください」と添えてください。
+            """)
+            return ChatPlan(graph=graph_data, prompt=final_prompt, temperature=0.3)
+
+    # 特定できない場合は従来通り、LLMにSQLを書かせて集計する (言い換えキャッシュにあればそのSQLを使う)
+    slots = await run_blocking(query_slots, user_query, vocab, found)
+    cached = await sql_cache.lookup("graph", slots, user_query)
+    if cached:
+        try:
+            df, df_grouped = await run_db_blocking(load_point_history, cached.sql)
+        except Exception:
+            df = None
+        if df is not None and not df.empty:
+            log(f"♻️ SQLキャッシュ ({cached.score:.2f}「{cached.question}」): {cached.sql}")
+            return point_history_plan(user_query, cached.sql, df, df_grouped)
+        await sql_cache.discard("graph", slots, cached.sql)
+
+    player_names, team_names = roster_prompt(user_query, vocab)
+    id_prompt = prompt_builder.build("graph_sql", f"""
+    ユーザーは「ポイント推移」を知りたいです。質問: "{user_query}"
+    【正しい名前】チーム: {team_names} 選手: {player_names}
+    【指示】質問対象を特定し、LIKE検索のSQLを作成してください。
+    パターンA(チーム): SELECT date, point, player FROM games WHERE player IN (SELECT player FROM stats WHERE team LIKE '%キーワード%') ORDER BY date;
+    パターンB(個人): SELECT date, point, player FROM games WHERE player LIKE '%キーワード%' ORDER BY date;
+    回答はSQLのみ。
+    """)
+    sql = clean_sql(await ask_llm(id_prompt, temperature=0, stage="graph_sql"))
+
+    try:
+        df, df_grouped = await run_db_blocking(load_point_history, sql)
+    except Exception as e:
+        # 従来通り、SQLが失敗した場合は通常モードへフォールバック
+        log(f"グラフエラー: {e}")
+        return None
+
+    if df.empty:
+        return no_answer(f"データが見つかりませんでした。\n試行したSQL: `{sql}`")
+
+    await sql_cache.store("graph", slots, user_query, sql)
+    return point_history_plan(user_query, sql, df, df_grouped)
+
+def point_history_plan(user_query, sql, df, df_grouped):
+    label_name = "推移"
+    if "team" in sql.lower():
+        label_name = "チーム推移"
+    else:
+        label_name = f"{df['player'].iloc[0]}の推移"
+
+    graph_data = {
+        "labels": df_grouped['date'].tolist(),
+        "data": df_grouped['total_point'].tolist(),
+        "label": label_name
+    }
+    final_prompt = prompt_builder.build("graph", f"""
+    Mリーグ実況者として解説してください。
+    質問: {user_query}
+    データ (直近5日):
+    {prompt_builder.to_tsv(df_grouped.tail(5))}
+    「グラフをご覧ください」と添えてください。
+    """)
+    return ChatPlan(graph=graph_data, prompt=final_prompt, temperature=0.3)
+
+# ---------------------------------------------------------
+# 2. アナリストモード（勝敗予想・対戦成績）
+# ---------------------------------------------------------
+# 今期スタッツと調子 (update_db.py が作る player_form) を1回の JOIN で読む
+# player_form がまだ無いDBでは、対象選手の games から同じ列をその場で集計する
+def load_analyst_data(conn, target_names):
+    import pandas as pd
+
+    placeholders = ",".join(["?"] * len(target_names))
+    stats_cols = ", ".join(f"s.{c}" for c in ANALYST_COLUMNS)
+    form_cols = ", ".join(f"f.{c}" for c in FORM_COLUMNS if c != "player")
+    try:
+        sql = (
+            f"SELECT {stats_cols}, {form_cols} FROM stats s LEFT JOIN player_form f ON f.player = s.player "
+            f"WHERE s.player IN ({placeholders})"
+        )
+        return pd.read_sql_query(sql, conn, params=target_names)
+    except (sqlite3.OperationalError, pd.errors.DatabaseError):
+        df_stats = pd.read_sql_query(f"SELECT * FROM stats WHERE player IN ({placeholders})", conn, params=target_names)
+        rows = conn.execute(
+            f"SELECT date, game_count, player, rank, point FROM games WHERE player IN ({placeholders})", target_names
+        ).fetchall()
+        form, _ = precompute.build_player_form(rows)
+        return df_stats[[c for c in ANALYST_COLUMNS if c in df_stats.columns]].merge(form, on="player", how="left")
+
+# 予想・比較に使う指標 (プロンプトにはこの列だけを載せる)
+ANALYST_COLUMNS = ["player", "team", "matches", "points", "avg_rank", "top_rate", "last_avoid_rate",
+                   "agari_rate", "hoju_rate", "riichi_rate", "furo_rate", "avg_score"]
+# 調子 (last5_ranks は新しい順、streak は +連対の連続 / -3・4着の連続、momentum は直近5戦の平均pt − 通算の平均pt)
+FORM_COLUMNS = ["player", "last5_ranks", "last5_points", "last10_avg_rank", "streak", "no_last_streak", "momentum"]
+
+# 名簿のうち質問に関係しそうな部分だけをプロンプトに載せる (選手, チーム のカンマ区切り)
+def roster_prompt(user_query, vocab):
+    return prompt_builder.roster_slice(user_query, vocab.players, vocab.teams, vocab.player_team)
+
+async def extract_names_llm(user_query, vocab):
+    player_names, _ = roster_prompt(user_query, vocab)
+    extract_prompt = prompt_builder.build("extract_names", f"""
+    ユーザーの質問から、分析対象となる「選手名」を全て抽出してください。
+    質問: "{user_query}"
+    【選手名簿】{player_names}
+    回答は選手名をカンマ区切りで出すだけ。（例: 多井隆晴, 伊達朱里紗）
+    もしチーム名が書かれていたら、そのチームの代表的な選手を1名選んでください。
+    """)
+    names_text = await ask_llm(extract_prompt, temperature=0, stage="extract_names")
+    return to_roster_names([n.strip() for n in names_text.split(',') if n.strip()], vocab)
+
+# LLMが返した名前を名簿上の正式名に揃える (略称・表記ゆれ対策)
+def to_roster_names(names, vocab):
+    result = []
+    for name in names:
+        if name not in vocab.player_set:
+            found, _ = vocab.resolver.resolve_players(name)
+            name = found[0] if found else name
+        if name not in result:
+            result.append(name)
+    return result
+
+async def chat_analyst(user_query, vocab, found):
+    # まずはローカルの名前解決で選手を特定し、確信が持てない場合だけ LLM に抽出させる
+    target_names, confident = await run_blocking(
+        partial(vocab.resolver.resolve_players, user_query, check_unresolved=True)
+    )
+    if confident:
+        log(f"🔎 ローカル解決: {target_names}")
+    else:
+        target_names = await extract_names_llm(user_query, vocab)
+
+    if not target_names:
+        return no_answer("分析対象の選手名が特定できませんでした。")
+
+    df = await run_db(load_analyst_data, target_names)
+
+    final_prompt = prompt_builder.build("analyst", f"""
+    あなたはMリーグのプロアナリストです。
+    ユーザーの質問: "{user_query}"
+
+    以下の「客観的なデータ」を元に、論理的な分析・予想を行ってください。
+
+    【対象選手の今期スタッツ】
+    {prompt_builder.to_tsv(df, ANALYST_COLUMNS)}
+
+    【対象選手の直近成績（勢い）】
+    last5_ranks は直近5戦の着順 (新しい順)、streak は +なら連対・−なら3着以下の連続試合数、momentum は直近5戦の平均ポイントと通算平均の差
+    {prompt_builder.to_tsv(df, FORM_COLUMNS)}
+
+    【指示】
+    - 「勝敗予想」の場合は、スタッツ（平均着順やポイント）と直近の勢いを総合して、最も勝率が高そうな選手を1名挙げ、理由を解説してください。
+    - 「対戦成績・相性」の場合は、それぞれのデータの強み（攻撃型か守備型かなど）を比較してください。
+    - 最後に必ず「※データに基づく予想であり、結果を保証するものではありません」と注釈を入れてください。
+    """)
+    return ChatPlan(prompt=final_prompt, temperature=0.7, data=df_records(df))
+
+# ---------------------------------------------------------
+# 3. 最新結果・順位モード（個人ランキング対応 ＆ 試合結果強制分割）
+# ---------------------------------------------------------
+def load_player_ranking(conn):
+    import pandas as pd
+
+    # statsテーブルからポイント順に全選手を取得
+    sql_stats = "SELECT player, team, points FROM stats ORDER BY points DESC"
+    return pd.read_sql_query(sql_stats, conn)
+
+# table: 今シーズンなら games、過去のシーズンの日付なら games_all
+def load_results(conn, target_date, table="games"):
+    import pandas as pd
+
+    if target_date:
+        # match_id順に取得 (スキーマ移行前のDBは "2025/10/14" 形式なので両方で引く)
+        sql_games = f"""
+        SELECT match_id, date, game_count, rank, player, point
+        FROM {table}
+        WHERE date IN (?, ?)
+        ORDER BY game_count ASC, match_id ASC, rank ASC
+        """
+        try:
+            df_games = pd.read_sql_query(sql_games, conn, params=[target_date, target_date.replace("-", "/")])
+        except pd.errors.DatabaseError:
+            df_games = pd.DataFrame()   # games_all が無いDB (過去のシーズンを持っていない)
+    else:
+        # 日付指定がない場合
+        sql_games = "SELECT match_id, date, game_count, rank, player, point FROM games ORDER BY date DESC, game_count DESC, rank ASC LIMIT 8"
+        df_games = pd.read_sql_query(sql_games, conn)
+
+    # チーム順位
+    sql_ranking = "SELECT rank, team, point FROM team_ranking ORDER BY rank"
+    df_ranking = pd.read_sql_query(sql_ranking, conn)
+    return df_games, df_ranking
+
+async def build_results_reply(user_query, vocab, commentary=False):
+    # =================================================
+    # パターンA: 個人ランキングを聞かれた場合
+    # =================================================
+    if "個人" in user_query and ("順位" in user_query or "ランキング" in user_query):
+        df_stats = await run_db(load_player_ranking)
+
+        if df_stats.empty:
+            return no_answer("個人成績データが見つかりませんでした。")
+
+        # ランキング表を作成（テキスト整形）
+        ranking_text = "【現在の個人ポイントランキング】\n"
+        for i, row in df_stats.iterrows():
+            # 順位に応じたアイコン
+            rank = i + 1
+            icon = "👑" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else "💀" if rank == len(df_stats) else f"{rank}位"
+
+            # 30位くらいまで表示すると長いので、上位と下位をピックアップするか、
+            # シンプルに全件リストとして返す（スクロールで見る前提）
+            # ここでは見やすさ重視で全件出します
+            ranking_text += f"{icon} {row['player']} ({row['team']}): {row['points']:+.1f}pt\n"
+
+        return {"reply": ranking_text, "graph": None}
+
+    # =================================================
+    # パターンB: 試合結果・チーム順位（既存ロジック）
+    # =================================================
+    # 日付指定があるかチェック
+    date_match = re.search(r'(?:(\d{4})年)?(\d{1,2})月(\d{1,2})日', user_query)
+
+    target_date = None
+    target_display_date = "直近"
+    table = "games"
+
+    if date_match:
+        month = int(date_match.group(2))
+        day = int(date_match.group(3))
+        if date_match.group(1):
+            target_date = f"{date_match.group(1)}-{month:02d}-{day:02d}"
+            target_display_date = f"{date_match.group(1)}年{month}月{day}日"
+        else:
+            # 年がなければ今シーズンの日付とみなす
+            target_date = precompute.season_date(vocab.season, month, day) if vocab.season else None
+            target_display_date = f"{month}月{day}日"
+        if target_date and precompute.season_of(target_date) != vocab.season:
+            table = "games_all"
+
+    df_games, df_ranking = await run_db(load_results, target_date, table)
+
+    # --- 試合結果の整形処理 ---
+    if df_games.empty:
+        game_result_text = f"申し訳ありません。{target_display_date}の試合データが見つかりませんでした。"
+    else:
+        formatted_results = []
+        # 1.「第1回戦」「第2回戦」で分ける
+        for game_cnt, group_gc in df_games.groupby('game_count'):
+            # 2.「卓」で分ける
+            sub_groups = [g for _, g in group_gc.groupby('match_id', sort=False)]
+
+            # 安全装置: 4人区切り
+            final_groups = []
+            for sub_g in sub_groups:
+                if len(sub_g) > 4:
+                    for i in range(0, len(sub_g), 4):
+                        final_groups.append(sub_g.iloc[i:i+4])
+                else:
+                    final_groups.append(sub_g)
+
+            # 3. テキスト生成
+            for idx, table_df in enumerate(final_groups):
+                table_suffix = chr(65 + idx) # A, B...
+                # 日付指定がない場合(直近)は日付も入れる
+                date_str = f" ({table_df.iloc[0]['date'][5:].replace('-', '/')})" if not date_match else ""
+                # game_count は「第1回戦」の形で保存されている (数字だけの古いデータにも対応)
+                game_label = game_cnt if "回戦" in str(game_cnt) else f"第{game_cnt}回戦"
+                header = f"■ {game_label} ({table_suffix}卓){date_str}"
+
+                rows_text = ""
+                for _, row in table_df.iterrows():
+                    rank_icon = ["🥇","🥈","🥉","4️⃣"][int(row['rank'])-1] if 1 <= int(row['rank']) <= 4 else ""
+                    rows_text += f"{rank_icon} {int(row['rank'])}位: {row['player']} ({row['point']:+.1f}pt)\n"
+
+                formatted_results.append(f"{header}\n{rows_text}")
+
+        game_result_text = f"【{target_display_date}の試合結果】\n\n" + "\n".join(formatted_results)
+
+    ranking_text = "".join(f"{int(row['rank'])}位 {row['team']}: {row['point']:+.1f}pt\n" for _, row in df_ranking.iterrows())
+    combined_data = f"{game_result_text}\n\n----------------\n【現在のチーム順位】\n{ranking_text}"
+
+    # 整形済みのテキストをそのまま返す (LLMに「そのまま表示」させる往復は不要)
+    if not commentary:
+        return {"reply": combined_data, "graph": None}
+
+    # 解説が欲しい場合だけ、データの後ろに短いコメントを付け足す
+    final_prompt = prompt_builder.build("results", f"""
+    あなたはMリーグの公式リポーターです。
+    質問「{user_query}」に対し、以下の試合結果とチーム順位の見どころを2〜3文で短くコメントしてください。
+    データの再掲は不要です。
+
+    【データ】
+    {combined_data}
+    """)
+    comment = await ask_llm(final_prompt, temperature=0, stage="results")
+    return {"reply": f"{combined_data}\n{comment}", "graph": None}
+
+
+# 試合結果・順位は決定的な応答 (解説付きも temperature 0) なので、DBが更新されるまで使い回す
+async def chat_results(user_query, vocab, commentary=False):
+    try:
+        key = (normalize_query(user_query), "results", commentary, shared_version(vocab))
+        return await response_cache.get_or_compute(key, lambda: build_results_reply(user_query, vocab, commentary))
+    except Exception as e:
+        log(f"Error: {e}")
+        return no_answer(f"データ取得エラー: {e}")
+
+# ---------------------------------------------------------
+# 4. ★直接対決・全記録モード（match_id 対応版）
+# ---------------------------------------------------------
+# 直接対決マトリクスから p1 視点の記録を引き、従来と同じ列の表にする
+def load_matchup(p1_name, p2_name):
+    import pandas as pd
+
+    rec = precompute.lookup_head_to_head(head_to_head_cache.get(), p1_name, p2_name)
+    if rec is None:
+        return None, pd.DataFrame()
+    df_match = pd.DataFrame(
+        [(m["date"], m["game_count"], p1_name, m["rank_a"], m["point_a"], p2_name, m["rank_b"], m["point_b"])
+         for m in rec["matches"]],
+        columns=["日付", "回戦", "選手A", "着順A", "PtA", "選手B", "着順B", "PtB"],
+    )
+    return rec, df_match
+
+async def chat_matchup(user_query, vocab, found):
+    # Step A: 対戦する2名を特定 (ローカル解決で2名揃わなければ LLM に抽出させる)
+    names, confident = await run_blocking(vocab.resolver.resolve_players, user_query, 2)
+    if confident:
+        log(f"🔎 ローカル解決: {names}")
+    else:
+        player_names, _ = roster_prompt(user_query, vocab)
+        extract_prompt = prompt_builder.build("extract_names", f"""
+        ユーザーの質問から「対戦成績を比較したい2名の選手名」を抽出してください。
+
+        質問: "{user_query}"
+        【選手名簿】{player_names}
+
+        回答は選手名をカンマ区切りで出すだけ。（例: 多井隆晴, 鈴木優）
+        """)
+        names_text = await ask_llm(extract_prompt, temperature=0, stage="extract_names")
+        names = to_roster_names([n.strip() for n in names_text.split(',') if n.strip()], vocab)
+
+    if len(names) < 2:
+        return no_answer("対戦する2名の選手名が見つかりませんでした。「多井隆晴と鈴木優の対戦成績」のように聞いてみてください。")
+
+    p1_name = names[0]
+    p2_name = names[1]
+
+    rec, df_match = await run_db_blocking(load_matchup, p1_name, p2_name)
+
+    if rec is None:
+         return no_answer(f"データ上、{p1_name}選手と{p2_name}選手の直接対決は見つかりませんでした。")
+
+    # Step C: 結果をAIに解説させる
+    # 選手名の列は毎行同じなので落とし、履歴は新しい順に MAX_TABLE_ROWS 戦まで載せる
+    final_prompt = prompt_builder.build("matchup", f"""
+    あなたはMリーグのデータアナリストです。
+    ユーザーの質問「{user_query}」に対し、以下の「直接対決の全記録」を元に解説してください。
+
+    【直接対決データ ({rec["games"]}戦)】
+    先着数: {p1_name} {rec["a_ahead"]}回 / {p2_name} {rec["b_ahead"]}回
+    合計ポイント: {p1_name} {rec["a_points"]:+.1f}pt / {p2_name} {rec["b_points"]:+.1f}pt (差 {rec["point_diff"]:+.1f}pt)
+    (A: {p1_name} / B: {p2_name}、新しい順)
+    {prompt_builder.to_tsv(df_match, ["日付", "回戦", "着順A", "PtA", "着順B", "PtB"])}
+
+    【出力ルール】
+    1. **「トータルでどちらが勝ち越しているか（先着数など）」** をまず結論として述べてください。
+    2. その後、**対戦履歴のリスト** を見やすく表示してください。
+       例:
+       📅 11/21 第1試合
+       👊 **多井** (1位 +50.0) vs **鈴木** (3位 -20.0)
+    3. 最後に「どちらが得意としているか」の相性分析を添えてください。
+    """)
+    return ChatPlan(prompt=final_prompt, temperature=0.5, data=df_records(df_match))
+
+# ---------------------------------------------------------
+# 5. 通常モード（★ここを最強の有能AIに改造しました！）
+# ---------------------------------------------------------
+# 集計結果を実況風に解説させるプロンプト (通常モード・定型クエリ共通)
+def stats_commentary_prompt(user_query, df):
+    return prompt_builder.build("commentary", f"""
+    あなたは熱狂的かつ知的なMリーグ実況解説者です。
+    質問: {user_query}
+    データ:
+    {prompt_builder.to_tsv(df)}
+
+    【解説のルール】
+    1. **数値を読むだけの実況は二流です。** その数値が何を意味するかを熱く語ってください。
+       - 例: 「放銃率0.08」→「放銃率はわずか8%！これは驚異的な守備力、まさに鉄壁ですね！」
+       - 例: 「平均着順2.1」→「2.1という数字は、圧倒的な強さの証明です。」
+
+    2. **見やすさは命です。**
+       - 重要な数字は **太字** に。
+       - 項目ごとに改行し、箇条書き(・)を使ってください。
+       - 絵文字（🀄, 🔥, 🛡️, 📊, ⚡）を適度に使って雰囲気を盛り上げてください。
+
+    3. **数値の変換**
+       - 率(rate)のデータは小数(0.25など)なので、必ず **100倍して%表記(25%)** に直してください。
+       - ポイントのマイナスは「▲」を使ってください。
+    """)
+
+def load_query(sql):
+    import pandas as pd
+
+    try:
+        return run_generated_sql(sql)
+    except (db.UnsafeQueryError, sqlite3.Error) as e:
+        log(f"通常SQLエラー: {e}")
+        return pd.DataFrame()
+
+async def chat_sql(user_query, vocab, found):
+    # 言い換えキャッシュに似た質問のSQLがあれば、SQL生成を飛ばして今のデータで実行する
+    slots = await run_blocking(query_slots, user_query, vocab, found)
+    cached = await sql_cache.lookup("sql", slots, user_query)
+    if cached:
+        df_result = await run_db_blocking(load_query, cached.sql)
+        if not df_result.empty:
+            log(f"♻️ SQLキャッシュ ({cached.score:.2f}「{cached.question}」): {cached.sql}")
+            return ChatPlan(prompt=stats_commentary_prompt(user_query, df_result), temperature=0.5, data=df_records(df_result))
+        await sql_cache.discard("sql", slots, cached.sql)
+
+    table_info = f"""
+    【テーブル定義書】
+    ※ stats / games / team_ranking は今シーズン ({vocab.season}) の分だけ。過去のシーズンも含めるときは
+      stats_all / games_all / team_ranking_all を使い、season 列 ('2024-25' 形式) で絞る。日付は 'YYYY-MM-DD'。
+    1. stats (個人通算成績)
+       - player: 選手名
+       - team: チーム名
+       - points: 通算ポイント (重要指標)
+       - matches: 試合数
+       - avg_rank: 平均着順 (2.5より小さければ優秀)
+       - rank_1_count: 1位回数
+       - top_rate: トップ率
+       - last_avoid_rate: ラス回避率 (高いほど守備的)
+       - best_score: 最高スコア
+       - avg_score: 平均打点
+       - riichi_rate: リーチ率
+       - agari_rate: 和了率
+       - hoju_rate: 放銃率 (低いほど守備的)
+       - furo_rate: 副露率 (鳴き率)
+    2. player_form (選手の調子) - player, last5_ranks (直近5戦の着順・新しい順), last5_points, last10_avg_rank, streak (+連対/−3着以下の連続数), momentum
+    3. player_season (シーズン別成績) - player, season ('2024-25' 形式), games, points, avg_rank, top_rate, last_avoid_rate
+    """
+
+    player_names, team_names = roster_prompt(user_query, vocab)
+    sql_prompt = prompt_builder.build("sql", f"""
+    あなたは世界一のMリーグデータアナリストです。
+    質問「{user_query}」に対し、最も分析に適したデータを抽出するSQLを作成してください。
+
+    【正しい名前リスト】
+    選手: {player_names}
+    チーム: {team_names}
+
+    {table_info}
+
+    【SQL作成の極意】
+    1. ユーザーの入力をリストの名前に脳内変換し、必ず LIKE 検索を使ってください。
+    2. 「スタッツ」や「成績」と聞かれたら、ケチらずに主要な指標（points, avg_rank, agari_rate, hoju_rate, riichi_rate, furo_rate, avg_score）を全てSELECTしてください。
+    3. 「強いのは誰？」のような抽象的な質問なら、points や avg_rank でソートして上位5名を出してください。
+
+    回答はSQLのみ。
+    """)
+    gen_sql = clean_sql(await ask_llm(sql_prompt, temperature=0, stage="sql"))
+    log(f"💬 通常SQL: {gen_sql}")
+
+    df_result = await run_db_blocking(load_query, gen_sql)
+
+    if df_result.empty:
+         return no_answer(f"該当データが見当たりませんでした。\n(実行SQL: `{gen_sql}`)")
+
+    await sql_cache.store("sql", slots, user_query, gen_sql)
+    return ChatPlan(prompt=stats_commentary_prompt(user_query, df_result), temperature=0.5, data=df_records(df_result))
+
+# ---------------------------------------------------------
+# 6. 定型クエリモード（指標のランキング・選手/チームの指標）
+# ---------------------------------------------------------
+# 意図判定で指標と対象が取れた質問は、SQLを生成させずに決まった形のクエリで答える (LLMは解説の1回だけ)
+STAT_COLUMNS = ["points", "avg_rank", "agari_rate", "hoju_rate", "riichi_rate", "furo_rate", "avg_score"]
+
+def load_stat_ranking(conn, metric, ascending, limit, teams):
+    import pandas as pd
+
+    conds = [f"{metric} IS NOT NULL"]
+    if teams:
+        conds.append(f"team IN ({', '.join(['?'] * len(teams))})")
+    extra = ", matches" if metric != "matches" else ""
+    sql = (
+        f"SELECT player, team, {metric}{extra} FROM stats WHERE {' AND '.join(conds)} "
+        f"ORDER BY {metric} {'ASC' if ascending else 'DESC'} LIMIT ?"
+    )
+    return pd.read_sql_query(sql, conn, params=[*teams, limit])
+
+def load_stat_lookup(conn, columns, players, teams):
+    import pandas as pd
+
+    conds = []
+    if players:
+        conds.append(f"player IN ({', '.join(['?'] * len(players))})")
+    if teams:
+        conds.append(f"team IN ({', '.join(['?'] * len(teams))})")
+    sql = f"SELECT player, team, {', '.join(columns)} FROM stats WHERE {' OR '.join(conds)} ORDER BY points DESC"
+    return pd.read_sql_query(sql, conn, params=[*players, *teams])
+
+async def chat_stats(user_query, vocab, found):
+    if found.name == "stat_ranking":
+        log(f"📋 定型クエリ: {found.metric} の{'昇順' if found.ascending else '降順'} (上位{found.limit})")
+        df = await run_db(load_stat_ranking, found.metric, found.ascending, found.limit, list(found.teams))
+    else:
+        columns = [found.metric] if found.metric else STAT_COLUMNS
+        log(f"📋 定型クエリ: {list(found.players) + list(found.teams)} の {columns}")
+        df = await run_db(load_stat_lookup, columns, list(found.players), list(found.teams))
+    if df.empty:
+        return no_answer("該当データが見当たりませんでした。")
+    return ChatPlan(prompt=stats_commentary_prompt(user_query, df), temperature=0.5, data=df_records(df))
+
+# 各モードは (質問, 語彙, 意図) を受け取る
+CHAT_HANDLERS = {
+    "graph": chat_graph,
+    "analyst": chat_analyst,
+    "matchup": chat_matchup,
+}
+
+# 質問をモードに振り分け、ChatPlan (または確定済みの応答 dict) を返す
+# vocab: まとめて質問する場合は、全ての質問で同じ語彙を使う
+async def plan_chat(user_query, commentary=False, vocab=None):
+    if vocab is None:
+        vocab = await get_vocab()
+
+    # 意図とスロット (選手・チーム・日付・指標) をローカルで判定
+    # (名前のあいまい一致は文字数に比例して重いので、イベントループを止めないようスレッドで実行)
+    with span("intent"):
+        found = await run_blocking(intent.classify, user_query, vocab.resolver)
+    mode = found.name
+    log(f"🧭 意図: {mode} ({found.score:.1f})")
+    with span(f"mode.{mode}"):
+        if mode == "results":
+            return await chat_results(user_query, vocab, commentary)
+        if mode in ("stat_ranking", "stat_lookup"):
+            return await chat_stats(user_query, vocab, found)
+        handler = CHAT_HANDLERS.get(mode)
+        if handler is None:
+            return await chat_sql(user_query, vocab, found)
+        result = await handler(user_query, vocab, found)
+        if result is not None:
+            return result
+    # SQLエラーなどで各モードが答えられなかった場合は通常モード
+    with span("mode.sql.fallback"):
+        return await chat_sql(user_query, vocab, found)
+
+# 語彙はキャッシュから取得 (DB更新時のみ読み直し)
+async def get_vocab():
+    with span("vocab"):
+        return await run_db_blocking(vocab_cache.get)
+
+# 事前に作っておいた回答 (/chat/batch の precompute)。DBが更新されるとキーが変わり、使われなくなる
+def precomputed_key(user_query, commentary, vocab):
+    return (normalize_query(user_query), "precomputed", commentary, shared_version(vocab))
+
+async def find_precomputed(user_query, commentary, vocab):
+    answer = await response_cache.fetch(precomputed_key(user_query, commentary, vocab))
+    if answer is not None:
+        response_cache.hits += 1   # 事前計算が無い質問は数えない (応答キャッシュの miss を水増ししない)
+        log(f"♻️ 事前計算済みの回答: {user_query}")
+    return answer
+
+# precomputed: 事前計算済みの回答を探す (/chat/batch の precompute は呼ぶ前に同じキーを見ているので False)
+async def answer_chat(user_query, commentary=False, vocab=None, precomputed=True):
+    if vocab is None:
+        vocab = await get_vocab()
+    answer = await find_precomputed(user_query, commentary, vocab) if precomputed else None
+    if answer is not None:
+        return answer
+    plan = await plan_chat(user_query, commentary, vocab)
+    if isinstance(plan, dict):
+        return plan
+    reply = plan.reply
+    if plan.prompt:
+        reply += await ask_llm(plan.prompt, temperature=plan.temperature)
+    return {"reply": reply, "graph": plan.graph}
+
+# クライアントが切断したら処理中のタスクを止める (LLM待ち・DB処理ごとキャンセル)
+async def cancel_on_disconnect(request, task):
+    while not task.done():
+        if await request.is_disconnected():
+            task.cancel()
+            return
+        await asyncio.sleep(0.5)
+
+# 試合結果・順位 (解説なし) はLLMを使わないので、APIキーがなくても答えられる
+async def needs_llm(message, commentary, vocab=None):
+    if commentary:
+        return True
+    if vocab is None:
+        vocab = await run_db_blocking(vocab_cache.get)
+    return (await run_blocking(intent.classify, message, vocab.resolver)).name != "results"
+
+@app.post("/chat")
+async def chat_endpoint(req: ChatRequest, request: Request):
+    if not OPENAI_API_KEY and await needs_llm(req.message, req.commentary):
+        return {"reply": "【エラー】APIキーが設定されていません。", "graph": None}
+
+    task = asyncio.ensure_future(asyncio.wait_for(answer_chat(req.message, req.commentary), CHAT_TIMEOUT))
+    watcher = asyncio.ensure_future(cancel_on_disconnect(request, task))
+    try:
+        return await task
+    except asyncio.TimeoutError:
+        return {"reply": "【エラー】処理がタイムアウトしました。時間をおいて再度お試しください。", "graph": None}
+    except asyncio.CancelledError:
+        if not watcher.done():
+            raise
+        # クライアント切断によるキャンセル (返しても届かないので空で終了)
+        return {"reply": "", "graph": None}
+    except Exception as e:
+        return {"reply": f"エラー: {str(e)}", "graph": None}
+    finally:
+        watcher.cancel()
+
+# ---------------------------------------------------------
+# ストリーミング版 (/chat/stream, Server-Sent Events)
+# ---------------------------------------------------------
+# イベントの順番: graph (あれば) → data (LLMを使わずに確定した本文・集計表) → token (生成中の文字列) … → done
+# done には /chat と同じ {"reply", "graph"} が入る。失敗時は error を送って終了する
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def stream_chat(user_query, commentary=False):
+    try:
+        async with asyncio.timeout(CHAT_TIMEOUT):
+            vocab = await get_vocab()
+            plan = await find_precomputed(user_query, commentary, vocab) or await plan_chat(user_query, commentary, vocab)
+            if isinstance(plan, dict):
+                plan = ChatPlan(reply=plan["reply"], graph=plan["graph"])
+            if plan.graph is not None:
+                yield sse("graph", plan.graph)
+            if plan.reply or plan.data is not None:
+                yield sse("data", {"text": plan.reply, "rows": plan.data})
+            reply = plan.reply
+            if plan.prompt:
+                async for token in ask_llm_stream(plan.prompt, temperature=plan.temperature):
+                    reply += token
+                    yield sse("token", {"text": token})
+            yield sse("done", {"reply": reply, "graph": plan.graph})
+    except TimeoutError:
+        yield sse("error", {"message": "【エラー】処理がタイムアウトしました。時間をおいて再度お試しください。"})
+    except Exception as e:
+        yield sse("error", {"message": f"エラー: {str(e)}"})
+    finally:
+        trace = metrics.current_trace()
+        if trace is not None:
+            log(f"⏱ POST /chat/stream 完了 {metrics.summarize(trace)}")
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    if not OPENAI_API_KEY and await needs_llm(req.message, req.commentary):
+        stream = iter([sse("error", {"message": "【エラー】APIキーが設定されていません。"})])
+    else:
+        stream = stream_chat(req.message, req.commentary)
+    # クライアントが切断すると StreamingResponse がジェネレーターごと止める
+    return StreamingResponse(
+        stream, media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------------------------------------------------
+# まとめて質問 (/chat/batch)
+# ---------------------------------------------------------
+# 1ターンに複数の質問が来る場合や、試合日の夜によくある質問の回答を作っておく場合に使う。
+# 同じ質問 (正規化して一致するもの) は1回だけ処理し、語彙は全ての質問で同じものを使う。
+# DB接続はプールの接続を使い回し、同時に処理する質問数 (= LLMの同時呼び出し数) は BATCH_CONCURRENCY まで。
+# 結果は質問と同じ順番で返す。
+# precompute: 回答を保存し、DBが更新されるまで /chat・/chat/stream の同じ質問にそのまま返す
+# (データなし・エラーの応答は保存しない)
+BATCH_MAX = int(os.getenv("BATCH_MAX", "50"))                     # 1回に受け付ける質問数
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))      # 同時に処理する質問数
+PRECOMPUTE_TTL = float(os.getenv("PRECOMPUTE_TTL", "86400"))      # 事前計算した回答を保持する秒数
+
+class ChatBatchRequest(BaseModel):
+    messages: list[str]
+    commentary: bool = False
+    precompute: bool = False
+
+async def answer_batch(messages, commentary=False, precompute=False):
+    vocab = await get_vocab()
+    unique = {}   # 正規化した質問 -> 最初に出てきた質問文
+    for message in messages:
+        unique.setdefault(normalize_query(message), message)
+    log(f"📦 まとめて質問: {len(messages)} 件 (重複を除いて {len(unique)} 件)")
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer_one(message):
+        async with semaphore:
+            if not OPENAI_API_KEY and await needs_llm(message, commentary, vocab):
+                return {"reply": "【エラー】APIキーが設定されていません。", "graph": None}
+            compute = lambda: asyncio.wait_for(answer_chat(message, commentary, vocab, not precompute), CHAT_TIMEOUT)
+            try:
+                if precompute:
+                    key = precomputed_key(message, commentary, vocab)
+                    return await response_cache.get_or_compute(key, compute, PRECOMPUTE_TTL)
+                return await compute()
+            except asyncio.TimeoutError:
+                return {"reply": "【エラー】処理がタイムアウトしました。時間をおいて再度お試しください。", "graph": None}
+            except Exception as e:
+                return {"reply": f"エラー: {str(e)}", "graph": None}
+
+    answers = dict(zip(unique, await asyncio.gather(*(answer_one(m) for m in unique.values()))))
+    return [answers[normalize_query(message)] for message in messages]
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: ChatBatchRequest, request: Request):
+    if len(req.messages) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"質問は1回に {BATCH_MAX} 件までです")
+
+    task = asyncio.ensure_future(answer_batch(req.messages, req.commentary, req.precompute))
+    watcher = asyncio.ensure_future(cancel_on_disconnect(request, task))
+    try:
+        return {"results": await task}
+    except asyncio.CancelledError:
+        if not watcher.done():
+            raise
+        return {"results": []}
+    finally:
+        watcher.cancel()
@@ -0,0 +1,183 @@
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# ==========================================
+# ★ 計測 (Prometheus 形式の /metrics 用) ★
+# ==========================================
+# 処理段階ごとの所要時間、LLMの待ち時間とトークン数、DB処理時間、キャッシュのヒット率を集計する。
+# 追加の依存は入れず、Prometheus のテキスト形式は自前で出力する。
+# リクエストIDは contextvars で引き回し、log() の出力に付ける。
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_metrics = {}   # 名前 -> Counter / Histogram (登録順に出力する)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_number(total)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}   # ラベル -> [各バケットの件数..., 合計, 件数]
+
+    def observe(self, value, *label_values):
+        with _lock:
+            state = self._values.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for values, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets + (float("inf"),), state[:len(self.buckets)] + [state[-1]]):
+                    labels = _format_labels(self.labels, values, [("le", _format_number(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {_format_number(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {state[-1]}")
+        return lines
+
+# 値を持たず、出力のたびに fn() を呼んで {ラベル値のタプル: 値} を読む (キャッシュのヒット数など)
+class Callback:
+    def __init__(self, name, help_text, kind, labels, fn):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        self._fn = fn
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._fn().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_number(value)}")
+        return lines
+
+def _register(metric):
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+def counter(name, help_text, labels=()):
+    return _register(Counter(name, help_text, labels))
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+def callback(name, help_text, kind, labels, fn):
+    return _register(Callback(name, help_text, kind, labels, fn))
+
+def render():
+    with _lock:
+        metrics = list(_metrics.values())
+    return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+# ---------------------------------------------------------
+# 共通の指標
+# ---------------------------------------------------------
+REQUESTS = counter("mleague_http_requests_total", "HTTPリクエスト数", ("method", "path", "status"))
+REQUEST_SECONDS = histogram("mleague_http_request_seconds", "HTTPリクエストの処理時間", ("method", "path"))
+STAGE_SECONDS = histogram("mleague_stage_seconds", "/chat の処理段階ごとの所要時間", ("stage",))
+LLM_SECONDS = histogram("mleague_llm_seconds", "LLM呼び出しの所要時間", ("stage",))
+LLM_TOKENS = counter("mleague_llm_tokens_total", "LLMのトークン数", ("stage", "kind"))
+LLM_ERRORS = counter("mleague_llm_errors_total", "LLM呼び出しの失敗数", ("stage",))
+DB_SECONDS = histogram(
+    "mleague_db_seconds", "DB処理 (run_db の関数と、生成SQLの実行) の所要時間", ("func",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+OFFLOAD_SECONDS = histogram(
+    "mleague_offload_seconds", "DB以外のスレッド上の処理 (意図判定・名前解決・キャッシュ入出力など) の所要時間", ("func",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# ---------------------------------------------------------
+# リクエストIDと処理段階の記録
+# ---------------------------------------------------------
+class Trace:
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []   # (段階, 秒)
+
+_trace = contextvars.ContextVar("mleague_trace", default=None)
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+def start_trace(request_id=None):
+    trace = Trace(request_id or new_request_id())
+    _trace.set(trace)
+    return trace
+
+def current_trace():
+    return _trace.get()
+
+def current_request_id():
+    trace = _trace.get()
+    return trace.request_id if trace else None
+
+# print() の代わりに使う。リクエスト処理中ならリクエストIDを先頭に付ける
+def log(message):
+    request_id = current_request_id()
+    print(f"[{request_id}] {message}" if request_id else message)
+
+# with span("sql"): の中の所要時間を、段階別ヒストグラムと現在のリクエストの記録に残す
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+def summarize(trace):
+    total = time.perf_counter() - trace.started
+    parts = " / ".join(f"{stage} {sec:.3f}s" for stage, sec in trace.spans)
+    return f"合計 {total:.3f}s" + (f" ({parts})" if parts else "")
+
+def observe_llm(stage, seconds, usage=None, error=False):
+    LLM_SECONDS.observe(seconds, stage)
+    if error:
+        LLM_ERRORS.inc(stage)
+    if usage is not None:
+        LLM_TOKENS.inc(stage, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.inc(stage, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
@@ -0,0 +1,313 @@
+import difflib
+import re
+import unicodedata
+from collections import deque
+from typing import NamedTuple
+
+# ==========================================
+# ★ 選手名・チーム名のローカル解決 ★
+# ==========================================
+# 質問文から名簿上の選手名を取り出す。完全一致 → 部分一致(一意な姓・名) → 表記ゆれ(かな/全角半角)
+# → あいまい一致 の順に試し、チーム名は代表選手(今期ポイント最上位)に置き換える。
+# 確信を持てる結果が出なかった場合だけ、呼び出し側が LLM に抽出を任せる。
+
+CONFIDENT_SCORE = 0.8    # これ以上のスコアの辞書一致 (あいまい一致は除く) だけで結果が揃えば「確信あり」
+FUZZY_RATIO = 0.7        # あいまい一致の候補とする類似度の下限
+MAX_SCAN_CHARS = 200     # 名前を探す範囲 (質問の先頭から)。あいまい一致は文字数に比例して重くなるため
+ALIAS_STOPWORDS = {"team", "ex", "u-next"}
+
+SCORE_EXACT = 1.0
+SCORE_PARTIAL = 0.85     # 姓だけ・チームの略称
+SCORE_WEAK = 0.5         # 地名・スポンサー名や、前後の文字とつながった一致 (「瀬戸内」の「瀬戸」)。候補止まり
+
+class Match(NamedTuple):
+    name: str      # 解決後の選手名
+    kind: str      # "player" / "team" / "fuzzy"
+    score: float
+    start: int     # 正規化後の質問文での出現位置 (並び順に使う)
+    end: int
+    source: str    # 質問文中で一致した表記 (チームの場合はチーム名)
+
+# 全角/半角の統一、空白と区切り記号の除去、小文字化 (カタカナはそのまま。normalize と文字位置が揃う)
+def _strip(text):
+    return re.sub(r"[\s・/／]+", "", unicodedata.normalize("NFKC", text or "").lower())
+
+def normalize(text):
+    # _strip に加えて、カタカナ→ひらがな
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in _strip(text))
+
+def _is_ascii(text):
+    return all(ord(c) < 128 for c in text)
+
+def _usable_alias(alias):
+    return len(alias) >= 2 and alias not in ALIAS_STOPWORDS and not (_is_ascii(alias) and len(alias) < 3)
+
+# 確信を持てる一致か (あいまい一致は類似度が高くても候補止まり)
+def is_confident(match):
+    return match.kind != "fuzzy" and match.score >= CONFIDENT_SCORE
+
+KANJI = "一-龥々〆ヶ"
+
+def _script(ch):
+    if re.match(f"[{KANJI}]", ch):
+        return "kanji"
+    if "ぁ" <= ch <= "ゖ":
+        return "hiragana"
+    if "ァ" <= ch <= "ヺ" or ch == "ー":
+        return "katakana"
+    return "ascii" if ch.isascii() and ch.isalnum() else None
+
+# 名前の前・後ろに続いても語の切れ目とみなす語 (「多井対鈴木」「多井選手」「鈴木優戦」)
+NAME_PREFIXES = ("対",)
+NAME_SUFFIXES = ("選手", "氏", "様", "君", "監督", "戦", "対")
+
+# raw[start:end] が前後の同じ種類の文字 (漢字・ひらがな・カタカナ・英数字) とつながっているか
+def _embedded(raw, start, end):
+    before = (
+        start > 0 and _script(raw[start - 1]) is not None and _script(raw[start - 1]) == _script(raw[start])
+        and not raw[:start].endswith(NAME_PREFIXES)
+    )
+    after = (
+        end < len(raw) and _script(raw[end]) is not None and _script(raw[end]) == _script(raw[end - 1])
+        and not raw.startswith(NAME_SUFFIXES, end)
+    )
+    return before or after
+
+# 名簿の名前 (区切りなし) から、姓・名の切れ目で分けた呼び名を作る
+# 漢字とかな・英字が混ざる名前は漢字の部分 (高宮|まり → 高宮、HIRO|柴田 → 柴田)、
+# 漢字だけの名前は先頭2文字 (5文字以上なら3文字も) を姓の候補にする (瀬戸熊直樹 → 瀬戸 / 瀬戸熊)
+# 名だけ・かなだけ・英字だけの部分 (「直樹」「まり」「hiro」) は普通の言葉や他の人と紛れるので使わない
+def _surname_parts(norm):
+    runs = re.findall(f"[{KANJI}]+|[^{KANJI}]+", norm)
+    if len(runs) > 1:
+        return {run for run in runs if len(run) >= 2 and _script(run[0]) == "kanji"}
+    if _script(norm[:1]) != "kanji":
+        return set()
+    return {norm[:size] for size in (2, 3) if size == 2 or len(norm) >= 5} - {norm}
+
+# 選手名を並べる区切り (「多井と鈴木」「多井vs鈴木」) と、名前らしい文字の並び (漢字・カタカナ・英字)
+NAME_SEPARATOR = re.compile(r"と|vs|ｖｓ|対|、|,|&|×")
+NAME_LIKE = r"[一-龥々ヶァ-ヴーa-z]{2,}"
+
+# ---------------------------------------------------------
+# Aho–Corasick 法による複数パターン同時検索
+# ---------------------------------------------------------
+class AhoCorasick:
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+        return self
+
+    # (開始位置, 終了位置, value) を出現順に返す
+    def find_all(self, text):
+        node = 0
+        hits = []
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, value in self.out[node]:
+                hits.append((i + 1 - length, i + 1, value))
+        return hits
+
+# ---------------------------------------------------------
+# 名簿から作る解決器
+# ---------------------------------------------------------
+class NameResolver:
+    def __init__(self, players, player_team=None, team_leader=None, team_aliases=()):
+        self.players = tuple(players)
+        self.player_team = dict(player_team or {})
+        self.team_leader = dict(team_leader or {})
+        self._norm_players = {normalize(p): p for p in self.players}
+
+        automaton = AhoCorasick()
+        # 1. 選手のフルネーム (完全一致)
+        for norm, player in self._norm_players.items():
+            if norm:
+                automaton.add(norm, (player, "player", SCORE_EXACT))
+        # 2. 一意に決まる姓 (部分一致: 「多井」→ 多井隆晴)
+        unique_parts, shared_parts = self._player_parts()
+        for alias, player in unique_parts.items():
+            automaton.add(alias, (player, "player", SCORE_PARTIAL))
+        # 3. チーム名とその略称 → 代表選手 (先頭の地名・スポンサー名だけでは確信なし)
+        aliases, weak = self._team_alias_map(team_aliases)
+        for alias, team in aliases.items():
+            score = SCORE_EXACT if alias == normalize(team) else SCORE_WEAK if alias in weak else SCORE_PARTIAL
+            automaton.add(alias, (team, "team", score))
+        self._automaton = automaton.build()
+        # 複数の選手に共通する姓 (「鈴木」→ 鈴木たろう / 鈴木大介 / 鈴木優)。単独で出てきたら確信なし
+        shared = AhoCorasick()
+        for part in shared_parts:
+            shared.add(part, part)
+        self._shared_parts = shared.build()
+
+    # (一意に決まる姓 -> 選手, 複数の選手に共通する姓の集合)
+    def _player_parts(self):
+        candidates = {}
+        for norm, player in self._norm_players.items():
+            for part in _surname_parts(norm):
+                candidates.setdefault(part, set()).add(player)
+        unique = {
+            part: next(iter(owners)) for part, owners in candidates.items()
+            if len(owners) == 1 and part not in self._norm_players
+        }
+        shared = {part for part, owners in candidates.items() if len(owners) > 1 and part not in self._norm_players}
+        return unique, shared
+
+    # (略称 -> チーム, 先頭の地名・スポンサー名の集合)
+    def _team_alias_map(self, extra_aliases):
+        teams = {normalize(t): t for t in self.team_leader}
+        aliases = dict(teams)
+        owners = {}
+        weak = set()
+        for team in self.team_leader:
+            # 「KONAMI 麻雀格闘倶楽部」「EX風林火山」のような英字+日本語の組み合わせを分解
+            segments = re.split(r"[\s/／]+", team)
+            segments += [s for seg in segments for s in re.findall(r"[A-Za-z0-9\-]+|[^A-Za-z0-9\-]+", seg)]
+            usable = [alias for alias in dict.fromkeys(map(normalize, segments)) if _usable_alias(alias)]
+            for alias in usable:
+                owners.setdefault(alias, set()).add(team)
+            # 「渋谷ABEMAS」の「渋谷」、「KADOKAWAサクラナイツ」の「KADOKAWA」: 愛称が別にあれば先頭は地名・社名
+            head = normalize(re.findall(r"[A-Za-z0-9\-]+|[^A-Za-z0-9\-\s/／]+", team)[0])
+            if head in usable and len(usable) > 1:
+                weak.add(head)
+        # team_ranking 側の略称 (「フェニックス」「ドリブンズ」など) は正式名に含まれるものへ対応付け
+        for short in extra_aliases:
+            alias = normalize(short)
+            matched = {team for norm, team in teams.items() if alias and alias in norm}
+            if alias:
+                owners.setdefault(alias, set()).update(matched)
+        for alias, team_set in owners.items():
+            if len(team_set) == 1 and alias not in self._norm_players:
+                aliases.setdefault(alias, next(iter(team_set)))
+        return aliases, weak - {normalize(short) for short in extra_aliases}
+
+    # 質問文中の名前を出現順に返す (重なった一致は長い方を優先)
+    # 姓・略称の一致が前後の文字とつながっていれば (「瀬戸内」「あまり」) 確信なしにする
+    def find(self, text, fuzzy=True):
+        raw = _strip(text)[:MAX_SCAN_CHARS]
+        norm = normalize(text)[:MAX_SCAN_CHARS]
+        hits = sorted(self._automaton.find_all(norm), key=lambda h: (h[0], -(h[1] - h[0]), -h[2][2]))
+        matches = []
+        covered_until = -1
+        for start, end, (name, kind, score) in hits:
+            if start < covered_until:
+                continue
+            if score < SCORE_EXACT and _embedded(raw, start, end):
+                score = min(score, SCORE_WEAK)
+            if kind == "team":
+                leader = self.team_leader.get(name)
+                if not leader:
+                    continue
+                matches.append(Match(leader, "team", score, start, end, name))
+            else:
+                matches.append(Match(name, kind, score, start, end, norm[start:end]))
+            covered_until = end
+        if fuzzy:
+            matches += self._fuzzy(norm, matches)
+            matches.sort(key=lambda m: m.start)
+        return matches
+
+    # 一致しなかった部分について、名簿との類似度で探す (誤字・表記ゆれ対策)
+    def _fuzzy(self, norm, found):
+        used = [(m.start, m.end) for m in found]
+        found_names = {m.name for m in found}
+        results = []
+        for target, player in self._norm_players.items():
+            if player in found_names or len(target) < 2:
+                continue
+            best = None
+            for size in {len(target) - 1, len(target), len(target) + 1}:
+                if size < 2:
+                    continue
+                for start in range(0, len(norm) - size + 1):
+                    end = start + size
+                    if any(start < u_end and u_start < end for u_start, u_end in used):
+                        continue
+                    matcher = difflib.SequenceMatcher(None, norm[start:end], target)
+                    if matcher.real_quick_ratio() < FUZZY_RATIO or matcher.quick_ratio() < FUZZY_RATIO:
+                        continue
+                    ratio = matcher.ratio()
+                    if ratio >= FUZZY_RATIO and (best is None or ratio > best.score):
+                        best = Match(player, "fuzzy", ratio, start, end, norm[start:end])
+            if best:
+                results.append(best)
+                used.append((best.start, best.end))
+        return results
+
+    # 選手名のリストと「確信あり」フラグを返す
+    # あいまい一致は辞書引きで人数が足りないときだけ行う
+    # 確信ありになるのは、辞書の一致 (フルネーム・一意な姓名・チーム) だけで揃い、かつ
+    # 複数の選手に当てはまる姓・名 (「鈴木」) が一致の外に残っていない場合
+    # check_unresolved: 区切り (と / vs など) の前後に名簿で解決できない名前らしい語があれば確信なし
+    def resolve_players(self, text, min_count=1, check_unresolved=False):
+        matches = self.find(text, fuzzy=False)
+        if len({m.name for m in matches}) < min_count:
+            matches = self.find(text, fuzzy=True)
+        names = []
+        for m in matches:
+            if m.name not in names:
+                names.append(m.name)
+        confident = (
+            len(names) >= min_count and all(is_confident(m) for m in matches)
+            and not self._ambiguous_spans(text, matches)
+            and not (check_unresolved and self.unresolved_names(text, matches))
+        )
+        return names, confident
+
+    # 一致に含まれない、複数の選手に共通する姓・名
+    def _ambiguous_spans(self, text, matches):
+        norm = normalize(text)[:MAX_SCAN_CHARS]
+        return [
+            part for start, end, part in self._shared_parts.find_all(norm)
+            if not any(m.start <= start and end <= m.end for m in matches if is_confident(m))
+        ]
+
+    # 区切りの前後にある名前らしい語のうち、どの一致にも対応しないもの
+    # (「多井と佐藤どっちが勝つ？」の「佐藤」)
+    def unresolved_names(self, text, matches):
+        parts = NAME_SEPARATOR.split(unicodedata.normalize("NFKC", text or "").lower()[:MAX_SCAN_CHARS])
+        if len(parts) < 2:
+            return []
+        words = []
+        for i, part in enumerate(parts):
+            if i > 0:
+                head = re.match(NAME_LIKE, part.lstrip())
+                words += [head.group()] if head else []
+            if i < len(parts) - 1:
+                tail = re.search(NAME_LIKE + "$", part.rstrip())
+                words += [tail.group()] if tail else []
+        sources = [normalize(m.source) for m in matches if is_confident(m)]
+        names = [normalize(m.name) for m in matches if is_confident(m)]
+        unresolved = []
+        for word in words:
+            norm = normalize(word)
+            if not any(norm in known or known in norm for known in sources + names):
+                unresolved.append(word)
+        return unresolved
@@ -0,0 +1,219 @@
+import json
+from itertools import combinations
+
+# ==========================================
+# ★ 事前集計 (update_db.py の更新後に作る派生データ) ★
+# ==========================================
+# main.py はリクエストごとに games を集計し直さず、ここで作った結果を引くだけにする。
+# DBに集計テーブルがまだ無い場合は、main.py 側でも同じ関数でメモリ上に組み立てる。
+
+# ---------------------------------------------------------
+# 直接対決マトリクス
+# ---------------------------------------------------------
+# rows: (match_id, date, game_count, rank, player, point) の並び
+# 返り値: {(選手A, 選手B): 記録} (選手A < 選手B の組のみ)
+def build_head_to_head(rows):
+    tables = {}
+    for match_id, date, game_count, rank, player, point in rows:
+        tables.setdefault(match_id, []).append((date, game_count, rank, player, point))
+
+    matrix = {}
+    for match_id, seats in tables.items():
+        for a, b in combinations(sorted(seats, key=lambda s: s[3]), 2):
+            if a[3] == b[3]:
+                continue
+            rec = matrix.setdefault((a[3], b[3]), {
+                "player_a": a[3], "player_b": b[3],
+                "games": 0, "a_ahead": 0, "b_ahead": 0,
+                "a_points": 0.0, "b_points": 0.0, "matches": [],
+            })
+            rec["games"] += 1
+            if a[2] < b[2]:
+                rec["a_ahead"] += 1
+            elif b[2] < a[2]:
+                rec["b_ahead"] += 1
+            rec["a_points"] += a[4]
+            rec["b_points"] += b[4]
+            rec["matches"].append({
+                "match_id": match_id, "date": a[0], "game_count": a[1],
+                "rank_a": a[2], "point_a": a[4], "rank_b": b[2], "point_b": b[4],
+            })
+
+    for rec in matrix.values():
+        rec["a_points"] = round(rec["a_points"], 1)
+        rec["b_points"] = round(rec["b_points"], 1)
+        rec["point_diff"] = round(rec["a_points"] - rec["b_points"], 1)
+        rec["matches"].sort(key=lambda m: (m["date"], m["game_count"]), reverse=True)
+    return matrix
+
+# DB保存用の行 (matches は JSON 文字列)
+def head_to_head_rows(matrix):
+    return [
+        (r["player_a"], r["player_b"], r["games"], r["a_ahead"], r["b_ahead"],
+         r["a_points"], r["b_points"], r["point_diff"], json.dumps(r["matches"], ensure_ascii=False))
+        for r in matrix.values()
+    ]
+
+def head_to_head_from_rows(rows):
+    matrix = {}
+    for a, b, games, a_ahead, b_ahead, a_points, b_points, point_diff, matches in rows:
+        matrix[(a, b)] = {
+            "player_a": a, "player_b": b, "games": games, "a_ahead": a_ahead, "b_ahead": b_ahead,
+            "a_points": a_points, "b_points": b_points, "point_diff": point_diff,
+            "matches": json.loads(matches),
+        }
+    return matrix
+
+# p1 から見た記録を返す (並び順を p1, p2 に揃える)。同卓なしなら None
+def lookup_head_to_head(matrix, p1, p2):
+    if p1 <= p2:
+        return matrix.get((p1, p2))
+    rec = matrix.get((p2, p1))
+    if rec is None:
+        return None
+    return {
+        "player_a": p1, "player_b": p2, "games": rec["games"],
+        "a_ahead": rec["b_ahead"], "b_ahead": rec["a_ahead"],
+        "a_points": rec["b_points"], "b_points": rec["a_points"], "point_diff": -rec["point_diff"],
+        "matches": [
+            {**m, "rank_a": m["rank_b"], "point_a": m["point_b"], "rank_b": m["rank_a"], "point_b": m["point_a"]}
+            for m in rec["matches"]
+        ],
+    }
+
+# ---------------------------------------------------------
+# 累積ポイント推移 (選手別・チーム別、日付ごと)
+# ---------------------------------------------------------
+# rows: (date, player, point) の並び / player_team: 選手名 -> チーム名
+# 返り値: {("player" | "team", 名前): [(日付, その日の合計, 累積), ...]} (日付順)
+def build_point_series(rows, player_team):
+    daily = {}
+    for date, player, point in rows:
+        keys = [("player", player)]
+        team = player_team.get(player)
+        if team:
+            keys.append(("team", team))
+        for key in keys:
+            days = daily.setdefault(key, {})
+            days[date] = days.get(date, 0.0) + point
+
+    series = {}
+    for key, days in daily.items():
+        total = 0.0
+        points = []
+        for date in sorted(days):
+            total += days[date]
+            points.append((date, round(days[date], 1), round(total, 1)))
+        series[key] = points
+    return series
+
+def point_series_rows(series):
+    return [(kind, name, date, point, total) for (kind, name), points in series.items() for date, point, total in points]
+
+def point_series_from_rows(rows):
+    series = {}
+    for kind, name, date, point, total in rows:
+        series.setdefault((kind, name), []).append((date, point, total))
+    for points in series.values():
+        points.sort()
+    return series
+
+# ---------------------------------------------------------
+# 調子・シーズン別成績 (games 全体を1回の groupby で集計)
+# ---------------------------------------------------------
+FORM_WINDOW = 5          # 「直近の調子」に使う試合数
+TREND_WINDOW = 10        # 着順分布・平均着順の傾向に使う試合数
+SEASON_START_MONTH = 7   # この月以降の試合は翌年まで続くシーズン (10月開幕〜翌5月) として数える
+
+PLAYER_FORM_COLUMNS = [
+    "player", "games", "last_date", "last5_ranks", "last5_points", "last5_avg_rank", "last10_avg_rank",
+    "last10_rank_1", "last10_rank_2", "last10_rank_3", "last10_rank_4", "streak", "no_last_streak", "momentum",
+]
+PLAYER_SEASON_COLUMNS = [
+    "player", "season", "games", "points", "avg_rank",
+    "rank_1", "rank_2", "rank_3", "rank_4", "top_rate", "last_avoid_rate",
+]
+
+# ---------------------------------------------------------
+# シーズン (日付は ISO 形式 "2024-10-14"。移行前の "2024/10/14" も同じ位置に年・月がある)
+# ---------------------------------------------------------
+def season_start_year(date):
+    year = int(date[:4])
+    return year if int(date[5:7]) >= SEASON_START_MONTH else year - 1
+
+# "2024-10-14" -> "2024-25"
+def season_of(date):
+    start = season_start_year(date)
+    return f"{start}-{(start + 1) % 100:02d}"
+
+# シーズン内の月・日から日付を作る ("2024-25", 3, 1 -> "2025-03-01")
+def season_date(season, month, day):
+    start = int(season[:4])
+    return f"{start if month >= SEASON_START_MONTH else start + 1}-{month:02d}-{day:02d}"
+
+# 年の書かれていない月・日の並び (1シーズン分の試合結果のページ) がどのシーズンのものかを決める
+# ページは終わった試合だけを載せるので、today のシーズンに当てはめて未来の日付が出るなら前のシーズン
+# (オフシーズンの 9/20 に前シーズンの 9/15 の試合を見ても、同じページの 10月〜翌5月の日付から前シーズンと分かる)
+def infer_season(month_days, today):
+    season = season_of(today.isoformat())
+    if any(season_date(season, month, day) > today.isoformat() for month, day in month_days):
+        season = season_of(f"{season[:4]}-01-01")   # 開幕した年の1月は前のシーズン
+    return season
+
+# season_of を日付の Series にまとめて適用する
+def season_labels(dates):
+    year = dates.str[:4].astype(int)
+    start = year - (dates.str[5:7].astype(int) < SEASON_START_MONTH)
+    return start.astype(str) + "-" + ((start + 1) % 100).map("{:02d}".format)
+
+# 末尾 (最新) から同じ値が何試合続いているか。recent は新しい順に並んだ bool の Series
+def _current_run(recent, by):
+    first = recent.groupby(by, sort=False).transform("first")
+    unbroken = (recent == first).astype(int).groupby(by, sort=False).cummin()
+    return unbroken.groupby(by, sort=False).sum(), first.groupby(by, sort=False).first()
+
+# rows: (date, game_count, player, rank, point) の並び
+# 返り値: (調子の DataFrame, シーズン別成績の DataFrame)。列は PLAYER_FORM_COLUMNS / PLAYER_SEASON_COLUMNS
+# pandas は読み込みが重いので、ここを通るときだけ import する (update_db.py・main.py の起動を軽くする)
+def build_player_form(rows):
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["date", "game_count", "player", "rank", "point"])
+    if df.empty:
+        return pd.DataFrame(columns=PLAYER_FORM_COLUMNS), pd.DataFrame(columns=PLAYER_SEASON_COLUMNS)
+
+    # 選手ごとに新しい順へ並べ、何試合前か (0 = 最新) を振る
+    df = df.sort_values(["player", "date", "game_count"], ascending=[True, False, False], kind="stable")
+    df["ago"] = df.groupby("player", sort=False).cumcount()
+    for r in range(1, 5):
+        df[f"rank_{r}"] = (df["rank"] == r).astype(int)
+    by_player = df.groupby("player", sort=False)
+
+    form = by_player.agg(games=("rank", "size"), last_date=("date", "first"), mean_point=("point", "mean"))
+    last5 = df[df["ago"] < FORM_WINDOW].groupby("player", sort=False)
+    form["last5_ranks"] = last5["rank"].agg(lambda s: ",".join(map(str, s)))
+    form["last5_points"] = last5["point"].sum().round(1)
+    form["last5_avg_rank"] = last5["rank"].mean().round(2)
+    form["momentum"] = (last5["point"].mean() - form["mean_point"]).round(1)
+    last10 = df[df["ago"] < TREND_WINDOW].groupby("player", sort=False)
+    form["last10_avg_rank"] = last10["rank"].mean().round(2)
+    for r in range(1, 5):
+        form[f"last10_rank_{r}"] = last10[f"rank_{r}"].sum()
+
+    # 連続記録: 連対 (2着以内) が続いていれば +n、3・4着が続いていれば -n / ラスなしの連続試合数
+    run, rentai = _current_run(df["rank"] <= 2, df["player"])
+    form["streak"] = run.where(rentai, -run)
+    run, no_last = _current_run(df["rank"] < 4, df["player"])
+    form["no_last_streak"] = run.where(no_last, 0)
+    form = form.reset_index()[PLAYER_FORM_COLUMNS]
+
+    df["season"] = season_labels(df["date"])
+    season = df.groupby(["player", "season"], sort=True).agg(
+        games=("rank", "size"), points=("point", "sum"), avg_rank=("rank", "mean"),
+        rank_1=("rank_1", "sum"), rank_2=("rank_2", "sum"), rank_3=("rank_3", "sum"), rank_4=("rank_4", "sum"),
+    )
+    season["points"] = season["points"].round(1)
+    season["avg_rank"] = season["avg_rank"].round(4)
+    season["top_rate"] = (season["rank_1"] / season["games"]).round(4)
+    season["last_avoid_rate"] = (1 - season["rank_4"] / season["games"]).round(4)
+    return form, season.reset_index()[PLAYER_SEASON_COLUMNS]
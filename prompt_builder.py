@@ -0,0 +1,83 @@
+import threading
+
+from metrics import log
+from name_resolver import normalize
+
+# ==========================================
+# ★ プロンプトの組み立て (トークン節約) ★
+# ==========================================
+# 表データは幅揃えの to_string() ではなく、数値を丸めたTSVで埋め込む。
+# 長い履歴は直近だけに切り詰め、名簿は質問に関係しそうな選手だけに絞る。
+# 組み立てたプロンプトはトークン数を数えて記録し、削減効果を確認できるようにする。
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+MAX_TABLE_ROWS = 20       # 表として埋め込む最大行数 (超えた分は件数だけ書く)
+FLOAT_DIGITS = 3          # 小数の丸め桁数 (率は 0.253、ポイントは 12.3 のように末尾の0は落とす)
+
+_stats_lock = threading.Lock()
+prompt_stats = {}         # プロンプト名 -> {"count": 回数, "tokens": 合計トークン数, "last": 直近のトークン数}
+
+# tiktoken があれば正確に数え、無ければ概算する (英数字は4文字で1トークン、日本語は1文字1トークン程度)
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float):
+        text = f"{value:.{FLOAT_DIGITS}f}".rstrip("0").rstrip(".")
+        return text if text not in ("", "-0") else "0"
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+# DataFrame を見出し付きのTSVにする。max_rows を超えた分は省略して件数だけ添える
+def to_tsv(df, columns=None, max_rows=MAX_TABLE_ROWS):
+    if df is None or df.empty:
+        return "(データなし)"
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    lines = ["\t".join(str(c) for c in df.columns)]
+    for row in df.head(max_rows).itertuples(index=False):
+        lines.append("\t".join(_format_value(v) for v in row))
+    if len(df) > max_rows:
+        lines.append(f"... (他 {len(df) - max_rows} 行)")
+    return "\n".join(lines)
+
+# 質問文と文字 (2文字の並び) を共有する選手・チームだけを名簿から取り出す (チームが引っかかれば所属選手も含める)
+# 何も引っかからなければ全員を返す (LLMに名寄せを任せるため、候補を落としすぎない)
+# 返り値: (選手のカンマ区切り, チームのカンマ区切り)
+def roster_slice(text, players, teams=(), player_team=None):
+    norm = normalize(text)
+    grams = {norm[i:i + 2] for i in range(len(norm) - 1)}
+
+    def related(name):
+        n = normalize(name)
+        return any(n[i:i + 2] in grams for i in range(len(n) - 1))
+
+    picked_players = [p for p in players if related(p)]
+    picked_teams = [t for t in teams if related(t)]
+    if picked_teams and player_team:
+        picked_players += [p for p in players if player_team.get(p) in picked_teams and p not in picked_players]
+    if not picked_players and not picked_teams:
+        return ", ".join(players), ", ".join(teams)
+    return ", ".join(picked_players or players), ", ".join(picked_teams or teams)
+
+# 行頭のインデント (ソース上の字下げ) と空行を落とし、トークン数を記録してから返す
+# (TSVの空セルを壊さないよう、落とすのは半角スペースだけ)
+def build(name, template):
+    text = "\n".join(line.lstrip(" ") for line in template.splitlines() if line.strip())
+    tokens = count_tokens(text)
+    with _stats_lock:
+        stat = prompt_stats.setdefault(name, {"count": 0, "tokens": 0, "last": 0})
+        stat["count"] += 1
+        stat["tokens"] += tokens
+        stat["last"] = tokens
+    log(f"🧮 プロンプト[{name}]: {tokens} tokens")
+    return text
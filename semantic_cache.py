@@ -0,0 +1,191 @@
+import asyncio
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import NamedTuple
+
+import shared_cache
+from metrics import log
+
+# ==========================================
+# ★ 言い換えに強いSQLキャッシュ (ローカル) ★
+# ==========================================
+# 「一番強いのは？」と「最強選手は誰？」のような言い換えに、以前実行できたSQLを使い回す。
+# 質問は表記ゆれ・言い回し・助詞を揃えた上で文字2-gramのベクトルにし、コサイン類似度で比べる。
+# 選手・チーム・指標・数字などのスロットが違う質問 (「多井の〜」と「鈴木の〜」) は、文面が似ていても
+# 別物として扱う (スロットが完全に一致するものの中からだけ探す)。
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))               # 保持するSQLの件数 (LRU)
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))         # これ以上似ていれば同じ質問とみなす
+SHARED_BUCKET_SIZE = 32    # 共有キャッシュに置く、スロットごとの質問の件数
+
+# 言い回しの統一 (長いものから順に置き換える)
+PHRASES = {
+    "いちばん": "最", "一番": "最", "もっとも": "最", "最も": "最", "ナンバーワン": "最", "no.1": "最",
+    "強い": "強", "弱い": "弱", "勝ってる": "強", "勝っている": "強",
+    "今シーズン": "今期", "今季": "今期", "今年": "今期",
+    "チーム別": "チームごと", "選手別": "選手ごと",
+}
+# 意味を持たない語 (問いかけ・依頼の言い回し、助詞)
+FILLERS = re.compile(
+    r"教えてください|教えて|知りたい|見せて|ください|でしょうか|ですか|って誰|は誰|誰|だれ|のは|って|選手|"
+    r"[はがをのにでもへやか]"
+)
+
+class Match(NamedTuple):
+    sql: str
+    score: float
+    question: str   # キャッシュしたときの質問
+
+class _Entry(NamedTuple):
+    vector: Counter
+    norm: float
+    sql: str
+    question: str
+
+def canonicalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"[\s?？!！。、,.・「」『』()（）]+", "", text)
+    for phrase in sorted(PHRASES, key=len, reverse=True):
+        text = text.replace(phrase, PHRASES[phrase])
+    return FILLERS.sub("", text)
+
+# 文字2-gram (1文字だけならその文字) の出現回数
+def vectorize(canonical):
+    grams = [canonical[i:i + 2] for i in range(len(canonical) - 1)] or [canonical]
+    vector = Counter(grams)
+    return vector, math.sqrt(sum(v * v for v in vector.values()))
+
+def cosine(a, a_norm, b, b_norm):
+    if not a_norm or not b_norm:
+        return 0.0
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    return sum(count * large.get(gram, 0) for gram, count in small.items()) / (a_norm * b_norm)
+
+# 質問に含まれる数字 (上位5 と 上位10、10月と11月 などを区別する)
+def numbers(text):
+    return tuple(re.findall(r"\d+", unicodedata.normalize("NFKC", text or "")))
+
+# namespace: 用途 (sql / graph)。slots: 呼び出し側で作るスロットのタプル (一致したものだけが候補になる)
+# backend: shared_cache の保存先。あれば、スロットごとに {正規化した質問: [質問, SQL]} を置いて
+# 他のワーカーが覚えたSQLも候補にする (手元で見つからなかったときだけ読みに行く)
+# offload: 保存先の読み書きを実行するコルーチン関数 (既定はスレッドで実行。イベントループで待たない)
+# 保存先の障害は手元のキャッシュだけで続ける
+# 手元の索引はイベントループ上でのみ使う前提 (ロックなし)
+class SemanticCache:
+    def __init__(self, maxsize=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_THRESHOLD, backend=None, offload=asyncio.to_thread):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.backend = backend
+        self._offload = offload
+        self._entries = OrderedDict()   # (namespace, slots, 正規化した質問) -> _Entry
+        self._buckets = {}              # (namespace, slots) -> {正規化した質問, ...}
+        self.hits = 0
+        self.misses = 0
+
+    async def lookup(self, namespace, slots, question):
+        canonical = canonicalize(question)
+        match = self._lookup_local(namespace, slots, canonical)
+        if match is None and self.backend is not None:
+            shared = await self._shared_call(self.backend.get, self._shared_key(namespace, slots))
+            if shared and self._merge(namespace, slots, shared):
+                match = self._lookup_local(namespace, slots, canonical)
+        if match is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return match
+
+    def _lookup_local(self, namespace, slots, canonical):
+        bucket = self._buckets.get((namespace, slots), ())
+        best_key, best_score = None, 0.0
+        if canonical in bucket:
+            best_key, best_score = (namespace, slots, canonical), 1.0
+        else:
+            vector, norm = vectorize(canonical)
+            for other in bucket:
+                entry = self._entries[(namespace, slots, other)]
+                score = cosine(vector, norm, entry.vector, entry.norm)
+                if score > best_score:
+                    best_key, best_score = (namespace, slots, other), score
+        if best_key is None or best_score < self.threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        entry = self._entries[best_key]
+        return Match(entry.sql, best_score, entry.question)
+
+    async def store(self, namespace, slots, question, sql):
+        canonical = canonicalize(question)
+        self._add(namespace, slots, canonical, question, sql)
+        if self.backend is not None:
+            await self._shared_call(self._push, self._shared_key(namespace, slots), canonical, question, sql)
+
+    def _add(self, namespace, slots, canonical, question, sql):
+        key = (namespace, slots, canonical)
+        vector, norm = vectorize(canonical)
+        self._entries[key] = _Entry(vector, norm, sql, question)
+        self._entries.move_to_end(key)
+        self._buckets.setdefault((namespace, slots), set()).add(canonical)
+        while len(self._entries) > self.maxsize:
+            old_key, _ = self._entries.popitem(last=False)
+            self._unlink(old_key)
+
+    # 使い回したSQLが今のデータで失敗・空振りした場合に消す
+    async def discard(self, namespace, slots, sql):
+        for key in [k for k in self._buckets.get((namespace, slots), ()) if self._entries[(namespace, slots, k)].sql == sql]:
+            del self._entries[(namespace, slots, key)]
+            self._unlink((namespace, slots, key))
+        if self.backend is not None:
+            await self._shared_call(self._remove, self._shared_key(namespace, slots), sql)
+
+    async def _shared_call(self, func, *args):
+        try:
+            return await self._offload(func, *args)
+        except Exception as e:
+            log(f"⚠️ SQLキャッシュの共有先エラー ({self.backend.name}): {e}")
+            return None
+
+    # 以下の2つは offload 先 (スレッド) で実行する
+    def _push(self, key, canonical, question, sql):
+        shared = self.backend.get(key) or {}
+        shared.pop(canonical, None)
+        shared[canonical] = [question, sql]
+        self.backend.set(key, dict(list(shared.items())[-SHARED_BUCKET_SIZE:]))
+
+    def _remove(self, key, sql):
+        shared = self.backend.get(key) or {}
+        kept = {canonical: item for canonical, item in shared.items() if item[1] != sql}
+        if len(kept) != len(shared):
+            self.backend.set(key, kept)
+
+    # 共有キャッシュにあって手元に無い質問を取り込む (取り込んだら True)
+    def _merge(self, namespace, slots, shared):
+        bucket = self._buckets.get((namespace, slots), ())
+        added = False
+        for canonical, (question, sql) in shared.items():
+            if canonical not in bucket:
+                self._add(namespace, slots, canonical, question, sql)
+                bucket = self._buckets[(namespace, slots)]
+                added = True
+        return added
+
+    def _shared_key(self, namespace, slots):
+        return shared_cache.make_key("semantic", namespace, slots)
+
+    # 手元の分だけを消す (共有キャッシュは他のワーカーも使っているので残す)
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _unlink(self, key):
+        namespace, slots, canonical = key
+        bucket = self._buckets.get((namespace, slots))
+        if bucket is not None:
+            bucket.discard(canonical)
+            if not bucket:
+                del self._buckets[(namespace, slots)]
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ==========================================
+# ★ ワーカー間で共有するキャッシュ ★
+# ==========================================
+# uvicorn --workers N のように複数プロセスで動かすと、プロセス内のキャッシュはワーカーごとに別々になる。
+# 応答・SQLのキャッシュをここに置くと、どのワーカーが計算した結果も他のワーカーから使える。
+# CACHE_URL で保存先を選ぶ:
+#   (未設定) / memory://        プロセス内 (従来通り。ワーカー間では共有しない)
+#   sqlite:///path/to/cache.db  同じマシンのワーカー間で共有 (WAL モードのファイル)
+#   redis://host:6379/0         複数マシンで共有 (redis パッケージが必要)
+# 値は JSON にできるもの (dict / list / str / 数値) に限る。
+# blocking: 読み書きでディスク・ネットワークを待つ保存先か (True なら呼び出し側がスレッドで実行する)
+
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "4096"))   # 保持する件数の上限 (既定値)
+
+class MemoryBackend:
+    name = "memory"
+    blocking = False
+
+    def __init__(self, maxsize=CACHE_MAX_ITEMS):
+        self.maxsize = maxsize
+        self._items = OrderedDict()   # key -> (期限 (None なら無期限), 値)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    # ttl: 秒 (None なら無期限。件数の上限を超えると古いものから消える)
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items[key] = (None if ttl is None else time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def ping(self):
+        return True
+
+# 同じマシンの全ワーカーが1つのファイルを読み書きする
+# 接続はプロセスごとに開き直す (fork 前に開いた接続を子プロセスで使わない)
+class SqliteBackend:
+    name = "sqlite"
+    blocking = True
+    PRUNE_EVERY = 256   # この回数の書き込みごとに、期限切れと上限超過の分を消す
+
+    def __init__(self, path, maxsize=CACHE_MAX_ITEMS):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, used REAL NOT NULL)"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), None if ttl is None else now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(conn, now)
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.maxsize,)
+        )
+
+    def delete(self, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM cache")
+
+    def ping(self):
+        with self._lock:
+            self._connection().execute("SELECT 1").fetchone()
+        return True
+
+# client: get / set(ex=) / delete / scan_iter を持つもの (redis.Redis、または同じ形の代用品)
+class RedisBackend:
+    name = "redis"
+    blocking = True
+
+    def __init__(self, client, prefix="mleague:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ex = None if ttl is None else max(1, int(ttl))
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=ex)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in list(self.client.scan_iter(match=self.prefix + "*")):
+            self.client.delete(key)
+
+    def ping(self):
+        return bool(self.client.ping())
+
+# maxsize: memory / sqlite で保持する件数の上限
+def open_backend(url=CACHE_URL, maxsize=CACHE_MAX_ITEMS):
+    if not url or url.startswith("memory://"):
+        return MemoryBackend(maxsize)
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite:///"):], maxsize)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis   # redis を使うときだけ必要
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f"CACHE_URL の形式が不明です: {url}")
+
+# タプルなどのキーを、どの保存先でも使える文字列にする
+def make_key(namespace, *parts):
+    return namespace + ":" + json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
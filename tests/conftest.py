@@ -0,0 +1,67 @@
+import fnmatch
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# リポジトリ直下のモジュール (update_db.py など) を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from name_resolver import NameResolver  # noqa: E402
+
+PLAYER_TEAM = {
+    "多井隆晴": "渋谷ABEMAS", "白鳥翔": "渋谷ABEMAS",
+    "高宮まり": "KONAMI 麻雀格闘倶楽部", "HIRO柴田": "KONAMI 麻雀格闘倶楽部",
+    "東城りお": "セガサミーフェニックス", "竹内元太": "セガサミーフェニックス",
+    "内川幸太郎": "KADOKAWAサクラナイツ", "渋川難波": "KADOKAWAサクラナイツ",
+    "瀬戸熊直樹": "TEAM RAIDEN / 雷電", "萩原聖人": "TEAM RAIDEN / 雷電",
+    "鈴木たろう": "赤坂ドリブンズ", "鈴木優": "U-NEXT Pirates", "鈴木大介": "BEAST X",
+    "二階堂亜樹": "EX風林火山", "伊達朱里紗": "KONAMI 麻雀格闘倶楽部",
+}
+TEAM_LEADER = {
+    "渋谷ABEMAS": "白鳥翔", "KONAMI 麻雀格闘倶楽部": "高宮まり", "セガサミーフェニックス": "竹内元太",
+    "KADOKAWAサクラナイツ": "渋川難波", "TEAM RAIDEN / 雷電": "萩原聖人", "赤坂ドリブンズ": "鈴木たろう",
+    "U-NEXT Pirates": "鈴木優", "BEAST X": "鈴木大介", "EX風林火山": "二階堂亜樹",
+}
+SHORT_NAMES = ["ABEMAS", "麻雀格闘倶楽部", "フェニックス", "サクラナイツ", "雷電", "ドリブンズ", "Pirates", "BEAST", "風林火山"]
+
+# 名前解決のテストで使う名簿 (m_league.db の一部)
+@pytest.fixture(scope="session")
+def resolver():
+    return NameResolver(PLAYER_TEAM, PLAYER_TEAM, TEAM_LEADER, SHORT_NAMES)
+
+# RedisBackend に渡す redis.Redis の代用品 (get / set(ex=) / delete / scan_iter / ping だけ)
+# clock を渡すと有効期限の判定にその時刻を使う
+class FakeRedis:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._items = {}   # key -> (値 (bytes), 期限)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._items.get(key, (None, None))
+            if expires is not None and expires <= self.clock():
+                del self._items[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            data = value.encode("utf-8") if isinstance(value, str) else value
+            self._items[key] = (data, None if ex is None else self.clock() + ex)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._items.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            keys = list(self._items)
+        return (key for key in keys if fnmatch.fnmatchcase(key, match))
+
+    def ping(self):
+        return True
@@ -0,0 +1,126 @@
+import sqlite3
+import time
+
+import pytest
+
+import db
+
+# ==========================================
+# ★ db.py の SafeQuery (LLMが書いたSQLの検査・制限・キャッシュ) ★
+# ==========================================
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "m_league.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE stats (team TEXT, player TEXT, points REAL);
+        CREATE TABLE secret (token TEXT);
+        INSERT INTO secret VALUES ('x');
+    """)
+    conn.executemany("INSERT INTO stats VALUES (?, ?, ?)", [("渋谷ABEMAS", f"選手{i}", i * 10.0) for i in range(10)])
+    conn.commit()
+    conn.close()
+    return path
+
+@pytest.fixture
+def version():
+    return {"value": 1}
+
+@pytest.fixture
+def observed():
+    return []
+
+@pytest.fixture
+def safe_query(db_path, version, observed):
+    pool = db.ReadOnlyPool(db_path, size=2)
+    yield db.SafeQuery(pool, lambda: version["value"], cache_size=4, observe=observed.append)
+    pool.close()
+
+def test_select_on_allowed_table(safe_query):
+    result = safe_query.run("SELECT player, points FROM stats ORDER BY points DESC LIMIT 2")
+    assert result == db.QueryResult(("player", "points"), (("選手9", 90.0), ("選手8", 80.0)), False)
+
+@pytest.mark.parametrize("sql", [
+    "",
+    "DELETE FROM stats",
+    "UPDATE stats SET points = 0",
+    "DROP TABLE stats",
+    "ATTACH DATABASE 'other.db' AS other",
+    "PRAGMA writable_schema = 1",
+    "SELECT 1; DELETE FROM stats",
+])
+def test_rejects_non_select(safe_query, sql):
+    with pytest.raises(db.UnsafeQueryError):
+        safe_query.run(sql)
+
+# 先頭が SELECT / WITH でも、authorizer が書き込みや許可外の読み取りを止める
+@pytest.mark.parametrize("sql", [
+    "WITH x AS (SELECT 1) DELETE FROM stats",
+    "WITH x AS (SELECT 1) INSERT INTO stats SELECT * FROM stats",
+    "SELECT * FROM secret",
+    "SELECT name FROM sqlite_master",
+    "SELECT * FROM pragma_table_info('stats')",
+    "SELECT s.player FROM stats s JOIN secret ON 1",
+])
+def test_authorizer_rejects(safe_query, sql):
+    with pytest.raises(db.UnsafeQueryError):
+        safe_query.run(sql)
+
+@pytest.mark.parametrize("action", [
+    sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH, sqlite3.SQLITE_PRAGMA,
+    sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE, sqlite3.SQLITE_CREATE_TABLE,
+])
+def test_authorizer_denies_actions(action):
+    assert db._authorizer(action, "stats", None, "main", None) == sqlite3.SQLITE_DENY
+
+def test_recursive_cte_is_allowed(safe_query):
+    sql = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 5) SELECT x FROM n"
+    assert safe_query.run(sql).rows == ((1,), (2,), (3,), (4,), (5,))
+    sql = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 5) SELECT COUNT(*) FROM n"
+    assert safe_query.run(sql).rows == ((5,),)
+    assert safe_query.run("WITH t AS (SELECT player FROM stats) SELECT COUNT(*) FROM t").rows == ((10,),)
+    # CTE の名前以外は、件数だけの読み取りでも許可しない
+    with pytest.raises(db.UnsafeQueryError):
+        safe_query.run("WITH t AS (SELECT 1) SELECT COUNT(*) FROM secret")
+
+# 止まらないクエリは時間の上限で打ち切る
+def test_time_budget(safe_query):
+    sql = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT COUNT(*) FROM n"
+    started = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match="秒を超えた"):
+        safe_query.run(sql, time_budget=0.2)
+    assert time.monotonic() - started < 2
+    # 打ち切った後も、接続は普通に使える
+    assert safe_query.run("SELECT COUNT(*) FROM stats").rows == ((10,),)
+
+def test_row_cap(safe_query):
+    result = safe_query.run("SELECT player FROM stats ORDER BY points", max_rows=3)
+    assert result.truncated and result.rows == (("選手0",), ("選手1",), ("選手2",))
+    assert not safe_query.run("SELECT player FROM stats", max_rows=10).truncated
+
+def test_result_cache(safe_query, version, observed):
+    first = safe_query.run("SELECT COUNT(*) FROM stats")
+    # コメント・空白・末尾のセミコロンが違うだけなら同じキャッシュを使う
+    again = safe_query.run("SELECT  COUNT(*)\n FROM stats -- 件数\n;")
+    assert again is first
+    assert (safe_query.hits, safe_query.misses, len(observed)) == (1, 1, 1)
+
+    # DBが更新されたら実行し直す
+    version["value"] += 1
+    safe_query.run("SELECT COUNT(*) FROM stats")
+    assert (safe_query.hits, safe_query.misses, len(observed)) == (1, 2, 2)
+
+def test_errors_are_not_cached(safe_query):
+    for _ in range(2):
+        with pytest.raises(db.UnsafeQueryError):
+            safe_query.run("SELECT * FROM secret")
+    assert safe_query.misses == 2 and safe_query.hits == 0
+
+def test_cache_size_limit(safe_query):
+    for i in range(6):
+        safe_query.run(f"SELECT {i} FROM stats LIMIT 1")
+    safe_query.run("SELECT 0 FROM stats LIMIT 1")
+    assert safe_query.hits == 0
+    safe_query.run("SELECT 5 FROM stats LIMIT 1")
+    assert safe_query.hits == 1
@@ -0,0 +1,52 @@
+import pytest
+
+import intent
+
+# ==========================================
+# ★ intent.py の意図判定 ★
+# ==========================================
+
+# よくある質問 (bench/micro.py の各モードの代表と、update_db.py の PRECOMPUTE_QUESTIONS)
+@pytest.mark.parametrize("text, name, players, metric", [
+    ("多井隆晴のポイント推移", "graph", ("多井隆晴",), "points"),
+    ("ポイント推移を見せて", "graph", (), "points"),
+    ("多井隆晴と鈴木優の対戦成績", "matchup", ("多井隆晴", "鈴木優"), None),
+    ("多井と鈴木優どっちが勝つ？予想して", "analyst", ("多井隆晴", "鈴木優"), None),
+    ("多井の調子", "analyst", ("多井隆晴",), None),
+    ("今日の多井の成績", "analyst", ("多井隆晴",), None),
+    ("多井の最新成績", "analyst", ("多井隆晴",), None),
+    ("最新の試合結果", "results", (), None),
+    ("今日の試合結果", "results", (), None),
+    ("10月14日の結果", "results", (), None),
+    ("チーム順位", "results", (), None),
+    ("個人ランキング", "results", (), None),
+    ("トップ率が高い選手は？", "stat_ranking", (), "top_rate"),
+    ("放銃率が低い選手は？", "stat_ranking", (), "hoju_rate"),
+    ("平均打点が高い選手は？", "stat_ranking", (), "avg_score"),
+    ("多井の放銃率は？", "stat_lookup", ("多井隆晴",), "hoju_rate"),
+    ("Mリーグのルールは？", "sql", (), None),
+])
+def test_routine_questions(resolver, text, name, players, metric):
+    found = intent.classify(text, resolver)
+    assert (found.name, found.players, found.metric) == (name, players, metric)
+
+def test_ranking_order_and_limit(resolver):
+    found = intent.classify("放銃率が低い選手トップ3", resolver)
+    assert (found.name, found.ascending, found.limit) == ("stat_ranking", True, 3)
+    assert intent.classify("平均着順のワースト", resolver).ascending is False
+
+def test_team_slot(resolver):
+    found = intent.classify("サクラナイツのスタッツ", resolver)
+    assert (found.name, found.teams) == ("stat_lookup", ("KADOKAWAサクラナイツ",))
+
+# 普通の言葉の一部を選手名とみなして、定型クエリで答えてしまわない
+@pytest.mark.parametrize("text", [
+    "つまり一番強いのは誰？",
+    "放銃率があまり高くない選手は？",
+    "決まり手は？",
+    "渋谷の天気",
+])
+def test_no_player_slot_from_ordinary_words(resolver, text):
+    found = intent.classify(text, resolver)
+    assert found.players == () and found.teams == ()
+    assert found.name != "stat_lookup"
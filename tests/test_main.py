@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+# ==========================================
+# ★ main.py のローカル処理 ★
+# ==========================================
+
+# 推移グラフ: 事前集計を使うのは、フルネームかチーム名で対象がはっきり書かれた場合だけ
+@pytest.mark.parametrize("text, targets", [
+    ("多井隆晴のポイント推移", [("player", "多井隆晴")]),
+    ("多井隆晴と鈴木優の推移", [("player", "多井隆晴"), ("player", "鈴木優")]),
+    ("サクラナイツの推移", [("team", "KADOKAWAサクラナイツ")]),
+    ("多井のポイント推移", []),
+    ("今期の始まりからのポイント推移", []),
+    ("渋谷のポイント推移", []),
+])
+def test_resolve_graph_targets(resolver, text, targets):
+    assert main.resolve_graph_targets(text, SimpleNamespace(resolver=resolver)) == targets
+
+def _counts(histogram):
+    return {labels: state[-1] for labels, state in histogram._values.items()}
+
+# 意図判定などDB以外の処理は work スレッドで実行し、DB処理時間 (mleague_db_seconds) には記録しない
+def test_offloaded_work_is_not_timed_as_db(resolver):
+    def classify(text):
+        return threading.current_thread().name, main.intent.classify(text, resolver).name
+
+    def read_db():
+        return threading.current_thread().name
+
+    before = _counts(main.metrics.DB_SECONDS)
+
+    async def run():
+        return await main.run_blocking(classify, "多井の成績"), await main.run_db_blocking(read_db)
+
+    (work_thread, name), db_thread = asyncio.run(run())
+
+    assert name == "analyst"
+    assert work_thread.startswith("work") and db_thread.startswith("db")
+    assert _counts(main.metrics.DB_SECONDS) == before
+    assert ("test_offloaded_work_is_not_timed_as_db.<locals>.classify",) in _counts(main.metrics.OFFLOAD_SECONDS)
+
+# /chat/batch の precompute: 答えになった応答だけを保存し、保存済みのキーを answer_chat で見直さない
+def test_precompute_stores_only_real_answers(monkeypatch):
+    planned, lookups = [], []
+    find_precomputed = main.find_precomputed
+
+    async def plan_chat(user_query, commentary, vocab):
+        planned.append(user_query)
+        return main.ChatPlan(reply="多井隆晴です") if user_query == "一番強いのは" else main.no_answer("該当データが見当たりませんでした。")
+
+    async def counting_find(*args):
+        lookups.append(args[0])
+        return await find_precomputed(*args)
+
+    vocab = SimpleNamespace(stamp="2025-11-20", version=1)
+    cache = main.ResponseCache(main.shared_cache.MemoryBackend(), 60, main.run_cache_io)
+    monkeypatch.setattr(main, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(main, "response_cache", cache)
+    monkeypatch.setattr(main, "get_vocab", lambda: asyncio.sleep(0, vocab))
+    monkeypatch.setattr(main, "plan_chat", plan_chat)
+    monkeypatch.setattr(main, "find_precomputed", counting_find)
+
+    messages = ["一番強いのは", "存在しない選手の成績"]
+    first = asyncio.run(main.answer_batch(messages, precompute=True))
+    assert [a["reply"] for a in first] == ["多井隆晴です", "該当データが見当たりませんでした。"]
+    assert lookups == []
+    assert cache.backend.get(main.shared_cache.make_key("response", *main.precomputed_key(messages[0], False, vocab))) == first[0]
+    assert cache.backend.get(main.shared_cache.make_key("response", *main.precomputed_key(messages[1], False, vocab))) is None
+
+    # 2回目は保存した回答を返し、データなしだった質問だけを計算し直す
+    assert asyncio.run(main.answer_batch(messages, precompute=True)) == first
+    assert planned == messages + [messages[1]]
+
+    # /chat からは事前計算を見る
+    assert asyncio.run(main.answer_chat(messages[0], vocab=vocab)) == first[0]
+    assert lookups == [messages[0]]
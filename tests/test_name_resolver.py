@@ -0,0 +1,39 @@
+import pytest
+
+from name_resolver import is_confident
+
+# ==========================================
+# ★ name_resolver.py の名前解決 ★
+# ==========================================
+
+@pytest.mark.parametrize("text, expected", [
+    ("多井隆晴の成績", ["多井隆晴"]),
+    ("多井の成績", ["多井隆晴"]),
+    ("高宮の調子は？", ["高宮まり"]),
+    ("瀬戸熊選手のトップ率", ["瀬戸熊直樹"]),
+    ("柴田の放銃率", ["HIRO柴田"]),
+    ("多井対鈴木優", ["多井隆晴", "鈴木優"]),
+    ("サクラナイツの成績", ["渋川難波"]),
+    ("渋谷ABEMASのポイント", ["白鳥翔"]),
+])
+def test_confident_names(resolver, text, expected):
+    assert resolver.resolve_players(text) == (expected, True)
+
+# 普通の言葉の一部や、名だけ・地名だけの一致で選手を決めつけない
+@pytest.mark.parametrize("text", [
+    "つまり一番強いのは誰？",
+    "放銃率があまり高くない選手は？",
+    "決まり手は？",
+    "ありおりはべり",
+    "太郎の成績",
+    "直樹の成績",
+    "渋谷の天気",
+    "瀬戸内海の天気",
+    "鈴木の成績",
+])
+def test_no_confident_match_in_ordinary_words(resolver, text):
+    assert not any(is_confident(m) for m in resolver.find(text))
+    assert not resolver.resolve_players(text)[1]
+
+def test_unresolved_name_beside_separator(resolver):
+    assert resolver.resolve_players("多井と佐藤どっちが勝つ？", check_unresolved=True) == (["多井隆晴"], False)
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import intent
+import main
+import semantic_cache
+import shared_cache
+from conftest import FakeRedis
+
+# ==========================================
+# ★ semantic_cache.py の言い換えに強いSQLキャッシュ ★
+# ==========================================
+
+SQL = "SELECT player, points FROM stats ORDER BY points DESC LIMIT 1"
+SLOTS = ((), "points", False, None, ())
+
+def run(coro):
+    return asyncio.run(coro)
+
+def slots_of(text, resolver):
+    return main.query_slots(text, SimpleNamespace(resolver=resolver), intent.classify(text, resolver))
+
+@pytest.mark.parametrize("a, b", [
+    ("一番強いのは誰？", "最も強い選手は誰ですか"),
+    ("今シーズンの成績を教えて", "今季の成績を見せてください"),
+    ("Ｔｏｐ　５！", "top5"),
+])
+def test_canonicalize_paraphrases(a, b):
+    assert semantic_cache.canonicalize(a) == semantic_cache.canonicalize(b)
+
+def test_cosine():
+    a = semantic_cache.vectorize(semantic_cache.canonicalize("今期のチームごとのポイント"))
+    b = semantic_cache.vectorize(semantic_cache.canonicalize("今シーズンのチーム別のポイントは？"))
+    c = semantic_cache.vectorize(semantic_cache.canonicalize("放銃率の推移"))
+    assert semantic_cache.cosine(*a, *b) == pytest.approx(1.0)
+    assert semantic_cache.cosine(*a, *c) < 0.2
+    assert semantic_cache.cosine(*a, {}, 0.0) == 0.0
+
+def test_hit_and_miss():
+    cache = semantic_cache.SemanticCache(threshold=0.8)
+    run(cache.store("sql", SLOTS, "今期一番強い選手は誰？", SQL))
+
+    hit = run(cache.lookup("sql", SLOTS, "今シーズン最も強いのは誰ですか"))
+    assert hit is not None and hit.sql == SQL and hit.question == "今期一番強い選手は誰？"
+    assert run(cache.lookup("sql", SLOTS, "放銃率の推移を見せて")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_threshold():
+    strict = semantic_cache.SemanticCache(threshold=0.99)
+    loose = semantic_cache.SemanticCache(threshold=0.5)
+    for cache in (strict, loose):
+        run(cache.store("sql", SLOTS, "チームごとの今期ポイント合計", SQL))
+    question = "チームごとの今期ポイント合計の平均"
+    assert run(strict.lookup("sql", SLOTS, question)) is None
+    match = run(loose.lookup("sql", SLOTS, question))
+    assert match is not None and 0.5 <= match.score < 0.99
+
+# 文面が似ていても、選手・指標・数字などのスロットが違えば同じ答えを使わない
+@pytest.mark.parametrize("stored, asked", [
+    ("多井の放銃率が高い試合は？", "白鳥の放銃率が高い試合は？"),
+    ("多井のトップ率の推移", "多井の連対率の推移"),
+    ("ポイント上位5人の成績", "ポイント上位10人の成績"),
+])
+def test_different_slots_do_not_share(resolver, stored, asked):
+    cache = semantic_cache.SemanticCache(threshold=0.5)
+    stored_slots, asked_slots = slots_of(stored, resolver), slots_of(asked, resolver)
+    assert stored_slots != asked_slots
+    run(cache.store("sql", stored_slots, stored, SQL))
+
+    assert run(cache.lookup("sql", asked_slots, asked)) is None
+    assert run(cache.lookup("sql", stored_slots, stored)).sql == SQL
+
+def test_namespace_is_separate():
+    cache = semantic_cache.SemanticCache()
+    run(cache.store("graph", SLOTS, "ポイント推移", SQL))
+    assert run(cache.lookup("sql", SLOTS, "ポイント推移")) is None
+
+def test_discard_and_lru():
+    cache = semantic_cache.SemanticCache(maxsize=2)
+    run(cache.store("sql", SLOTS, "一番強い選手", SQL))
+    run(cache.discard("sql", SLOTS, SQL))
+    assert run(cache.lookup("sql", SLOTS, "一番強い選手")) is None
+
+    for i, question in enumerate(["トップ率", "放銃率", "副露率"]):
+        run(cache.store("sql", SLOTS, question, f"SELECT {i}"))
+    assert len(cache) == 2
+    assert run(cache.lookup("sql", SLOTS, "トップ率")) is None
+
+# 共有キャッシュがあれば、他のワーカーが覚えたSQLも使える
+@pytest.mark.parametrize("make_backend", [
+    lambda: shared_cache.MemoryBackend(),
+    lambda: shared_cache.RedisBackend(FakeRedis()),
+])
+def test_shared_between_workers(make_backend):
+    backend = make_backend()
+    worker_a = semantic_cache.SemanticCache(backend=backend)
+    worker_b = semantic_cache.SemanticCache(backend=backend)
+    run(worker_a.store("sql", SLOTS, "今期一番強い選手は誰？", SQL))
+
+    assert run(worker_b.lookup("sql", SLOTS, "今季最も強いのは？")).sql == SQL
+
+    run(worker_b.discard("sql", SLOTS, SQL))
+    assert run(semantic_cache.SemanticCache(backend=backend).lookup("sql", SLOTS, "今期一番強い選手は誰？")) is None
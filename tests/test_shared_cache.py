@@ -0,0 +1,123 @@
+import multiprocessing
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import shared_cache
+from conftest import FakeRedis
+
+# ==========================================
+# ★ shared_cache.py の保存先 (memory / sqlite / redis) ★
+# ==========================================
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_cache, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path, clock):
+    if request.param == "memory":
+        return shared_cache.MemoryBackend(maxsize=16)
+    if request.param == "sqlite":
+        return shared_cache.SqliteBackend(str(tmp_path / "cache.db"), maxsize=16)
+    return shared_cache.RedisBackend(FakeRedis(clock))
+
+def test_get_set_delete_clear(backend):
+    assert backend.get("missing") is None
+    backend.set("a", {"reply": "多井隆晴", "rows": [1, 2.5, None]})
+    backend.set("b", "文字列")
+    assert backend.get("a") == {"reply": "多井隆晴", "rows": [1, 2.5, None]}
+    assert backend.get("b") == "文字列"
+
+    backend.delete("a")
+    assert backend.get("a") is None
+    backend.clear()
+    assert backend.get("b") is None
+    assert backend.ping()
+
+def test_ttl(backend, clock):
+    backend.set("short", 1, ttl=5)
+    backend.set("forever", 2)
+    clock.now += 4
+    assert backend.get("short") == 1
+    clock.now += 2
+    assert backend.get("short") is None
+    assert backend.get("forever") == 2
+
+def test_memory_evicts_least_recently_used():
+    backend = shared_cache.MemoryBackend(maxsize=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+
+def test_sqlite_prunes_to_maxsize(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(shared_cache.SqliteBackend, "PRUNE_EVERY", 4)
+    backend = shared_cache.SqliteBackend(str(tmp_path / "cache.db"), maxsize=2)
+    for i in range(4):
+        clock.now += 1
+        backend.set(f"k{i}", i)
+    assert [backend.get(f"k{i}") for i in range(4)] == [None, None, 2, 3]
+
+def _write_from_child(backend, key, value):
+    backend.set(key, value)
+
+# 別プロセス (fork したワーカー) が書いた値を読める。fork 前に開いた接続は子プロセスで開き直す
+@pytest.mark.skipif(sys.platform == "win32", reason="fork が必要")
+def test_sqlite_is_shared_between_processes(tmp_path):
+    backend = shared_cache.SqliteBackend(str(tmp_path / "cache.db"))
+    backend.set("parent", "親")
+    child = multiprocessing.get_context("fork").Process(target=_write_from_child, args=(backend, "child", {"from": "子"}))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    assert backend.get("child") == {"from": "子"}
+    assert shared_cache.SqliteBackend(backend.path).get("parent") == "親"
+
+def test_redis_backends_share_client_but_not_prefix():
+    client = FakeRedis()
+    worker_a = shared_cache.RedisBackend(client)
+    worker_b = shared_cache.RedisBackend(client)
+    other_app = shared_cache.RedisBackend(client, prefix="other:")
+    worker_a.set("k", [1, 2])
+    other_app.set("k", "別")
+    assert worker_b.get("k") == [1, 2]
+
+    worker_b.clear()
+    assert worker_a.get("k") is None
+    assert other_app.get("k") == "別"
+
+def test_redis_ttl_is_whole_seconds():
+    client = FakeRedis()
+    backend = shared_cache.RedisBackend(client)
+    calls = []
+    client.set = lambda key, value, ex=None: calls.append(ex)
+    backend.set("a", 1, ttl=0.2)
+    backend.set("b", 1, ttl=30.7)
+    backend.set("c", 1)
+    assert calls == [1, 30, None]
+
+def test_open_backend(tmp_path, monkeypatch):
+    assert isinstance(shared_cache.open_backend(""), shared_cache.MemoryBackend)
+    assert isinstance(shared_cache.open_backend("memory://"), shared_cache.MemoryBackend)
+    sqlite = shared_cache.open_backend(f"sqlite:///{tmp_path}/cache.db")
+    assert (sqlite.name, sqlite.path, sqlite.blocking) == ("sqlite", f"{tmp_path}/cache.db", True)
+
+    client = FakeRedis()
+    monkeypatch.setitem(sys.modules, "redis", SimpleNamespace(Redis=SimpleNamespace(from_url=lambda url: client)))
+    redis = shared_cache.open_backend("redis://localhost:6379/0")
+    assert (redis.name, redis.client, redis.blocking) == ("redis", client, True)
+
+    with pytest.raises(ValueError):
+        shared_cache.open_backend("ftp://example")
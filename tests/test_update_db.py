@@ -0,0 +1,192 @@
+import datetime
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import update_db
+from bench import fixtures
+
+# ==========================================
+# ★ update_db.py の取り込み (保存したHTMLをローカルサーバーから配信して確かめる) ★
+# ==========================================
+
+TODAY = datetime.date(2025, 11, 20)
+TEAMS = {
+    "赤坂ドリブンズ": ["園田賢", "浅見真紀"],
+    "KADOKAWAサクラナイツ": ["堀慎吾", "渋川難波"],
+}
+# (月, 日): [(回戦, [(着順, 選手, ポイント), ...]), ...]
+GAMES = {
+    (11, 17): [("1", [(1, "園田賢", 52.3), (2, "堀慎吾", 8.1), (3, "浅見真紀", -20.4), (4, "渋川難波", -40.0)])],
+    (11, 18): [
+        ("1", [(1, "渋川難波", 61.0), (2, "浅見真紀", 3.2), (3, "園田賢", -18.2), (4, "堀慎吾", -46.0)]),
+        ("2", [(1, "堀慎吾", 45.5), (2, "園田賢", 12.0), (3, "渋川難波", -17.5), (4, "浅見真紀", -40.0)]),
+    ],
+}
+NEW_GAME = {(11, 20): [("1", [(1, "浅見真紀", 70.1), (2, "園田賢", 9.9), (3, "堀慎吾", -25.0), (4, "渋川難波", -55.0)])]}
+
+class FixedDate(datetime.date):
+    @classmethod
+    def today(cls):
+        return cls(TODAY.year, TODAY.month, TODAY.day)
+
+POINTS = [(1, "赤坂ドリブンズ", 120.5), (2, "KADOKAWAサクラナイツ", -30.2)]
+TOP = [(1, "KADOKAWAサクラナイツ", 88.8), (2, "赤坂ドリブンズ", -12.0)]
+
+# ページは bench/fixtures.py と同じ組み立て方で作る
+def render_points():
+    return fixtures.page(fixtures.points_html(POINTS))
+
+def render_games(games):
+    return fixtures.page(fixtures.games_html([(datetime.date(TODAY.year, m, d), tables) for (m, d), tables in sorted(games.items())]))
+
+def render_stats():
+    return fixtures.page(fixtures.stats_html([
+        (team, players, [
+            ("試合数", [3] * len(players)),
+            ("ポイント", [10.5 * (i + 1) for i in range(len(players))]),
+            ("平着", [2.33] * len(players)),
+        ])
+        for team, players in TEAMS.items()
+    ]))
+
+def render_top():
+    return fixtures.page(fixtures.top_html(TOP))
+
+def write_page(root, path, html):
+    os.makedirs(os.path.join(root, path), exist_ok=True)
+    target = os.path.join(root, path, "index.html")
+    # Last-Modified は秒単位なので、書き換えたことが必ず伝わるよう前回より時刻を進めておく
+    stamp = max(time.time(), os.path.getmtime(target) + 10 if os.path.exists(target) else 0)
+    with open(target, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.utime(target, (stamp, stamp))
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    root = str(tmp_path / "site")
+    write_page(root, "", render_top())
+    write_page(root, "points", render_points())
+    write_page(root, "games", render_games(GAMES))
+    write_page(root, "stats", render_stats())
+    server, base_url = fixtures.serve_in_thread(root)
+
+    monkeypatch.setattr(update_db, "BASE_URL", base_url)
+    monkeypatch.setattr(update_db, "FETCH_CACHE_DIR", str(tmp_path / "fetch_cache"))
+    # 日付の推定を固定するため、update_db から見た today だけを差し替える
+    monkeypatch.setattr(update_db, "datetime", SimpleNamespace(**{**vars(datetime), "date": FixedDate}))
+    yield SimpleNamespace(root=root, paths=server.paths)
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = update_db.connect(str(tmp_path / "m_league.db"))
+    yield conn
+    conn.close()
+
+def game_rows(conn):
+    return conn.execute("SELECT match_id, date, game_count, rank, player, point FROM games ORDER BY date, game_count, rank").fetchall()
+
+def test_first_run_ingests_all_pages(site, conn):
+    timings = update_db.run_update(conn)
+
+    assert {"parse", "write"} <= set(timings)
+    rows = game_rows(conn)
+    assert len(rows) == 12
+    assert {r[1] for r in rows} == {"2025-11-17", "2025-11-18"}
+    assert conn.execute("SELECT COUNT(*) FROM stats").fetchone()[0] == 4
+    assert conn.execute("SELECT team, point FROM team_ranking ORDER BY rank").fetchall() == [
+        ("赤坂ドリブンズ", 120.5), ("KADOKAWAサクラナイツ", -30.2),
+    ]
+    assert update_db.get_meta(conn, "games_high_water") == "2025-11-18"
+    # points から順位が取れたので、トップページは取得しない
+    assert "/" not in site.paths
+
+def test_unchanged_pages_skip_parse_and_write(site, conn):
+    update_db.run_update(conn)
+    before = game_rows(conn)
+    last_update = update_db.get_meta(conn, "last_update")
+    changes = conn.total_changes
+
+    timings = update_db.run_update(conn)
+
+    assert "parse" not in timings and "write" not in timings
+    assert game_rows(conn) == before
+    assert update_db.get_meta(conn, "last_update") == last_update
+    assert conn.total_changes == changes
+
+def test_changed_page_adds_only_new_games_with_stable_ids(site, conn, tmp_path):
+    update_db.run_update(conn)
+    before = game_rows(conn)
+
+    write_page(site.root, "games", render_games({**GAMES, **NEW_GAME}))
+    changes = conn.total_changes
+    update_db.run_update(conn)
+
+    after = game_rows(conn)
+    added = [r for r in after if r not in before]
+    assert set(before) <= set(after)
+    assert len(added) == 4 and {r[1] for r in added} == {"2025-11-20"}
+    assert {r[0] for r in added} == {update_db.make_match_id("2025-11-20", "1", 0)}
+    assert update_db.get_meta(conn, "games_high_water") == "2025-11-20"
+    # 既存の行は書き換えない (新しい4行の挿入と、派生データ・meta の更新だけ)
+    assert conn.execute("SELECT COUNT(*) FROM games WHERE date < '2025-11-20'").fetchone()[0] == len(before)
+    assert conn.total_changes > changes
+
+    # 同じページを空のDBに取り込み直しても、同じ match_id になる
+    fresh = update_db.connect(str(tmp_path / "fresh.db"))
+    update_db.run_update(fresh, full=True)
+    assert game_rows(fresh) == after
+    fresh.close()
+
+def test_top_page_is_fetched_only_when_points_has_no_ranking(site, conn):
+    write_page(site.root, "points", fixtures.page("<p>メンテナンス中</p>"))
+    update_db.run_update(conn)
+
+    assert site.paths.count("/") == 1
+    assert conn.execute("SELECT team, point FROM team_ranking ORDER BY rank").fetchall() == [
+        ("KADOKAWAサクラナイツ", 88.8), ("赤坂ドリブンズ", -12.0),
+    ]
+
+    # points が直るまではトップページも見るが、どちらも変わらなければ取り込み直さない
+    timings = update_db.run_update(conn)
+    assert site.paths.count("/") == 2
+    assert "parse" not in timings
+
+    # points から取れるようになれば、トップページは見なくなる
+    write_page(site.root, "points", render_points())
+    update_db.run_update(conn)
+    update_db.run_update(conn)
+    assert site.paths.count("/") == 3
+    assert conn.execute("SELECT team FROM team_ranking ORDER BY rank").fetchall() == [("赤坂ドリブンズ",), ("KADOKAWAサクラナイツ",)]
+
+# オフシーズン (9/20) に前シーズンのページを見ても、9/15 を今年の日付にしない
+@pytest.mark.parametrize("dates, season, expected", [
+    ([(9, 15), (10, 1), (3, 2)], "2025-26", ["2025-09-15", "2025-10-01", "2026-03-02"]),
+    ([(9, 15), (9, 18)], "2026-27", ["2026-09-15", "2026-09-18"]),   # 新シーズンの最初の週
+])
+def test_parse_games_infers_year_from_page_season(dates, season, expected):
+    seats = [(1, "園田賢", 30.0), (2, "堀慎吾", 10.0), (3, "浅見真紀", -10.0), (4, "渋川難波", -30.0)]
+    html = render_games({date: [("1", seats)] for date in dates})
+
+    games = update_db.parse_games(html, today=datetime.date(2026, 9, 20))
+
+    assert sorted({g["date"] for g in games}) == expected
+    assert {g["season"] for g in games} == {season}
+
+# 年付きの日付 ("2025/3/2(日)") はその年を使い、読めない日付のモーダルだけを飛ばす
+def test_parse_games_accepts_dates_with_year():
+    seats = [(1, "園田賢", 30.0), (2, "堀慎吾", 10.0), (3, "浅見真紀", -10.0), (4, "渋川難波", -30.0)]
+    html = render_games({date: [("1", seats)] for date in [(12, 1), (3, 2), (10, 1), (5, 5)]})
+    html = html.replace(">12/1(", ">2024/12/1(").replace(">3/2(", ">2025/3/2(").replace(">5/5(", ">5月5日(")
+
+    games = update_db.parse_games(html, today=datetime.date(2026, 9, 20))
+
+    assert sorted({g["date"] for g in games}) == ["2024-12-01", "2025-03-02", "2025-10-01"]
+    assert {g["date"]: g["season"] for g in games} == {"2024-12-01": "2024-25", "2025-03-02": "2024-25", "2025-10-01": "2025-26"}
+    # すべて年付きならシーズンの推定は要らない
+    games = update_db.parse_games(html.replace(">10/1(", ">2023/10/1("), today=datetime.date(2026, 9, 20))
+    assert sorted({g["date"] for g in games}) == ["2023-10-01", "2024-12-01", "2025-03-02"]
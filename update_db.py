@@ -1,154 +1,899 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import sqlite3
-import re
-import uuid # ID生成用
-
-DB_NAME = 'm_league.db'
-
-def get_soup(url):
-    print(f"アクセス中: {url} ...")
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        res = requests.get(url, headers=headers)
-        res.raise_for_status()
-        return BeautifulSoup(res.text, 'html.parser')
-    except Exception as e:
-        print(f"エラー: {e}")
-        return None
-
-# 1. チーム順位 (変更なし)
-def scrape_points(conn):
-    soup = get_soup("https://m-league.jp/points/")
-    if not soup: return
-    data = []
-    rows = soup.find_all('tr')
-    for row in rows:
-        try:
-            rank_elem = row.find(class_=re.compile('ranking-no'))
-            if not rank_elem:
-                cols = row.find_all('td')
-                if len(cols) >= 3:
-                    try:
-                        rank = int(cols[0].get_text(strip=True))
-                        name = cols[1].get_text(strip=True)
-                        point = float(cols[2].get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
-                        data.append({"rank": rank, "team": name, "point": point})
-                        continue
-                    except: pass
-            rank = row.find(class_=re.compile('rank-number')).get_text(strip=True)
-            name = row.find(class_='team-name').get_text(strip=True)
-            point = float(row.find(class_='point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
-            data.append({"rank": int(rank), "team": name, "point": point})
-        except: continue
-    
-    if not data:
-        soup_top = get_soup("https://m-league.jp/")
-        if soup_top:
-            teams = soup_top.find_all('div', class_='p-ranking__team-item')
-            for team in teams:
-                try:
-                    rank = team.find(class_=re.compile('p-ranking__rank-number')).get_text(strip=True)
-                    name = team.find(class_='p-ranking__team-name').get_text(strip=True)
-                    point = float(team.find(class_='p-ranking__current-point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
-                    data.append({"rank": int(rank), "team": name, "point": point})
-                except: continue
-    if data:
-        df = pd.DataFrame(data)
-        df.to_sql('team_ranking', conn, if_exists='replace', index=False)
-        print(f"✅ チーム順位: {len(df)} チーム")
-
-# 2. 試合結果 (★match_id追加版)
-def scrape_games(conn):
-    base_url = "https://m-league.jp/games/"
-    soup = get_soup(base_url)
-    if not soup: return
-
-    all_games = []
-    modals = soup.find_all('div', class_='c-modal2')
-    
-    for modal in modals:
-        try:
-            date_text = modal.find('div', class_='p-gamesResult__date').get_text(strip=True)
-            month_day = date_text.split('(')[0]
-            parts = month_day.split('/')
-            if len(parts) == 2:
-                date_str = f"2025/{int(parts[0]):02d}/{int(parts[1]):02d}"
-            else:
-                date_str = f"2025/{month_day}"
-
-            columns = modal.find_all('div', class_='p-gamesResult__column')
-            
-            for col in columns:
-                # ここで試合ごとのユニークIDを発行！
-                # これにより、同じ日・同じ回数でも別卓なら区別できる
-                current_match_id = str(uuid.uuid4())
-                
-                game_num = col.find('div', class_='p-gamesResult__number').get_text(strip=True)
-                rank_items = col.find_all('div', class_='p-gamesResult__rank-item')
-                
-                for item in rank_items:
-                    rank = item.find('div', class_='p-gamesResult__rank-badge').get_text(strip=True)
-                    player = item.find('div', class_='p-gamesResult__name').get_text(strip=True).replace(" ", "").replace("　", "")
-                    point = float(item.find('div', class_='p-gamesResult__point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
-                    
-                    all_games.append({
-                        "match_id": current_match_id, # ★追加
-                        "date": date_str, 
-                        "game_count": game_num, 
-                        "rank": int(rank), 
-                        "player": player, 
-                        "point": point
-                    })
-        except: continue
-
-    if all_games:
-        df = pd.DataFrame(all_games)
-        df = df.sort_values(by=['date', 'game_count'])
-        df.to_sql('games', conn, if_exists='replace', index=False)
-        print(f"✅ 試合結果: {len(df)} 件 (match_id付与完了)")
-    else:
-        print("⚠️ 試合結果なし")
-
-# 3. 個人成績 (変更なし)
-def scrape_stats(conn):
-    soup = get_soup("https://m-league.jp/stats/")
-    if not soup: return
-    data_list = []
-    sections = soup.find_all('section', class_='p-stats__team')
-    for section in sections:
-        try:
-            team_name = section.find('h2', class_='p-stats__teamName').get_text(strip=True)
-            table = section.find('table', class_='p-stats__table')
-            if not table: continue
-            rows = table.find_all('tr')
-            players = [p.get_text(strip=True).replace(" ", "").replace("　", "") for p in rows[0].find_all('th')[1:]]
-            player_stats = {p: {'team': team_name, 'player': p} for p in players}
-            key_map = {'試合数': 'matches', '総局数': 'total_hands', 'ポイント': 'points', '平着': 'avg_rank', '1位': 'rank_1_count', '2位': 'rank_2_count', '3位': 'rank_3_count', '4位': 'rank_4_count', 'トップ率': 'top_rate', '連対率': 'rentai_rate', 'ラス回避率': 'last_avoid_rate', 'ベストスコア': 'best_score', '平均打点': 'avg_score', '副露率': 'furo_rate', 'リーチ率': 'riichi_rate', 'アガリ率': 'agari_rate', '放銃率': 'hoju_rate', '放銃平均打点': 'hoju_avg_score'}
-            for row in rows[1:]:
-                header = row.find('th').get_text(strip=True)
-                if header in key_map:
-                    db_key = key_map[header]
-                    cols = row.find_all('td')
-                    for i, col in enumerate(cols):
-                        if i < len(players):
-                            val = col.get_text(strip=True)
-                            try: val = float(val) if '.' in val else int(val)
-                            except: pass
-                            player_stats[players[i]][db_key] = val
-            data_list.extend(player_stats.values())
-        except: continue
-    if data_list:
-        df = pd.DataFrame(data_list)
-        df.to_sql('stats', conn, if_exists='replace', index=False)
-        print(f"✅ 個人スタッツ: {len(df)} 名")
-
-if __name__ == "__main__":
-    conn = sqlite3.connect(DB_NAME)
-    print("--- ID付きデータ更新開始 ---")
-    scrape_points(conn)
-    scrape_games(conn)
-    scrape_stats(conn)
-    conn.close()
-    print("--- 完了 ---")
\ No newline at end of file
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple
+import sqlite3
+import datetime
+import json
+import re
+import os
+import sys
+import time
+import hashlib # match_id 生成用
+import precompute
+
+DB_NAME = os.getenv("MLEAGUE_DB", "m_league.db")
+
+# ==========================================
+# ★ 取得元ページ ★
+# ==========================================
+# MLEAGUE_BASE_URL を差し替えると、保存済みHTMLを配信するローカルサーバーからも取得できる
+BASE_URL = os.getenv("MLEAGUE_BASE_URL", "https://m-league.jp").rstrip("/")
+PAGES = {
+    "points": "/points/",
+    "top": "/",          # チーム順位の予備 (points で取れなかった場合だけ取得する)
+    "games": "/games/",
+    "stats": "/stats/",
+}
+FALLBACK_PAGES = {"top"}   # 毎回は取得しないページ (トップページは順位と関係ない部分も頻繁に変わるため)
+FETCH_TIMEOUT = (5, 30)  # (接続, 読み込み) 秒
+FETCH_RETRIES = 3        # 接続エラー・5xx・429 の再試行回数 (間隔は指数的に伸ばす)
+
+# 取得キャッシュ: ETag / Last-Modified / 本文のハッシュを保存し、変化がないページは解析もDB書き込みもしない
+FETCH_CACHE_DIR = os.getenv("MLEAGUE_CACHE_DIR", ".fetch_cache")
+
+# HTMLパーサー: lxml が入っていれば高速な lxml を使う (pip install lxml で有効、なくても動く)
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+HTML_PARSER = os.getenv("MLEAGUE_PARSER", DEFAULT_PARSER)
+
+# ==========================================
+# ★ スキーマ定義 ★
+# ==========================================
+# to_sql(if_exists='replace') だと型なし列になり、インデックスも毎回消えるため、
+# テーブルは宣言済みのスキーマで作り、更新時は中身だけ入れ替える
+SCHEMA_VERSION = 5  # PRAGMA user_version で管理
+
+SCHEMA = """
+-- games / stats / team_ranking は今シーズン (meta の current_season) の分だけを持つ。
+-- 過去のシーズンは同じ列の *_archive に移し、シーズンをまたぐ集計は *_all ビューで読む
+CREATE TABLE IF NOT EXISTS team_ranking (
+    rank   INTEGER NOT NULL,
+    team   TEXT    NOT NULL PRIMARY KEY,
+    point  REAL    NOT NULL,
+    season TEXT
+);
+
+CREATE TABLE IF NOT EXISTS games (
+    match_id   TEXT    NOT NULL,
+    date       TEXT    NOT NULL,
+    game_count TEXT    NOT NULL,
+    rank       INTEGER NOT NULL,
+    player     TEXT    NOT NULL,
+    point      REAL    NOT NULL,
+    season     TEXT,              -- "2025-26" の形式 (date は "2025-10-14")
+    PRIMARY KEY (match_id, player)
+);
+-- 選手別の直近成績・推移 (WHERE player = ? ORDER BY date)
+CREATE INDEX IF NOT EXISTS idx_games_player_date ON games (player, date);
+-- 日付指定・直近の試合結果 (WHERE date = ? ORDER BY game_count, match_id, rank)
+CREATE INDEX IF NOT EXISTS idx_games_date_game ON games (date, game_count, match_id, rank);
+
+CREATE TABLE IF NOT EXISTS stats (
+    team            TEXT NOT NULL,
+    player          TEXT NOT NULL PRIMARY KEY,
+    matches         INTEGER,
+    total_hands     INTEGER,
+    points          REAL,
+    avg_rank        REAL,
+    rank_1_count    INTEGER,
+    rank_2_count    INTEGER,
+    rank_3_count    INTEGER,
+    rank_4_count    INTEGER,
+    top_rate        REAL,
+    rentai_rate     REAL,
+    last_avoid_rate REAL,
+    best_score      INTEGER,
+    avg_score       REAL,
+    furo_rate       REAL,
+    riichi_rate     REAL,
+    agari_rate      REAL,
+    hoju_rate       REAL,
+    hoju_avg_score  REAL,
+    season          TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_stats_team ON stats (team);
+CREATE INDEX IF NOT EXISTS idx_stats_points ON stats (points DESC);
+
+CREATE TABLE IF NOT EXISTS team_ranking_archive (
+    rank   INTEGER NOT NULL,
+    team   TEXT    NOT NULL,
+    point  REAL    NOT NULL,
+    season TEXT    NOT NULL,
+    PRIMARY KEY (season, team)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS games_archive (
+    match_id   TEXT    NOT NULL,
+    date       TEXT    NOT NULL,
+    game_count TEXT    NOT NULL,
+    rank       INTEGER NOT NULL,
+    player     TEXT    NOT NULL,
+    point      REAL    NOT NULL,
+    season     TEXT    NOT NULL,
+    PRIMARY KEY (match_id, player)
+);
+CREATE INDEX IF NOT EXISTS idx_games_archive_season_player ON games_archive (season, player, date);
+CREATE INDEX IF NOT EXISTS idx_games_archive_season_date ON games_archive (season, date, game_count, match_id, rank);
+
+CREATE TABLE IF NOT EXISTS stats_archive (
+    team            TEXT NOT NULL,
+    player          TEXT NOT NULL,
+    matches         INTEGER,
+    total_hands     INTEGER,
+    points          REAL,
+    avg_rank        REAL,
+    rank_1_count    INTEGER,
+    rank_2_count    INTEGER,
+    rank_3_count    INTEGER,
+    rank_4_count    INTEGER,
+    top_rate        REAL,
+    rentai_rate     REAL,
+    last_avoid_rate REAL,
+    best_score      INTEGER,
+    avg_score       REAL,
+    furo_rate       REAL,
+    riichi_rate     REAL,
+    agari_rate      REAL,
+    hoju_rate       REAL,
+    hoju_avg_score  REAL,
+    season          TEXT NOT NULL,
+    PRIMARY KEY (season, player)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_stats_archive_player ON stats_archive (player, season);
+
+CREATE VIEW IF NOT EXISTS games_all AS
+    SELECT match_id, date, game_count, rank, player, point, season FROM games
+    UNION ALL SELECT match_id, date, game_count, rank, player, point, season FROM games_archive;
+CREATE VIEW IF NOT EXISTS stats_all AS
+    SELECT * FROM stats UNION ALL SELECT * FROM stats_archive;
+CREATE VIEW IF NOT EXISTS team_ranking_all AS
+    SELECT rank, team, point, season FROM team_ranking
+    UNION ALL SELECT rank, team, point, season FROM team_ranking_archive;
+
+CREATE TABLE IF NOT EXISTS head_to_head (
+    player_a   TEXT    NOT NULL,
+    player_b   TEXT    NOT NULL,
+    games      INTEGER NOT NULL,
+    a_ahead    INTEGER NOT NULL,
+    b_ahead    INTEGER NOT NULL,
+    a_points   REAL    NOT NULL,
+    b_points   REAL    NOT NULL,
+    point_diff REAL    NOT NULL,
+    matches    TEXT    NOT NULL,  -- JSON
+    PRIMARY KEY (player_a, player_b)
+) WITHOUT ROWID;
+
+-- 累積ポイント推移 (entity_type: player / team)。グラフはここを日付順に読むだけ
+CREATE TABLE IF NOT EXISTS point_series (
+    entity_type TEXT NOT NULL,
+    entity      TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    point       REAL NOT NULL,  -- その日の合計
+    total_point REAL NOT NULL,  -- 累積
+    PRIMARY KEY (entity_type, entity, date)
+) WITHOUT ROWID;
+
+-- 選手ごとの調子 (直近5戦・直近10戦の着順、連続記録)。アナリストモードは stats とこれを1回の JOIN で読む
+CREATE TABLE IF NOT EXISTS player_form (
+    player          TEXT    NOT NULL PRIMARY KEY,
+    games           INTEGER NOT NULL,
+    last_date       TEXT    NOT NULL,
+    last5_ranks     TEXT    NOT NULL,  -- 新しい順のカンマ区切り
+    last5_points    REAL    NOT NULL,
+    last5_avg_rank  REAL    NOT NULL,
+    last10_avg_rank REAL    NOT NULL,
+    last10_rank_1   INTEGER NOT NULL,
+    last10_rank_2   INTEGER NOT NULL,
+    last10_rank_3   INTEGER NOT NULL,
+    last10_rank_4   INTEGER NOT NULL,
+    streak          INTEGER NOT NULL,  -- +n: 連対が n 試合連続 / -n: 3・4着が n 試合連続
+    no_last_streak  INTEGER NOT NULL,  -- ラスなしの連続試合数
+    momentum        REAL    NOT NULL   -- 直近5戦の平均ポイント − 全試合の平均ポイント
+) WITHOUT ROWID;
+
+-- シーズン別成績 (season: "2024-25" の形式)
+CREATE TABLE IF NOT EXISTS player_season (
+    player          TEXT    NOT NULL,
+    season          TEXT    NOT NULL,
+    games           INTEGER NOT NULL,
+    points          REAL    NOT NULL,
+    avg_rank        REAL    NOT NULL,
+    rank_1          INTEGER NOT NULL,
+    rank_2          INTEGER NOT NULL,
+    rank_3          INTEGER NOT NULL,
+    rank_4          INTEGER NOT NULL,
+    top_rate        REAL    NOT NULL,
+    last_avoid_rate REAL    NOT NULL,
+    PRIMARY KEY (player, season)
+) WITHOUT ROWID;
+
+-- 取り込み状況などの管理情報 (games_high_water: 取り込み済みの最新日付 / last_update: 最後にデータを書き込んだ日時 /
+-- current_season: games などに入っているシーズン)
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT NOT NULL PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 書き込み用の接続。WALモードにしておくと、書き込み中も他の接続からの読み取りがブロックされない
+# (journal_mode はDBファイルに記録されるので、一度切り替えれば main.py 側の接続もWALで読む)
+def connect(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# 明示的に BEGIN IMMEDIATE してから書き込む (sqlite3 モジュールは DDL では自動で BEGIN しないため、
+# with conn: だけだとスキーマ移行の途中の状態が他の接続から見えてしまう)
+@contextmanager
+def transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def table_columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+# 同じ日・同じ回戦・同じ卓なら毎回同じIDになるよう、内容から match_id を作る
+def make_match_id(date_str, game_num, table_no):
+    key = f"{date_str}|{game_num}|{table_no}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def _create_schema(conn):
+    for stmt in SCHEMA.split(";"):
+        if stmt.strip():
+            conn.execute(stmt)
+
+# 移行の途中ではテーブルだけを作る (インデックス・ビューは後の版で増えた列を参照するので、移行の最後に作る)
+def _create_tables(conn):
+    for stmt in SCHEMA.split(";"):
+        if re.sub(r"--[^\n]*", "", stmt).strip().startswith("CREATE TABLE"):
+            conn.execute(stmt)
+
+# v0 → v1: 旧形式 (to_sql で作られた型なしテーブル) から宣言済みスキーマへ
+def _migrate_v1(conn):
+    legacy = {}
+    for table in ('team_ranking', 'games', 'stats', 'head_to_head'):
+        if table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} RENAME TO _legacy_{table}")
+            legacy[table] = table_columns(conn, f"_legacy_{table}")
+    _create_tables(conn)
+    for table, old_cols in legacy.items():
+        cols = [c for c in table_columns(conn, table) if c in old_cols]
+        col_list = ", ".join(cols)
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({col_list}) SELECT {col_list} FROM _legacy_{table}")
+        conn.execute(f"DROP TABLE _legacy_{table}")
+
+# match_id を今の date の値から振り直す (卓番号は同日・同回戦内の登場順)
+def _renumber_match_ids(conn):
+    rows = conn.execute(
+        "SELECT date, game_count, match_id FROM games GROUP BY match_id ORDER BY date, game_count, MIN(rowid)"
+    ).fetchall()
+    table_no = {}
+    for date_str, game_num, old_id in rows:
+        no = table_no[(date_str, game_num)] = table_no.get((date_str, game_num), -1) + 1
+        conn.execute("UPDATE games SET match_id = ? WHERE match_id = ?", (make_match_id(date_str, game_num, no), old_id))
+    high_water = conn.execute("SELECT MAX(date) FROM games").fetchone()[0]
+    if high_water:
+        set_meta(conn, 'games_high_water', high_water)
+
+# v1 → v2: uuid の match_id を決定的なIDへ振り直す
+def _migrate_v2(conn):
+    _create_tables(conn)
+    _renumber_match_ids(conn)
+
+# v2 → v3: point_series を追加 / v3 → v4: 調子・シーズン別成績を追加
+# (中身は移行の最後に rebuild_derived でまとめて作る)
+def _migrate_v3(conn):
+    _create_tables(conn)
+
+def _migrate_v4(conn):
+    _create_tables(conn)
+
+# v4 → v5: 日付を ISO 形式 (2025-10-14) にして season 列を埋め、今シーズン以外の行を *_archive へ移す
+def _migrate_v5(conn):
+    for table in SEASON_TABLES:
+        if "season" not in table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN season TEXT")
+    _create_tables(conn)
+    conn.execute("UPDATE games SET date = replace(date, '/', '-')")
+    dates = [d for (d,) in conn.execute("SELECT DISTINCT date FROM games")]
+    conn.executemany("UPDATE games SET season = ? WHERE date = ?", [(precompute.season_of(d), d) for d in dates])
+    # match_id は日付の文字列から作っているので、新しい形式の日付で振り直す
+    _renumber_match_ids(conn)
+    latest = conn.execute("SELECT MAX(date) FROM games").fetchone()[0]
+    season = precompute.season_of(latest or datetime.date.today().isoformat())
+    conn.execute("UPDATE stats SET season = ?", (season,))
+    conn.execute("UPDATE team_ranking SET season = ?", (season,))
+    set_meta(conn, 'current_season', season)
+    archive_other_seasons(conn, season)
+
+MIGRATIONS = {1: _migrate_v1, 2: _migrate_v2, 3: _migrate_v3, 4: _migrate_v4, 5: _migrate_v5}
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        with transaction(conn):
+            for step in range(version + 1, SCHEMA_VERSION + 1):
+                MIGRATIONS[step](conn)
+            _create_schema(conn)
+            # 派生データは移行後のスキーマでまとめて作り直す
+            rebuild_derived(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        print(f"🛠 スキーマ移行: v{version} → v{SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+# テーブルの中身を入れ替える (スキーマ・インデックスは維持)。season を渡すとそのシーズンの行だけを入れ替える
+# コミットは呼び出し側 (run_update) で、他のテーブルの書き込みとまとめて行う
+def replace_rows(conn, table, records, season=None):
+    cols = table_columns(conn, table)
+    placeholders = ", ".join(["?"] * len(cols))
+    if season is None:
+        conn.execute(f"DELETE FROM {table}")
+    else:
+        conn.execute(f"DELETE FROM {table} WHERE season = ?", (season,))
+        records = [{**r, "season": season} for r in records]
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) VALUES ({placeholders})",
+        [tuple(r.get(c) for c in cols) for r in records],
+    )
+
+# ==========================================
+# ★ シーズン ★
+# ==========================================
+# 今シーズンの問い合わせが小さいテーブルだけを読むよう、過去のシーズンは *_archive に分けて持つ
+SEASON_TABLES = ("games", "stats", "team_ranking")
+
+# keep 以外のシーズンの行を *_archive へ移す
+def archive_other_seasons(conn, keep):
+    for table in SEASON_TABLES:
+        cols = ", ".join(table_columns(conn, table))
+        conn.execute(f"INSERT OR REPLACE INTO {table}_archive ({cols}) SELECT {cols} FROM {table} WHERE season IS NOT ?", (keep,))
+        conn.execute(f"DELETE FROM {table} WHERE season IS NOT ?", (keep,))
+
+# 今より新しいシーズンのデータが来たら、今の分を保管してから切り替える
+def roll_season(conn, season):
+    current = get_meta(conn, 'current_season')
+    if current and season <= current:
+        return current
+    if current:
+        archive_other_seasons(conn, season)
+        print(f"📦 シーズン切り替え: {current} → {season} (前シーズンを保管)")
+    set_meta(conn, 'current_season', season)
+    return season
+
+def today_season():
+    return precompute.season_of(datetime.date.today().isoformat())
+
+
+# 全ページで使い回す HTTP セッション (keep-alive・再試行つき)
+def make_session():
+    session = requests.Session()
+    retry = Retry(
+        total=FETCH_RETRIES, backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=len(PAGES), pool_maxsize=len(PAGES), max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": "Mozilla/5.0"})
+    return session
+
+session = make_session()
+
+class Page(NamedTuple):
+    url: str
+    html: str
+    changed: bool   # 前回取り込んだ内容から変わったか
+    meta: dict      # 取り込み成功後に保存するキャッシュ情報
+
+def _cache_paths(url):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(FETCH_CACHE_DIR, f"{key}.json"), os.path.join(FETCH_CACHE_DIR, f"{key}.html")
+
+def _load_cache(url):
+    meta_path, body_path = _cache_paths(url)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, encoding='utf-8') as f:
+            return meta, f.read()
+    except (OSError, ValueError):
+        return {}, None
+
+# 取り込み (解析・DB書き込み) が成功してから呼ぶ。途中で失敗した場合は次回また取り込み直す
+def save_page_cache(page):
+    if page is None or not page.changed:
+        return
+    meta_path, body_path = _cache_paths(page.url)
+    os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+    with open(body_path, 'w', encoding='utf-8') as f:
+        f.write(page.html)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(page.meta, f, ensure_ascii=False)
+
+# 条件付きGET: 前回の ETag / Last-Modified を送り、304 か本文ハッシュ一致なら「変化なし」
+def fetch(url, use_cache=True):
+    print(f"アクセス中: {url} ...")
+    cached_meta, cached_body = _load_cache(url) if use_cache else ({}, None)
+    headers = {}
+    if cached_body is not None:
+        if cached_meta.get('etag'):
+            headers['If-None-Match'] = cached_meta['etag']
+        if cached_meta.get('last_modified'):
+            headers['If-Modified-Since'] = cached_meta['last_modified']
+    try:
+        res = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        if res.status_code == 304 and cached_body is not None:
+            return Page(url, cached_body, False, cached_meta)
+        res.raise_for_status()
+        # charset 指定がないと requests は ISO-8859-1 とみなし「▲」などが化けるため UTF-8 で読む
+        if 'charset' not in res.headers.get('Content-Type', '').lower():
+            res.encoding = 'utf-8'
+        html = res.text
+    except Exception as e:
+        print(f"エラー: {e}")
+        return None
+    digest = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    meta = {
+        'url': url, 'sha256': digest,
+        'etag': res.headers.get('ETag'), 'last_modified': res.headers.get('Last-Modified'),
+    }
+    changed = cached_body is None or cached_meta.get('sha256') != digest
+    if not changed and meta != cached_meta:
+        # 本文は同じでもヘッダーが変わった場合はキャッシュ情報だけ更新する
+        save_page_cache(Page(url, html, True, meta))
+    return Page(url, html, changed, meta)
+
+# parse_only を渡すと必要な部分だけ木を作る (ページ全体の木を作るより速い)
+def make_soup(html, parse_only=None):
+    return BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+
+# 各段階の所要時間を記録する
+@contextmanager
+def stage(name, timings):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+# 1. チーム順位 (points ページで取れなければトップページから)
+def parse_team_ranking(points_html, top_html=None):
+    data = []
+    rows = make_soup(points_html, SoupStrainer('tr')).find_all('tr') if points_html else []
+    for row in rows:
+        try:
+            rank_elem = row.find(class_=re.compile('ranking-no'))
+            if not rank_elem:
+                cols = row.find_all('td')
+                if len(cols) >= 3:
+                    try:
+                        rank = int(cols[0].get_text(strip=True))
+                        name = cols[1].get_text(strip=True)
+                        point = float(cols[2].get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
+                        data.append({"rank": rank, "team": name, "point": point})
+                        continue
+                    except: pass
+            rank = row.find(class_=re.compile('rank-number')).get_text(strip=True)
+            name = row.find(class_='team-name').get_text(strip=True)
+            point = float(row.find(class_='point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
+            data.append({"rank": int(rank), "team": name, "point": point})
+        except: continue
+    
+    if not data and top_html:
+        teams = make_soup(top_html, SoupStrainer('div', class_='p-ranking__team-item')).find_all('div', class_='p-ranking__team-item')
+        for team in teams:
+            try:
+                rank = team.find(class_=re.compile('p-ranking__rank-number')).get_text(strip=True)
+                name = team.find(class_='p-ranking__team-name').get_text(strip=True)
+                point = float(team.find(class_='p-ranking__current-point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
+                data.append({"rank": int(rank), "team": name, "point": point})
+            except: continue
+    return data
+
+def write_team_ranking(conn, data, season, table='team_ranking'):
+    if data:
+        replace_rows(conn, table, data, season)
+        print(f"✅ チーム順位: {len(data)} チーム")
+
+# 2. 試合結果 (★差分取り込み版)
+# 取り込み済みの最新日付 (high-water mark) より前の日はスキップし、
+# 新しい・変わった行だけを1トランザクションで upsert する
+# ページには月/日しか書かれていないので、season を渡せばそのシーズンの日付に、
+# なければページ全体の月/日からシーズンを決めて (precompute.infer_season)、その年の日付にする
+def parse_games(html, high_water=None, season=None, today=None):
+    if not html: return []
+    # 一番重い c-modal2 / p-gamesResult__* の走査は、モーダル部分だけの木に対して行う
+    soup = make_soup(html, SoupStrainer('div', class_='c-modal2'))
+
+    all_games = []
+    # 日付は "10/14(火)" か "2025/10/14(火)"。年が書かれていればそれを使い、無ければシーズンから補う
+    modals = []
+    for modal in soup.find_all('div', class_='c-modal2'):
+        try:
+            date_text = modal.find('div', class_='p-gamesResult__date').get_text(strip=True)
+            parts = [int(x) for x in date_text.split('(')[0].split('/')]
+            year, month, day = parts if len(parts) == 3 else (None, *parts)
+            modals.append((modal, year, month, day))
+        except: continue
+    if not season and any(year is None for _, year, _, _ in modals):
+        season = precompute.infer_season([(m, d) for _, year, m, d in modals if year is None], today or datetime.date.today())
+
+    for modal, year, month, day in modals:
+        try:
+            date_str = f"{year}-{month:02d}-{day:02d}" if year else precompute.season_date(season, month, day)
+
+            # 最新日付の当日分は途中までしか入っていない可能性があるので取り込み直す
+            if high_water and date_str < high_water:
+                continue
+
+            columns = modal.find_all('div', class_='p-gamesResult__column')
+            table_no = {}
+            
+            for col in columns:
+                game_num = col.find('div', class_='p-gamesResult__number').get_text(strip=True)
+                # 同じ日・同じ回数でも別卓なら区別できるよう、卓番号も含めてIDを作る
+                no = table_no[game_num] = table_no.get(game_num, -1) + 1
+                current_match_id = make_match_id(date_str, game_num, no)
+                rank_items = col.find_all('div', class_='p-gamesResult__rank-item')
+                
+                for item in rank_items:
+                    rank = item.find('div', class_='p-gamesResult__rank-badge').get_text(strip=True)
+                    player = item.find('div', class_='p-gamesResult__name').get_text(strip=True).replace(" ", "").replace("　", "")
+                    point = float(item.find('div', class_='p-gamesResult__point').get_text(strip=True).replace('pt', '').replace('▲', '-').replace(',', ''))
+                    
+                    all_games.append({
+                        "match_id": current_match_id,
+                        "date": date_str, 
+                        "game_count": game_num, 
+                        "rank": int(rank), 
+                        "player": player, 
+                        "point": point,
+                        "season": precompute.season_of(date_str),
+                    })
+        except: continue
+    return all_games
+
+def write_games(conn, all_games, high_water=None):
+    if all_games:
+        changed = upsert_games(conn, all_games)
+        print(f"✅ 試合結果: {len(all_games)} 件を確認、{changed} 件を更新 (取り込み済み: {high_water or 'なし'} 以降)")
+    else:
+        print(f"✅ 試合結果: 新しい試合なし (取り込み済み: {high_water or 'なし'})")
+
+def upsert_games(conn, games, table='games'):
+    before = conn.total_changes
+    conn.executemany(f"""
+        INSERT INTO {table} (match_id, date, game_count, rank, player, point, season)
+        VALUES (:match_id, :date, :game_count, :rank, :player, :point, :season)
+        ON CONFLICT(match_id, player) DO UPDATE SET
+            date = excluded.date, game_count = excluded.game_count,
+            rank = excluded.rank, point = excluded.point, season = excluded.season
+        WHERE {table}.date IS NOT excluded.date OR {table}.game_count IS NOT excluded.game_count
+           OR {table}.rank IS NOT excluded.rank OR {table}.point IS NOT excluded.point
+    """, games)
+    # 取り込み直した卓から、サイト側で消えた行 (選手名の訂正など) を除く
+    seats = {}
+    for g in games:
+        seats.setdefault(g['match_id'], []).append(g['player'])
+    for match_id, players in seats.items():
+        placeholders = ", ".join(["?"] * len(players))
+        conn.execute(f"DELETE FROM {table} WHERE match_id = ? AND player NOT IN ({placeholders})", [match_id, *players])
+    changed = conn.total_changes - before
+    if table != 'games':
+        return changed
+    latest = max(g['date'] for g in games)
+    current = get_meta(conn, 'games_high_water')
+    if not current or latest > current:
+        set_meta(conn, 'games_high_water', latest)
+    return changed
+
+# 3. 個人成績
+def parse_stats(html):
+    if not html: return []
+    soup = make_soup(html, SoupStrainer('section', class_='p-stats__team'))
+    data_list = []
+    sections = soup.find_all('section', class_='p-stats__team')
+    for section in sections:
+        try:
+            team_name = section.find('h2', class_='p-stats__teamName').get_text(strip=True)
+            table = section.find('table', class_='p-stats__table')
+            if not table: continue
+            rows = table.find_all('tr')
+            players = [p.get_text(strip=True).replace(" ", "").replace("　", "") for p in rows[0].find_all('th')[1:]]
+            player_stats = {p: {'team': team_name, 'player': p} for p in players}
+            key_map = {'試合数': 'matches', '総局数': 'total_hands', 'ポイント': 'points', '平着': 'avg_rank', '1位': 'rank_1_count', '2位': 'rank_2_count', '3位': 'rank_3_count', '4位': 'rank_4_count', 'トップ率': 'top_rate', '連対率': 'rentai_rate', 'ラス回避率': 'last_avoid_rate', 'ベストスコア': 'best_score', '平均打点': 'avg_score', '副露率': 'furo_rate', 'リーチ率': 'riichi_rate', 'アガリ率': 'agari_rate', '放銃率': 'hoju_rate', '放銃平均打点': 'hoju_avg_score'}
+            for row in rows[1:]:
+                header = row.find('th').get_text(strip=True)
+                if header in key_map:
+                    db_key = key_map[header]
+                    cols = row.find_all('td')
+                    for i, col in enumerate(cols):
+                        if i < len(players):
+                            val = col.get_text(strip=True)
+                            try: val = float(val) if '.' in val else int(val)
+                            except: pass
+                            player_stats[players[i]][db_key] = val
+            data_list.extend(player_stats.values())
+        except: continue
+    return data_list
+
+def write_stats(conn, data_list, season, table='stats'):
+    if data_list:
+        replace_rows(conn, table, data_list, season)
+        print(f"✅ 個人スタッツ: {len(data_list)} 名")
+
+# 4. 直接対決マトリクス (過去のシーズンも含めた全試合から、全ペアの対戦成績を事前集計)
+def build_head_to_head(conn):
+    try:
+        rows = conn.execute("SELECT match_id, date, game_count, rank, player, point FROM games_all").fetchall()
+    except sqlite3.OperationalError:
+        print("⚠️ 直接対決: games テーブルなし")
+        return
+    matrix = precompute.build_head_to_head(rows)
+    conn.execute("DELETE FROM head_to_head")
+    conn.executemany("INSERT INTO head_to_head VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", precompute.head_to_head_rows(matrix))
+    print(f"✅ 直接対決: {len(matrix)} 組")
+
+# 5. 累積ポイント推移 (今シーズンの選手別・チーム別。チームは stats の所属で集計)
+def _write_point_series(conn):
+    rows = conn.execute("SELECT date, player, point FROM games").fetchall()
+    player_team = dict(conn.execute("SELECT player, team FROM stats").fetchall())
+    series = precompute.build_point_series(rows, player_team)
+    conn.execute("DELETE FROM point_series")
+    conn.executemany("INSERT INTO point_series VALUES (?, ?, ?, ?, ?)", precompute.point_series_rows(series))
+    return series
+
+def build_point_series(conn):
+    series = _write_point_series(conn)
+    print(f"✅ ポイント推移: 選手 {sum(1 for k in series if k[0] == 'player')} / チーム {sum(1 for k in series if k[0] == 'team')}")
+
+# 6. 調子・シーズン別成績 (過去のシーズンも含めた全試合から一括で集計)
+def _write_player_form(conn):
+    rows = conn.execute("SELECT date, game_count, player, rank, point FROM games_all").fetchall()
+    form, season = precompute.build_player_form(rows)
+    for table, df in (("player_form", form), ("player_season", season)):
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT INTO {table} VALUES ({', '.join(['?'] * len(df.columns))})", df.astype(object).values.tolist()
+        )
+    return form, season
+
+def build_player_form(conn):
+    form, season = _write_player_form(conn)
+    print(f"✅ 調子・シーズン別成績: 選手 {len(form)} / {season['season'].nunique()} シーズン")
+
+def rebuild_derived(conn):
+    build_head_to_head(conn)
+    build_point_series(conn)
+    build_player_form(conn)
+
+# ==========================================
+# ★ 更新処理の本体 ★
+# ==========================================
+# 取得 (全ページ並列) → 解析 (ワーカースレッドで並列) → 書き込み (1接続で順番に) の3段階
+# 書き込みと派生データの再計算は1トランザクションにまとめ、コミットの瞬間に一斉に切り替わるようにする
+# (WALモードなので、その間も main.py の読み取りは止まらず、更新前の内容を一貫して読める)
+def run_update(conn, full=False):
+    timings = {}
+    with stage("migrate", timings):
+        migrate(conn)
+    high_water = None if full else get_meta(conn, 'games_high_water')
+
+    def fetch_page(name):
+        return fetch(BASE_URL + PAGES[name], use_cache=not full)
+
+    with stage("fetch", timings):
+        names = [name for name in PAGES if name not in FALLBACK_PAGES]
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            pages = dict(zip(names, pool.map(fetch_page, names)))
+        # points が取れなかった、または前回 points から順位が取れなかった場合だけトップページも見る
+        if pages["points"] is None or get_meta(conn, 'ranking_source') == 'top':
+            pages["top"] = fetch_page("top")
+
+    def html_if_changed(*names):
+        fetched = [pages[n] for n in names if pages.get(n) is not None]
+        if not fetched or not any(p.changed for p in fetched):
+            return None
+        return [pages[n].html if pages.get(n) else None for n in names]
+
+    ranking_src = html_if_changed("points", "top")
+    games_src = html_if_changed("games")
+    stats_src = html_if_changed("stats")
+    for name, src in (("チーム順位", ranking_src), ("試合結果", games_src), ("個人スタッツ", stats_src)):
+        if src is None:
+            print(f"⏭ {name}: 前回から変化なし")
+    if ranking_src is None and games_src is None and stats_src is None:
+        print("⏱ 処理時間: " + " / ".join(f"{name} {sec:.2f}s" for name, sec in timings.items()))
+        return timings
+
+    with stage("parse", timings):
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            f_ranking = pool.submit(parse_team_ranking, ranking_src[0]) if ranking_src else None
+            f_games = pool.submit(parse_games, games_src[0], high_water) if games_src else None
+            f_stats = pool.submit(parse_stats, stats_src[0]) if stats_src else None
+            ranking = f_ranking.result() if f_ranking else None
+            games = f_games.result() if f_games else None
+            stats = f_stats.result() if f_stats else None
+
+    # points から順位が取れなければ、そのときだけトップページから取る (次回もトップページを見る)
+    ranking_source = 'points'
+    if ranking == []:
+        ranking_source = 'top'
+        with stage("fallback", timings):
+            if "top" not in pages:
+                pages["top"] = fetch_page("top")
+            ranking = parse_team_ranking(None, pages["top"].html) if pages["top"] else []
+
+    # 試合結果の日付から今のシーズンを決める (順位・スタッツのページには年が書かれていない)
+    season = max((g['season'] for g in games or ()), default=None) or get_meta(conn, 'current_season') or today_season()
+
+    with transaction(conn):
+        with stage("write", timings):
+            # 新しいシーズンが始まっていれば、前シーズンの分を *_archive へ移してから書き込む
+            season = roll_season(conn, season)
+            if ranking is not None:
+                write_team_ranking(conn, ranking, season)
+                set_meta(conn, 'ranking_source', ranking_source)
+            if games is not None:
+                write_games(conn, [g for g in games if g['season'] == season], high_water)
+            if stats is not None:
+                write_stats(conn, stats, season)
+
+        if games is not None:
+            with stage("head_to_head", timings):
+                build_head_to_head(conn)
+        if games is not None or stats is not None:
+            with stage("point_series", timings):
+                build_point_series(conn)
+        if games is not None:
+            with stage("player_form", timings):
+                build_player_form(conn)
+        # main.py の /debug で表示する (同じトランザクションでコミットされる)
+        set_meta(conn, 'last_update', time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+
+    # 統計情報を更新して、クエリプランナーがインデックスを選べるようにする
+    with stage("analyze", timings):
+        conn.execute("ANALYZE")
+        # WALの内容を本体へ書き戻す (読み手を待たずにできる分だけ)
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # DBへの反映が終わってから取得キャッシュを確定する
+    for page in pages.values():
+        save_page_cache(page)
+
+    print("⏱ 処理時間: " + " / ".join(f"{name} {sec:.2f}s" for name, sec in timings.items()))
+    return timings
+
+# ==========================================
+# ★ 過去シーズンの取り込み ★
+# ==========================================
+# 保存しておいた公式サイトのページ (DIR/games/index.html, DIR/stats/index.html, DIR/points/index.html, DIR/index.html)
+# をシーズンを指定して取り込む。何シーズン分でも1トランザクションで書き、派生データと ANALYZE は最後に1回だけ行う
+def load_saved_pages(directory):
+    pages = {}
+    for name, path in PAGES.items():
+        file_path = os.path.join(directory, path.strip("/"), "index.html")
+        if os.path.exists(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                pages[name] = f.read()
+    return pages
+
+# 今シーズンより前なら *_archive へ直接、今シーズン以降なら (必要ならシーズンを切り替えて) 今のテーブルへ書く
+def import_season(conn, season, games=(), stats=(), ranking=()):
+    current = get_meta(conn, 'current_season') or today_season()
+    suffix = "_archive" if season < current else ""
+    if not suffix:
+        roll_season(conn, season)
+    if games:
+        upsert_games(conn, games, 'games' + suffix)
+    write_stats(conn, stats, season, 'stats' + suffix)
+    write_team_ranking(conn, ranking, season, 'team_ranking' + suffix)
+    print(f"📥 {season}: 試合 {len(games)} 行 / スタッツ {len(stats)} 名 / 順位 {len(ranking)} チーム → {'保管' if suffix else '今シーズン'}")
+
+# archives: [(シーズン, 保存したページのディレクトリ), ...]
+def import_archives(conn, archives):
+    migrate(conn)
+    with transaction(conn):
+        for season, directory in archives:
+            pages = load_saved_pages(directory)
+            games = parse_games(pages.get("games"), season=season)
+            stats = parse_stats(pages.get("stats"))
+            ranking = parse_team_ranking(pages.get("points"), pages.get("top"))
+            import_season(conn, season, games, stats, ranking)
+        rebuild_derived(conn)
+        set_meta(conn, 'last_update', time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+SEASON_RE = re.compile(r"^\d{4}-\d{2}$")
+
+# ==========================================
+# ★ よくある質問の事前計算 ★
+# ==========================================
+# 更新が終わったら、起動中の main.py に /chat/batch (precompute) でよくある質問を答えさせておく。
+# 回答は新しいデータのバージョンで保存され、次の更新まで /chat で即答される。
+# python update_db.py --precompute http://127.0.0.1:8000
+# 質問は MLEAGUE_PRECOMPUTE_QUESTIONS のファイル (1行1問) があればそれを、なければ下の一覧を使う
+PRECOMPUTE_QUESTIONS = [
+    "最新の試合結果",
+    "チーム順位",
+    "個人ランキング",
+    "トップ率が高い選手は？",
+    "放銃率が低い選手は？",
+    "平均打点が高い選手は？",
+]
+PRECOMPUTE_TIMEOUT = (5, 600)  # (接続, 読み込み) 秒。LLMの解説を含むので長めに待つ
+
+def load_precompute_questions(path=os.getenv("MLEAGUE_PRECOMPUTE_QUESTIONS")):
+    if not path:
+        return PRECOMPUTE_QUESTIONS
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+# 失敗してもDBの更新は済んでいるので、警告だけ出して終える
+def precompute_answers(server_url, questions=None, commentary=False):
+    questions = questions or load_precompute_questions()
+    started = time.perf_counter()
+    try:
+        res = requests.post(
+            f"{server_url.rstrip('/')}/chat/batch",
+            json={"messages": questions, "commentary": commentary, "precompute": True},
+            timeout=PRECOMPUTE_TIMEOUT,
+        )
+        res.raise_for_status()
+    except requests.RequestException as e:
+        print(f"⚠️ 回答の事前計算に失敗しました: {e}")
+        return None
+    results = res.json()["results"]
+    failed = [q for q, r in zip(questions, results) if r["reply"].startswith(("エラー", "【エラー】"))]
+    print(f"🧠 回答の事前計算: {len(questions) - len(failed)}/{len(questions)} 件 ({time.perf_counter() - started:.2f}s)")
+    for question in failed:
+        print(f"⚠️ 事前計算できなかった質問: {question}")
+    return results
+
+if __name__ == "__main__":
+    precompute_url = None
+    if "--precompute" in sys.argv:
+        # python update_db.py --precompute http://127.0.0.1:8000 (起動中のサーバーのURL)
+        i = sys.argv.index("--precompute")
+        if i + 1 >= len(sys.argv) or sys.argv[i + 1].startswith("--"):
+            sys.exit("使い方: python update_db.py [--full] --precompute http://127.0.0.1:8000")
+        precompute_url = sys.argv[i + 1]
+        del sys.argv[i:i + 2]
+
+    conn = connect(DB_NAME)
+    if "--import" in sys.argv:
+        # python update_db.py --import 2023-24 保存先DIR [2022-23 保存先DIR ...]
+        args = sys.argv[sys.argv.index("--import") + 1:]
+        archives = list(zip(args[::2], args[1::2]))
+        if not archives or len(args) % 2 or not all(SEASON_RE.match(season) for season, _ in archives):
+            sys.exit("使い方: python update_db.py --import 2023-24 DIR [2022-23 DIR ...]")
+        print("--- 過去シーズンの取り込み開始 ---")
+        import_archives(conn, archives)
+    else:
+        print("--- ID付きデータ更新開始 ---")
+        run_update(conn, full="--full" in sys.argv)
+    conn.close()
+    if precompute_url:
+        precompute_answers(precompute_url)
+    print("--- 完了 ---")